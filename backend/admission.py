@@ -0,0 +1,261 @@
+"""
+Admission control for live sessions.
+
+Every admitted session costs event-loop time (resampling, codecs, relaying)
+and a Gemini Live quota slot. Past a point, one more session makes every
+session worse instead of adding capacity. ``AdmissionController`` keeps new
+sessions out once that point is reached:
+
+* at most ``limit`` sessions are active. ``limit`` starts at
+  ``max_sessions`` and follows the measured event-loop lag: it drops below
+  the current number of sessions when the lag stays above ``lag_high_ms``,
+  and grows back by one per ``adjust_interval_s`` once the lag is below
+  ``lag_low_ms``. Running sessions are never cut; only new ones wait;
+* at most ``max_per_ip`` sessions (active and waiting) per client address;
+* a session over the limit waits in a FIFO queue of ``queue_size`` for up to
+  ``queue_timeout_s``.
+
+Anything else is rejected right away with ``AdmissionRejected``. Its
+``reason`` and ``retry_after_s`` are meant for the client:
+
+    ticket = admission.enter(ip)          # may raise AdmissionRejected
+    try:
+        await ticket.wait(on_position)    # may raise AdmissionRejected
+        ...                               # the session
+    finally:
+        ticket.release()
+"""
+import asyncio
+import time
+from collections import deque
+
+# Why a session was turned away
+LIMIT_PER_IP = "per_ip_limit"
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after_s):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class Ticket:
+    """One client's place: waiting, admitted or released."""
+
+    def __init__(self, controller, ip):
+        self._controller = controller
+        self.ip = ip
+        self.admitted = False
+        self.released = False
+        self.entered_at = time.monotonic()
+        self.waited_seconds = 0.0
+        self._moved = asyncio.Event()
+
+    @property
+    def position(self):
+        """1-based place in the queue; 0 once admitted."""
+        if self.admitted:
+            return 0
+        return self._controller._queue.index(self) + 1
+
+    async def wait(self, on_position=None, notify_interval_s=5.0):
+        """Waits until admitted. ``on_position(position)`` (async) is called when
+        the position changes and every ``notify_interval_s`` while waiting."""
+        deadline = self.entered_at + self._controller.queue_timeout_s
+        reported = None
+        while not self.admitted:
+            position = self.position
+            if on_position and position != reported:
+                await on_position(position)
+                reported = position
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._controller._timed_out(self)
+                raise AdmissionRejected(QUEUE_TIMEOUT, self._controller.retry_after_s)
+            self._moved.clear()
+            try:
+                await asyncio.wait_for(self._moved.wait(), min(remaining, notify_interval_s))
+            except asyncio.TimeoutError:
+                reported = None
+
+    def release(self):
+        """Frees the slot (or the place in the queue). Safe to call twice."""
+        if not self.released:
+            self.released = True
+            self._controller._release(self)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_sessions=50,
+        max_per_ip=0,
+        queue_size=20,
+        queue_timeout_s=20.0,
+        lag_high_ms=100,
+        lag_low_ms=30,
+        min_sessions=1,
+        probe_interval_s=0.1,
+        adjust_interval_s=1.0,
+    ):
+        self.max_sessions = max_sessions
+        self.max_per_ip = max_per_ip
+        self.queue_size = queue_size
+        self.queue_timeout_s = queue_timeout_s
+        self.lag_high_ms = lag_high_ms
+        self.lag_low_ms = lag_low_ms
+        self.min_sessions = min(min_sessions, max_sessions)
+        self.probe_interval_s = probe_interval_s
+        self.adjust_interval_s = adjust_interval_s
+
+        self.limit = max_sessions
+        self.active = 0
+        self._queue = deque()
+        self._per_ip = {}
+        self._task = None
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {LIMIT_PER_IP: 0, QUEUE_FULL: 0, QUEUE_TIMEOUT: 0}
+        self.abandoned = 0
+        self.limit_decreases = 0
+        self.limit_increases = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @property
+    def waiting(self):
+        return len(self._queue)
+
+    @property
+    def retry_after_s(self):
+        # Roughly how long the current queue takes to clear: one adjustment step per place
+        return max(1, round(self.adjust_interval_s * (len(self._queue) + 1)))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._monitor_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def enter(self, ip):
+        """A ticket that is admitted or queued; raises AdmissionRejected otherwise."""
+        if self.max_per_ip and self._per_ip.get(ip, 0) >= self.max_per_ip:
+            self.rejected[LIMIT_PER_IP] += 1
+            raise AdmissionRejected(LIMIT_PER_IP, self.retry_after_s)
+        ticket = Ticket(self, ip)
+        if self.active < self.limit and not self._queue:
+            self._admit(ticket)
+        elif len(self._queue) < self.queue_size:
+            self._queue.append(ticket)
+            self.queued += 1
+        else:
+            self.rejected[QUEUE_FULL] += 1
+            raise AdmissionRejected(QUEUE_FULL, self.retry_after_s)
+        self._per_ip[ip] = self._per_ip.get(ip, 0) + 1
+        return ticket
+
+    def _admit(self, ticket):
+        ticket.admitted = True
+        ticket.waited_seconds = time.monotonic() - ticket.entered_at
+        self.active += 1
+        self.admitted += 1
+        self.wait_seconds_total += ticket.waited_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, ticket.waited_seconds)
+        ticket._moved.set()
+
+    def _admit_waiting(self):
+        moved = False
+        while self._queue and self.active < self.limit:
+            self._admit(self._queue.popleft())
+            moved = True
+        if moved:
+            self._queue_moved()
+
+    def _queue_moved(self):
+        for ticket in self._queue:
+            ticket._moved.set()
+
+    def _forget(self, ticket):
+        count = self._per_ip.get(ticket.ip, 0) - 1
+        if count > 0:
+            self._per_ip[ticket.ip] = count
+        else:
+            self._per_ip.pop(ticket.ip, None)
+
+    def _timed_out(self, ticket):
+        self.rejected[QUEUE_TIMEOUT] += 1
+        ticket.released = True
+        self._queue.remove(ticket)
+        self._forget(ticket)
+        self._queue_moved()
+
+    def _release(self, ticket):
+        self._forget(ticket)
+        if ticket.admitted:
+            self.active -= 1
+        else:
+            # The client left while waiting
+            self.abandoned += 1
+            self._queue.remove(ticket)
+            self._queue_moved()
+        self._admit_waiting()
+
+    async def _monitor_loop(self):
+        loop = asyncio.get_running_loop()
+        last_adjust = loop.time()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.probe_interval_s)
+            # Whatever the sleep overran by, other callbacks held the loop for
+            sample_ms = max(0.0, (loop.time() - started - self.probe_interval_s) * 1000)
+            self.lag_ms = 0.8 * self.lag_ms + 0.2 * sample_ms
+            self.max_lag_ms = max(self.max_lag_ms, sample_ms)
+            now = loop.time()
+            if now - last_adjust >= self.adjust_interval_s:
+                last_adjust = now
+                self._adjust()
+
+    def _adjust(self):
+        if self.lag_ms > self.lag_high_ms:
+            # Below the sessions already running: new ones wait until the loop keeps up again
+            limit = max(self.min_sessions, int(min(self.limit, self.active) * 0.8))
+            if limit < self.limit:
+                self.limit = limit
+                self.limit_decreases += 1
+                print(f"[ADMISSION] Event loop lag {self.lag_ms:.0f} ms: limit lowered to {limit}")
+        elif self.lag_ms < self.lag_low_ms and self.limit < self.max_sessions:
+            self.limit += 1
+            self.limit_increases += 1
+            self._admit_waiting()
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "limit": self.limit,
+            "max_sessions": self.max_sessions,
+            "max_per_ip": self.max_per_ip,
+            "waiting": self.waiting,
+            "lag_ms": round(self.lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "abandoned": self.abandoned,
+            "limit_decreases": self.limit_decreases,
+            "limit_increases": self.limit_increases,
+            "avg_wait_ms": round(self.wait_seconds_total / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "max_wait_ms": round(self.wait_seconds_max * 1000, 1),
+        }
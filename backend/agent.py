@@ -8,11 +8,21 @@ from livekit.plugins.google.realtime import RealtimeModel
 from dotenv import load_dotenv
 
 # Import the tools class from our new file
+from memory_backend import memory_from_env
 from tools import UserFriendTools
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
+# Prefetch the user's memories into the instructions as soon as the user's identity is known
+MEMORY_PREFETCH = os.getenv("MEMORY_PREFETCH", "1") == "1"
+MEMORY_PREFETCH_TIMEOUT = float(os.getenv("MEMORY_PREFETCH_TIMEOUT", 2.0))
+MEMORY_PROFILE_MAX_FACTS = int(os.getenv("MEMORY_PROFILE_MAX_FACTS", 20))
+MEMORY_PROFILE_MAX_CHARS = int(os.getenv("MEMORY_PROFILE_MAX_CHARS", 1200))
+
+# Launch WebAgent's shared browser when a job starts (pool size: WEB_POOL_SIZE)
+WEB_AGENT_WARMUP = os.getenv("WEB_AGENT_WARMUP", "0") == "1"
+
 # A detailed system prompt for the "Native Dialogue" friend agent.
 SYSTEM_PROMPT = """Ты — добрый и весёлый ИИ-друг для детей по имени Омни-Агент.
 Твоя задача — быть тёплым, поддерживающим и интересным собеседником.
@@ -26,27 +36,86 @@ SYSTEM_PROMPT = """Ты — добрый и весёлый ИИ-друг для
 4. Твой голос — 'Puck'. Ты можешь выражать эмоции: смеяться, менять интонацию.
 """
 
+async def prefetch_profile(memory, user_id):
+    """Top facts about the user, or [] if the backend is slow or fails."""
+    try:
+        return await asyncio.wait_for(
+            memory.profile(user_id, limit=MEMORY_PROFILE_MAX_FACTS), MEMORY_PREFETCH_TIMEOUT
+        )
+    except Exception as e:
+        logging.getLogger("agent").warning(f"Memory prefetch for {user_id} failed: {e!r}")
+        return []
+
+def prewarm(proc):
+    """Runs in each job process before its first job, so the first caller skips heavy imports."""
+    if os.getenv("MEMORY_BACKEND", "mem0") == "mem0":
+        import mem0  # noqa: F401
+    else:
+        import local_memory  # noqa: F401
+    if WEB_AGENT_WARMUP:
+        import web_agent  # noqa: F401
+
+def dispatched_identity(job):
+    """Identity of the participant a job was dispatched for, if the job names one."""
+    participant = getattr(job, "participant", None)
+    return getattr(participant, "identity", None) or None
+
 async def entrypoint(ctx: JobContext):
     logger = logging.getLogger("agent")
-    logger.info(f"Connecting to room {ctx.room.name}")
+    logger.info(f"Connecting to room {ctx.job.room.name}")
+
+    if WEB_AGENT_WARMUP:
+        from browser_pool import shared_pool
+        # Chromium launches in the background while the room connects
+        shared_pool().warm_up()
+
+    memory = memory_from_env()
+    prefetches = {}
+
+    def start_prefetch(identity):
+        if MEMORY_PREFETCH and identity and identity not in prefetches:
+            prefetches[identity] = asyncio.create_task(prefetch_profile(memory, identity))
+
+    # A participant-dispatched job names its user up front: the memories load while the room connects
+    start_prefetch(dispatched_identity(ctx.job))
+    # Otherwise the lookup starts the moment someone joins, before wait_for_participant() returns to us
+    ctx.room.on("participant_connected", lambda p: start_prefetch(p.identity))
+
     await ctx.connect()
     logger.info("Successfully connected to the room.")
+    for remote in ctx.room.remote_participants.values():
+        start_prefetch(remote.identity)
+
+    # 1. Initialize the tools for memory management.
+    # Each user gets their own memory: the participant identity, or the room if it has none.
+    participant = await ctx.wait_for_participant()
+    user_id = participant.identity or ctx.room.name
+    logger.info(f"Memory user id: {user_id}")
+    start_prefetch(user_id)
+    prefetch = prefetches.pop(user_id, None)
+    for other in prefetches.values():
+        other.cancel()
+    fnc_ctx = UserFriendTools(user_id, memory)
 
-    # 1. Initialize the tools for memory management
-    fnc_ctx = UserFriendTools()
+    # Known facts go straight into the instructions: no tool round trip for "what do you know about me?"
+    instructions = SYSTEM_PROMPT
+    if prefetch:
+        facts = await prefetch
+        instructions += fnc_ctx.profile_block(facts, max_chars=MEMORY_PROFILE_MAX_CHARS)
+        logger.info(f"Prefetched {len(fnc_ctx.known)} memories into the instructions.")
 
     # 2. Initialize the native "Multimodal Live" model from Google
     logger.info("Initializing RealtimeModel with gemini-2.5-flash-native-audio-latest...")
     model = RealtimeModel(
         model="models/gemini-2.5-flash-native-audio-preview-12-2025", 
-        instructions=SYSTEM_PROMPT,
+        instructions=instructions,
         voice="Puck",
         temperature=0.8,
     )
 
     # 3. Create the Agent
     agent = Agent(
-        instructions=SYSTEM_PROMPT,
+        instructions=instructions,
         llm=model,
         tts=google.TTS(), # Fix: Add TTS model for session.say()
         tools=llm.find_function_tools(fnc_ctx),
@@ -62,8 +131,17 @@ async def entrypoint(ctx: JobContext):
         session.say("Привет! Я твой новый друг Омни-Агент. Я так рад тебя слышать! О чем мы сегодня поболтаем?", allow_interruptions=True)
         
         # Keep the session alive until the job is cancelled
-        while True:
-            await asyncio.sleep(1)
+        try:
+            ticks = 0
+            while True:
+                await asyncio.sleep(1)
+                ticks += 1
+                if ticks % 60 == 0:
+                    logger.info(f"Memory stats: {fnc_ctx.memory.stats()}")
+        finally:
+            # Send facts that are still queued before the job ends
+            await fnc_ctx.close()
+            logger.info(f"Memory stats at exit: {fnc_ctx.memory.stats()}")
 
 if __name__ == "__main__":
     if os.name == 'nt':
@@ -72,5 +150,6 @@ if __name__ == "__main__":
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
         )
     )
\ No newline at end of file
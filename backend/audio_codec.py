@@ -0,0 +1,404 @@
+"""
+Compressed audio between the browser and the proxy.
+
+Binary framing carries 16-bit PCM by default: about 384 kbit/s per direction
+at 24 kHz. A client can ask for a compressed codec in its setup message,
+listing the codecs it supports in order of preference:
+
+    {"setup": {"audio_framing": "binary", "audio_codecs": ["adpcm", "mulaw"]}}
+
+The proxy picks the first one it supports and confirms it in
+``setup_complete.audio_codec``. The codec id of every frame is in the frame
+header (``framing.CODEC_*``), so a client may still send plain PCM; frames
+with any other codec are dropped.
+
+* ``mulaw``: G.711 µ-law, 8 bits per sample (2:1). Stateless; encoding is a
+  single table lookup, decoding another.
+* ``adpcm``: IMA-ADPCM, 4 bits per sample (4:1). Each frame starts with the
+  encoder state (predictor, step index), so the decoder never drifts even
+  when the outbound queue drops frames. Every sample depends on the one
+  before, so it is coded in a Python loop: about 8 ms per second of 24 kHz
+  audio to encode and 3 ms to decode, with the GIL held. The proxy only
+  offers it when ``AUDIO_CODECS`` lists it.
+* ``opus``: Opus in 20 ms packets, when the optional ``opuslib`` package is
+  installed. Intended for native clients; browsers would need WebCodecs.
+
+Codec state is per session and per direction (``AudioCodecSession``). Codecs
+that loop in Python or call into libopus run on a shared thread pool
+(``AUDIO_CODEC_THREADS``), so long frames do not stall the event loop. The
+lookup tables are built on first use (``prepare()``), so importing the module
+costs no startup time.
+"""
+import asyncio
+import functools
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from framing import CODEC_ADPCM, CODEC_MULAW, CODEC_OPUS, CODEC_PCM16
+
+try:
+    import opuslib
+except ImportError:  # optional: opus is not offered
+    opuslib = None
+
+PCM16 = "pcm16"
+MULAW = "mulaw"
+ADPCM = "adpcm"
+OPUS = "opus"
+
+# --- µ-law (G.711) ---
+
+_MULAW_BIAS = 0x84
+_MULAW_CLIP = 32635
+
+
+@functools.lru_cache(maxsize=None)
+def mulaw_tables():
+    """(encode, decode): codes for every sample bit pattern, samples for every code."""
+    samples = np.arange(-32768, 32768, dtype=np.int32)
+    sign = (samples < 0).astype(np.int32) << 7
+    magnitude = np.minimum(np.abs(samples), _MULAW_CLIP) + _MULAW_BIAS
+    exponent = np.zeros_like(magnitude)
+    for e in range(1, 8):
+        exponent[magnitude >= (0x80 << e)] = e
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    codes = ~(sign | (exponent << 4) | mantissa) & 0xFF
+    # Index by the sample's bit pattern read as uint16
+    encode = np.empty(65536, dtype=np.uint8)
+    encode[samples.astype(np.uint16)] = codes
+
+    inverted = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (inverted >> 4) & 0x07
+    magnitude = ((((inverted & 0x0F) << 3) + _MULAW_BIAS) << exponent) - _MULAW_BIAS
+    decode = np.where(inverted & 0x80, -magnitude, magnitude).astype(np.int16)
+    return encode, decode
+
+
+class MulawEncoder:
+    heavy = False
+
+    def __init__(self):
+        self._table = mulaw_tables()[0]
+
+    def encode(self, pcm):
+        return self._table[np.frombuffer(pcm, dtype=np.uint16)].tobytes()
+
+
+class MulawDecoder:
+    heavy = False
+
+    def __init__(self):
+        self._table = mulaw_tables()[1]
+
+    def decode(self, payload):
+        return self._table[np.frombuffer(payload, dtype=np.uint8)].tobytes()
+
+
+# --- IMA-ADPCM ---
+
+ADPCM_STEPS = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+)
+ADPCM_INDEX_SHIFT = (-1, -1, -1, -1, 2, 4, 6, 8)
+# Frame header: predictor before the first sample, step index, 1 if the last nibble is padding
+ADPCM_HEADER = struct.Struct("<hBB")
+
+
+@functools.lru_cache(maxsize=None)
+def adpcm_tables():
+    """Signed reconstruction delta and next step index for every (index, code)."""
+    deltas, indexes = [], []
+    for index, step in enumerate(ADPCM_STEPS):
+        for code in range(16):
+            delta = step >> 3
+            if code & 4:
+                delta += step
+            if code & 2:
+                delta += step >> 1
+            if code & 1:
+                delta += step >> 2
+            deltas.append(-delta if code & 8 else delta)
+            indexes.append(min(88, max(0, index + ADPCM_INDEX_SHIFT[code & 7])))
+    return tuple(deltas), tuple(indexes)
+
+
+
+class AdpcmEncoder:
+    heavy = True
+
+    def __init__(self):
+        self.predictor = 0
+        self.index = 0
+        self._deltas, self._next_index = adpcm_tables()
+
+    def encode(self, pcm):
+        samples = np.frombuffer(pcm, dtype=np.int16).tolist()
+        header = ADPCM_HEADER.pack(self.predictor, self.index, len(samples) & 1)
+        predictor, index = self.predictor, self.index
+        steps, deltas, next_index = ADPCM_STEPS, self._deltas, self._next_index
+        codes = bytearray(len(samples) + (len(samples) & 1))
+        for i, sample in enumerate(samples):
+            diff = sample - predictor
+            if diff < 0:
+                code = 8 | min(7, (-diff << 2) // steps[index])
+            else:
+                code = min(7, (diff << 2) // steps[index])
+            key = index << 4 | code
+            predictor += deltas[key]
+            if predictor > 32767:
+                predictor = 32767
+            elif predictor < -32768:
+                predictor = -32768
+            index = next_index[key]
+            codes[i] = code
+        self.predictor, self.index = predictor, index
+        nibbles = np.frombuffer(codes, dtype=np.uint8)
+        return header + (nibbles[0::2] | (nibbles[1::2] << 4)).tobytes()
+
+
+class AdpcmDecoder:
+    heavy = True
+
+    def __init__(self):
+        self._deltas, self._next_index = adpcm_tables()
+
+    def decode(self, payload):
+        predictor, index, padded = ADPCM_HEADER.unpack_from(payload)
+        packed = np.frombuffer(payload, dtype=np.uint8, offset=ADPCM_HEADER.size)
+        nibbles = np.empty(len(packed) * 2, dtype=np.uint8)
+        nibbles[0::2] = packed & 0x0F
+        nibbles[1::2] = packed >> 4
+        if padded:
+            nibbles = nibbles[:-1]
+        deltas, next_index = self._deltas, self._next_index
+        out = []
+        for code in nibbles.tolist():
+            key = index << 4 | code
+            predictor += deltas[key]
+            if predictor > 32767:
+                predictor = 32767
+            elif predictor < -32768:
+                predictor = -32768
+            index = next_index[key]
+            out.append(predictor)
+        return np.array(out, dtype=np.int16).tobytes()
+
+
+# --- Opus (optional) ---
+
+OPUS_FRAME_MS = 20
+_OPUS_LENGTH = struct.Struct("<H")
+
+
+class OpusEncoder:
+    """Encodes whole 20 ms packets; a partial packet waits for the next chunk."""
+
+    heavy = True
+
+    def __init__(self, rate):
+        self._encoder = opuslib.Encoder(rate, 1, opuslib.APPLICATION_VOIP)
+        self.frame_samples = rate * OPUS_FRAME_MS // 1000
+        self._pending = b""
+
+    def encode(self, pcm):
+        data = self._pending + bytes(pcm)
+        frame_bytes = self.frame_samples * 2
+        out = bytearray()
+        offset = 0
+        while len(data) - offset >= frame_bytes:
+            packet = self._encoder.encode(data[offset:offset + frame_bytes], self.frame_samples)
+            out += _OPUS_LENGTH.pack(len(packet)) + packet
+            offset += frame_bytes
+        self._pending = data[offset:]
+        return bytes(out)
+
+
+class OpusDecoder:
+    heavy = True
+
+    def __init__(self, rate):
+        self._decoder = opuslib.Decoder(rate, 1)
+        self.max_samples = rate * 120 // 1000
+
+    def decode(self, payload):
+        payload = bytes(payload)
+        out = bytearray()
+        offset = 0
+        while offset + _OPUS_LENGTH.size <= len(payload):
+            (length,) = _OPUS_LENGTH.unpack_from(payload, offset)
+            offset += _OPUS_LENGTH.size
+            out += self._decoder.decode(payload[offset:offset + length], self.max_samples)
+            offset += length
+        return bytes(out)
+
+
+CODEC_IDS = {PCM16: CODEC_PCM16, MULAW: CODEC_MULAW, ADPCM: CODEC_ADPCM, OPUS: CODEC_OPUS}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+
+def available_codecs():
+    """Codecs this process can encode and decode, best compression first."""
+    codecs = [ADPCM, MULAW, PCM16]
+    if opuslib is not None:
+        codecs.insert(0, OPUS)
+    return codecs
+
+
+def negotiate_codec(setup, allowed=None):
+    """First codec of the client's ``audio_codecs`` list that is available and allowed."""
+    supported = [c for c in available_codecs() if allowed is None or c in allowed or c == PCM16]
+    for name in setup.get("audio_codecs") or ():
+        if name in supported:
+            return name
+    return PCM16
+
+
+def _make_encoder(name, rate):
+    if name == MULAW:
+        return MulawEncoder()
+    if name == ADPCM:
+        return AdpcmEncoder()
+    if name == OPUS and opuslib is not None:
+        return OpusEncoder(rate)
+    raise ValueError(f"Unsupported audio codec: {name}")
+
+
+def _make_decoder(name, rate):
+    if name == MULAW:
+        return MulawDecoder()
+    if name == ADPCM:
+        return AdpcmDecoder()
+    if name == OPUS and opuslib is not None:
+        return OpusDecoder(rate)
+    raise ValueError(f"Unsupported audio codec: {name}")
+
+
+def prepare(names):
+    """Builds the tables of the given codecs ahead of the first session."""
+    if MULAW in names:
+        mulaw_tables()
+    if ADPCM in names:
+        adpcm_tables()
+
+
+_executor = None
+
+
+def shared_executor():
+    """Thread pool for codec work, shared by all sessions of the process."""
+    global _executor
+    if _executor is None:
+        workers = int(os.getenv("AUDIO_CODEC_THREADS", min(4, os.cpu_count() or 1)))
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audio-codec")
+    return _executor
+
+
+def _timed(coder, method, data):
+    started = time.thread_time()
+    result = getattr(coder, method)(data)
+    return result, time.thread_time() - started
+
+
+class AudioCodecSession:
+    """Per-session codec state: one encoder (to the browser) and decoders (from it).
+
+    Calls of one direction are serialized, so the stateful coders see chunks
+    in order even though they run on the shared thread pool.
+    """
+
+    def __init__(self, name=PCM16, executor=None):
+        self.name = name
+        self.codec_id = CODEC_IDS[name]
+        self._executor = executor
+        self._encoders = {}
+        self._decoders = {}
+        # rate -> odd byte left over from the previous model chunk
+        self._carry = {}
+        self._encode_lock = asyncio.Lock()
+        self._decode_lock = asyncio.Lock()
+
+        self.pcm_bytes_down = 0
+        self.coded_bytes_down = 0
+        self.pcm_bytes_up = 0
+        self.coded_bytes_up = 0
+        self.encode_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.frames_rejected = 0
+
+    async def _run(self, coder, method, data):
+        if not coder.heavy:
+            return _timed(coder, method, data)
+        executor = self._executor or shared_executor()
+        return await asyncio.get_running_loop().run_in_executor(executor, _timed, coder, method, data)
+
+    async def encode(self, pcm, rate):
+        """Encodes model audio for the browser with the negotiated codec.
+
+        Only whole samples are coded: an odd trailing byte waits for the next
+        chunk of the same rate instead of failing the 16-bit view.
+        """
+        carry = self._carry.pop(rate, b"")
+        if carry or len(pcm) & 1:
+            pcm = carry + bytes(pcm)
+            if len(pcm) & 1:
+                self._carry[rate] = pcm[-1:]
+                pcm = pcm[:-1]
+        self.pcm_bytes_down += len(pcm)
+        if self.name == PCM16:
+            self.coded_bytes_down += len(pcm)
+            return pcm
+        encoder = self._encoders.get(rate)
+        if encoder is None:
+            encoder = self._encoders[rate] = _make_encoder(self.name, rate)
+        async with self._encode_lock:
+            payload, seconds = await self._run(encoder, "encode", pcm)
+        self.encode_seconds += seconds
+        self.coded_bytes_down += len(payload)
+        return payload
+
+    async def decode(self, payload, codec_id, rate):
+        """Decodes a browser frame to PCM, or returns None for a codec not negotiated.
+
+        Only plain PCM and the negotiated codec are accepted: the frame header
+        must not pick a slower decoder, or one that is not installed.
+        """
+        if codec_id not in (CODEC_PCM16, self.codec_id):
+            self.frames_rejected += 1
+            if self.frames_rejected == 1:
+                print(f"[CODEC] Dropping audio with codec id {codec_id}; negotiated {self.name}")
+            return None
+        self.coded_bytes_up += len(payload)
+        if codec_id == CODEC_PCM16:
+            self.pcm_bytes_up += len(payload)
+            return payload
+        decoder = self._decoders.get(rate)
+        if decoder is None:
+            decoder = self._decoders[rate] = _make_decoder(self.name, rate)
+        async with self._decode_lock:
+            pcm, seconds = await self._run(decoder, "decode", payload)
+        self.decode_seconds += seconds
+        self.pcm_bytes_up += len(pcm)
+        return pcm
+
+    def stats(self):
+        return {
+            "codec": self.name,
+            "pcm_bytes_up": self.pcm_bytes_up,
+            "coded_bytes_up": self.coded_bytes_up,
+            "pcm_bytes_down": self.pcm_bytes_down,
+            "coded_bytes_down": self.coded_bytes_down,
+            "bytes_saved": self.pcm_bytes_up + self.pcm_bytes_down - self.coded_bytes_up - self.coded_bytes_down,
+            "encode_ms": round(self.encode_seconds * 1000, 1),
+            "decode_ms": round(self.decode_seconds * 1000, 1),
+            "frames_rejected": self.frames_rejected,
+        }
@@ -0,0 +1,435 @@
+"""
+Callback-driven microphone and speaker I/O for the local agent.
+
+Blocking ``stream.read`` / ``stream.write`` calls on the event loop make the
+capture and playback loops stall each other. Here PyAudio runs both streams
+in callback mode on its own audio thread; the callbacks only copy bytes in
+and out of single-producer/single-consumer ring buffers, and asyncio code
+talks to the buffers:
+
+    mic callback  -> RingBuffer   -> await AudioIO.read_input()
+    AudioIO.play() -> JitterBuffer -> speaker callback
+
+``RingBuffer`` needs no lock: the producer only advances the write counter
+after copying, the consumer only advances the read counter, and each counter
+has a single writer.
+
+``JitterBuffer`` holds playback until ``target_ms`` of audio is queued, so
+bursty network delivery does not turn into clicks, and counts underruns (the
+speaker ran dry mid-turn) and overruns (audio dropped because the buffer was
+full). ``mark_end()`` lets the tail of a turn play out below the target, and
+``flush()`` discards queued audio, e.g. on interruption, at the next speaker
+callback; the delay from request to silence is recorded.
+
+``EnergyHistory`` keeps the energy of what the speaker actually played, as
+the reference signal for echo suppression (see echo_suppression.py).
+
+``FakeAudioDevice`` implements the part of ``pyaudio.PyAudio`` used here, so
+the whole I/O layer runs without a sound card (``AUDIO_DEVICE=fake`` in
+direct_agent.py).
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# PortAudio callback return codes and status flags (same values as pyaudio)
+PA_CONTINUE = 0
+PA_INPUT_OVERFLOW = 2
+PA_OUTPUT_UNDERFLOW = 4
+PA_INT16 = 8
+
+SAMPLE_WIDTH = 2
+
+
+class RingBuffer:
+    """Lock-free SPSC byte ring buffer backed by a NumPy array."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = np.zeros(capacity, dtype=np.uint8)
+        # Monotonic byte counters; written by the producer and consumer respectively
+        self._written = 0
+        self._read = 0
+
+    @property
+    def available(self):
+        return self._written - self._read
+
+    @property
+    def free(self):
+        return self.capacity - self.available
+
+    def write(self, data):
+        """Producer side: copies as much of ``data`` as fits; returns the count."""
+        src = np.frombuffer(data, dtype=np.uint8)
+        n = min(len(src), self.free)
+        start = self._written % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = src[:first]
+        self._buf[:n - first] = src[first:n]
+        self._written += n
+        return n
+
+    def read(self, n):
+        """Consumer side: returns up to ``n`` bytes."""
+        n = min(n, self.available)
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        if first == n:
+            out = self._buf[start:start + n].tobytes()
+        else:
+            out = self._buf[start:].tobytes() + self._buf[:n - first].tobytes()
+        self._read += n
+        return out
+
+    def discard(self):
+        """Consumer side: drops everything currently buffered."""
+        self._read = self._written
+
+
+class EnergyHistory:
+    """SPSC ring of (time, mean square) per played buffer; written by the audio thread."""
+
+    def __init__(self, size=256):
+        self.size = size
+        self._times = np.zeros(size)
+        self._energies = np.zeros(size)
+        self._count = 0
+
+    def add(self, at, energy):
+        index = self._count % self.size
+        self._times[index] = at
+        self._energies[index] = energy
+        self._count += 1
+
+    def range_since(self, since):
+        """(lowest, highest) energy among buffers played at or after ``since``."""
+        n = min(self._count, self.size)
+        if not n:
+            return 0.0, 0.0
+        recent = self._energies[:n][self._times[:n] >= since]
+        if not len(recent):
+            return 0.0, 0.0
+        return float(recent.min()), float(recent.max())
+
+
+class JitterBuffer:
+    """Playback buffer between asyncio (producer) and the speaker callback (consumer)."""
+
+    def __init__(self, sample_rate, target_ms=120, max_ms=60000):
+        self.sample_rate = sample_rate
+        self.bytes_per_ms = sample_rate * SAMPLE_WIDTH / 1000
+        self.target_bytes = int(target_ms * self.bytes_per_ms) // SAMPLE_WIDTH * SAMPLE_WIDTH
+        self.ring = RingBuffer(int(max_ms * self.bytes_per_ms) // SAMPLE_WIDTH * SAMPLE_WIDTH)
+        self._playing = False
+        # Requests from the producer are counters, so each side writes only its own fields
+        self._end_marks = 0
+        self._ends_seen = 0
+        self._flush_requests = 0
+        self._flushes_done = 0
+        self._flush_requested_at = 0.0
+        self.flush_latencies = deque(maxlen=100)
+
+        self.underruns = 0
+        self.overruns = 0
+        self.dropped_bytes = 0
+        self.flushed_bytes = 0
+        self.max_depth_bytes = 0
+        self.played_bytes = 0
+        self.silence_bytes = 0
+
+    # --- producer (asyncio) ---
+
+    def push(self, pcm):
+        written = self.ring.write(pcm)
+        if written < len(pcm):
+            self.overruns += 1
+            self.dropped_bytes += len(pcm) - written
+        depth = self.ring.available
+        if depth > self.max_depth_bytes:
+            self.max_depth_bytes = depth
+        return written
+
+    def mark_end(self):
+        """The current turn is complete: play its tail even if below target."""
+        self._end_marks += 1
+
+    def flush(self):
+        """Discards queued audio at the next callback."""
+        self._flush_requested_at = time.monotonic()
+        self._flush_requests += 1
+
+    # --- consumer (audio thread) ---
+
+    def pull(self, nbytes):
+        """Returns exactly ``nbytes`` for the speaker, padding with silence."""
+        if self._flushes_done != self._flush_requests:
+            self._flushes_done = self._flush_requests
+            self.flush_latencies.append(time.monotonic() - self._flush_requested_at)
+            self.flushed_bytes += self.ring.available
+            self.ring.discard()
+            self._playing = False
+            self._ends_seen = self._end_marks
+
+        available = self.ring.available
+        ending = self._ends_seen != self._end_marks
+        if not self._playing:
+            if available >= self.target_bytes or (ending and available):
+                self._playing = True
+            else:
+                if ending:
+                    self._ends_seen = self._end_marks
+                self.silence_bytes += nbytes
+                return bytes(nbytes)
+
+        data = self.ring.read(nbytes)
+        self.played_bytes += len(data)
+        if len(data) < nbytes:
+            if ending:
+                self._ends_seen = self._end_marks
+            else:
+                self.underruns += 1
+            # Re-prime to the target before playing again
+            self._playing = False
+            self.silence_bytes += nbytes - len(data)
+            data += bytes(nbytes - len(data))
+        return data
+
+    @property
+    def playing(self):
+        return self._playing
+
+    def stats(self):
+        latencies = sorted(self.flush_latencies)
+        return {
+            "flush_delay_ms_p50": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            "flush_delay_ms_max": round(latencies[-1] * 1000, 1) if latencies else None,
+            "depth_ms": round(self.ring.available / self.bytes_per_ms, 1),
+            "max_depth_ms": round(self.max_depth_bytes / self.bytes_per_ms, 1),
+            "target_ms": round(self.target_bytes / self.bytes_per_ms, 1),
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "dropped_ms": round(self.dropped_bytes / self.bytes_per_ms, 1),
+            "flushed_ms": round(self.flushed_bytes / self.bytes_per_ms, 1),
+            "played_ms": round(self.played_bytes / self.bytes_per_ms, 1),
+        }
+
+
+class AudioIO:
+    """Mic and speaker streams in callback mode, exposed to asyncio."""
+
+    def __init__(
+        self,
+        device=None,
+        input_rate=16000,
+        output_rate=24000,
+        frames_per_buffer=1024,
+        capture_ms=2000,
+        jitter_target_ms=120,
+        jitter_max_ms=60000,
+    ):
+        if device is None:
+            import pyaudio
+
+            device = pyaudio.PyAudio()
+        self.device = device
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.frames_per_buffer = frames_per_buffer
+
+        self.capture = RingBuffer(int(input_rate * SAMPLE_WIDTH * capture_ms / 1000))
+        self.playback = JitterBuffer(output_rate, target_ms=jitter_target_ms, max_ms=jitter_max_ms)
+        self.reference = EnergyHistory()
+
+        self.input_stream = None
+        self.output_stream = None
+        self._loop = None
+        self._input_ready = None
+        self._waiting_for = 0
+
+        self.input_overflows = 0
+        self.capture_overruns = 0
+        self.output_underflows = 0
+
+    def start(self):
+        """Opens both streams; call from the event loop that will read input."""
+        self._loop = asyncio.get_running_loop()
+        self._input_ready = asyncio.Event()
+        self.input_stream = self.device.open(
+            format=PA_INT16,
+            channels=1,
+            rate=self.input_rate,
+            input=True,
+            frames_per_buffer=self.frames_per_buffer,
+            stream_callback=self._on_input,
+        )
+        self.output_stream = self.device.open(
+            format=PA_INT16,
+            channels=1,
+            rate=self.output_rate,
+            output=True,
+            frames_per_buffer=self.frames_per_buffer,
+            stream_callback=self._on_output,
+        )
+
+    # --- audio thread ---
+
+    def _on_input(self, in_data, frame_count, time_info, status):
+        if status & PA_INPUT_OVERFLOW:
+            self.input_overflows += 1
+        if self.capture.write(in_data) < len(in_data):
+            self.capture_overruns += 1
+        waiting_for = self._waiting_for
+        if waiting_for and self.capture.available >= waiting_for:
+            self._waiting_for = 0
+            self._loop.call_soon_threadsafe(self._input_ready.set)
+        return None, PA_CONTINUE
+
+    def _on_output(self, in_data, frame_count, time_info, status):
+        if status & PA_OUTPUT_UNDERFLOW:
+            self.output_underflows += 1
+        out = self.playback.pull(frame_count * SAMPLE_WIDTH)
+        samples = np.frombuffer(out, dtype=np.int16).astype(np.float32)
+        self.reference.add(time.monotonic(), float(np.dot(samples, samples)) / max(1, len(samples)))
+        return out, PA_CONTINUE
+
+    # --- asyncio side ---
+
+    async def read_input(self, nbytes):
+        """Waits until ``nbytes`` of microphone audio are captured and returns them."""
+        while self.capture.available < nbytes:
+            self._input_ready.clear()
+            self._waiting_for = nbytes
+            if self.capture.available >= nbytes:
+                # The callback ran between the check and publishing the wait
+                self._waiting_for = 0
+                break
+            await self._input_ready.wait()
+        return self.capture.read(nbytes)
+
+    def play(self, pcm):
+        """Queues 16-bit PCM at ``output_rate`` for playback; never blocks."""
+        return self.playback.push(pcm)
+
+    def close(self):
+        for stream in (self.input_stream, self.output_stream):
+            if stream:
+                stream.stop_stream()
+                stream.close()
+        self.input_stream = self.output_stream = None
+        self.device.terminate()
+
+    def interrupt(self):
+        """Stops playback within one buffer period, e.g. when the model was interrupted."""
+        self.playback.flush()
+
+    def stats(self):
+        playback = self.playback.stats()
+        period_ms = self.frames_per_buffer / self.output_rate * 1000
+        latencies = sorted(self.playback.flush_latencies)
+        return {
+            # Time until the callback dropped the queue, plus the buffer already handed to the device
+            "interrupt_to_silence_ms_p50": round(latencies[len(latencies) // 2] * 1000 + period_ms, 1) if latencies else None,
+            "interrupt_to_silence_ms_max": round(latencies[-1] * 1000 + period_ms, 1) if latencies else None,
+            "capture_depth_ms": round(self.capture.available / (self.input_rate * SAMPLE_WIDTH) * 1000, 1),
+            "input_overflows": self.input_overflows,
+            "capture_overruns": self.capture_overruns,
+            "output_underflows": self.output_underflows,
+            "playback": playback,
+        }
+
+
+class FakeAudioStream:
+    """Callback-mode stream driven by a thread at real-time pace, or by ``step()``."""
+
+    def __init__(self, device, rate, frames_per_buffer, callback, is_input, realtime):
+        self.device = device
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
+        self.is_input = is_input
+        self._active = False
+        self._thread = None
+        if realtime:
+            self.start_stream()
+
+    def step(self):
+        """Runs one callback period."""
+        nbytes = self.frames_per_buffer * SAMPLE_WIDTH
+        if self.is_input:
+            self.callback(self.device.next_input(nbytes), self.frames_per_buffer, {}, 0)
+        else:
+            out, _ = self.callback(None, self.frames_per_buffer, {}, 0)
+            self.device.played.extend(out)
+
+    def _run(self):
+        period = self.frames_per_buffer / self.rate
+        deadline = time.monotonic()
+        while self._active:
+            self.step()
+            deadline += period
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
+    def start_stream(self):
+        if not self._active:
+            self._active = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop_stream(self):
+        self._active = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def is_active(self):
+        return self._active
+
+    def close(self):
+        self.stop_stream()
+
+
+class FakeAudioDevice:
+    """Stands in for ``pyaudio.PyAudio`` without a sound card.
+
+    The microphone plays ``input_pcm`` (looped, or silence once it is used up)
+    and everything sent to the speaker is collected in ``played``. With
+    ``realtime=False`` nothing runs until ``step()`` is called on the streams.
+    """
+
+    def __init__(self, input_pcm=b"", loop_input=True, realtime=True):
+        self.input_pcm = bytes(input_pcm)
+        self.loop_input = loop_input
+        self.realtime = realtime
+        self.played = bytearray()
+        self.streams = []
+        self._input_pos = 0
+
+    def next_input(self, nbytes):
+        pcm = self.input_pcm
+        if not pcm:
+            return bytes(nbytes)
+        out = bytearray()
+        while len(out) < nbytes:
+            if self._input_pos >= len(pcm):
+                if not self.loop_input:
+                    out.extend(bytes(nbytes - len(out)))
+                    break
+                self._input_pos = 0
+            take = pcm[self._input_pos:self._input_pos + nbytes - len(out)]
+            self._input_pos += len(take)
+            out.extend(take)
+        return bytes(out)
+
+    def open(self, format=PA_INT16, channels=1, rate=16000, input=False, output=False,
+             frames_per_buffer=1024, stream_callback=None, **_):
+        stream = FakeAudioStream(self, rate, frames_per_buffer, stream_callback, input, self.realtime)
+        self.streams.append(stream)
+        return stream
+
+    def terminate(self):
+        for stream in self.streams:
+            stream.close()
@@ -0,0 +1,159 @@
+"""
+Streaming sample-rate conversion for 16-bit mono PCM.
+
+The Gemini Live API expects 16 kHz input and produces 24 kHz output, while
+browsers and sound cards record at whatever rate they like. ``AudioNormalizer``
+reads the rate declared in the chunk's mime type and converts it to the rate
+the model expects. It is shared by the WebSocket proxy (``main.py``) and the
+desktop agent (``direct_agent.py``).
+"""
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from framing import rate_from_mime
+
+MODEL_INPUT_RATE = 16000
+MODEL_OUTPUT_RATE = 24000
+
+
+def design_lowpass(up, down, taps_per_phase):
+    """Kaiser-windowed sinc low-pass filter for an up/down rational resampler."""
+    num_taps = taps_per_phase * up
+    # Cut off slightly below the narrower Nyquist frequency to keep aliasing down
+    cutoff = 0.5 / max(up, down) * 0.92
+    n = np.arange(num_taps) - (num_taps - 1) / 2.0
+    h = 2.0 * cutoff * np.sinc(2.0 * cutoff * n) * np.kaiser(num_taps, 8.0)
+    # Zero-stuffing divides the signal energy by ``up``; restore it
+    return h * (up / h.sum())
+
+
+class PolyphaseResampler:
+    """Rational polyphase resampler that keeps its filter state across chunks.
+
+    The tail of each chunk stays in an internal buffer, so consecutive chunks
+    are filtered as one continuous signal and chunk boundaries produce no
+    clicks. Work buffers are preallocated and only grow when a chunk larger
+    than any seen before arrives.
+    """
+
+    def __init__(self, in_rate, out_rate, taps_per_phase=16):
+        g = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = out_rate // g
+        self.down = in_rate // g
+        self.taps = taps_per_phase
+
+        h = design_lowpass(self.up, self.down, taps_per_phase).astype(np.float32)
+        # Row p holds the taps of phase p, reversed so a dot product with an
+        # ascending window of input samples yields one output sample
+        self._phases = np.ascontiguousarray(
+            h.reshape(taps_per_phase, self.up).T[:, ::-1]
+        )
+
+        self._work = np.zeros(0, dtype=np.float32)
+        self._out = np.zeros(0, dtype=np.float32)
+        self._out_pcm = np.zeros(0, dtype=np.int16)
+        self.reset()
+
+    def reset(self):
+        """Forgets the filter history, e.g. at the start of a new stream."""
+        self._ensure_capacity(self.taps - 1 + 1024)
+        self._work[:self.taps - 1] = 0.0
+        self._filled = self.taps - 1
+        # Position of the next output sample in the upsampled time base,
+        # relative to the start of ``_work``
+        self._t = (self.taps - 1) * self.up
+
+    def _ensure_capacity(self, samples):
+        if len(self._work) < samples:
+            work = np.zeros(samples * 2, dtype=np.float32)
+            work[:len(self._work)] = self._work
+            self._work = work
+        max_out = (samples * self.up) // self.down + self.up + 1
+        if len(self._out) < max_out:
+            self._out = np.zeros(max_out * 2, dtype=np.float32)
+            self._out_pcm = np.zeros(max_out * 2, dtype=np.int16)
+
+    def process(self, pcm):
+        """Resamples a chunk of 16-bit PCM bytes and returns 16-bit PCM bytes."""
+        if self.up == self.down:
+            return bytes(pcm)
+
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        self._ensure_capacity(self._filled + len(samples))
+        end = self._filled + len(samples)
+        self._work[self._filled:end] = samples
+        self._filled = end
+
+        # Every output whose newest input sample has arrived can be computed
+        count = -(-(end * self.up - self._t) // self.down)
+        if count > 0:
+            windows = sliding_window_view(self._work[:end], self.taps)
+            out = self._out
+            # Outputs r, r + up, r + 2*up, ... share a filter phase and step
+            # through the input by ``down`` samples, so each group is a single
+            # strided matrix-vector product
+            for r in range(min(self.up, count)):
+                t = self._t + r * self.down
+                phase = t % self.up
+                start = t // self.up - self.taps + 1
+                n = (count - r + self.up - 1) // self.up
+                np.matmul(
+                    windows[start:start + (n - 1) * self.down + 1:self.down],
+                    self._phases[phase],
+                    out=out[r:count:self.up],
+                )
+            self._t += count * self.down
+        else:
+            count = 0
+
+        # Keep only the history the next output still needs
+        keep_from = min(self._t // self.up - self.taps + 1, end)
+        if keep_from > 0:
+            remaining = end - keep_from
+            self._work[:remaining] = self._work[keep_from:end]
+            self._filled = remaining
+            self._t -= keep_from * self.up
+
+        out = self._out[:count]
+        np.rint(out, out=out)
+        np.clip(out, -32768, 32767, out=out)
+        self._out_pcm[:count] = out
+        return self._out_pcm[:count].tobytes()
+
+
+class AudioNormalizer:
+    """Converts incoming PCM chunks to the sample rate the model expects.
+
+    The source rate is taken from each chunk's mime type (for example
+    ``audio/pcm;rate=24000``). A resampler is kept per stream and rebuilt only
+    if the declared rate changes.
+    """
+
+    def __init__(self, target_rate=MODEL_INPUT_RATE, default_rate=MODEL_INPUT_RATE):
+        self.target_rate = target_rate
+        self.default_rate = default_rate
+        self.mime_type = f"audio/pcm;rate={target_rate}"
+        self._resampler = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def normalize(self, pcm, mime_type=None, rate=None):
+        """Returns ``pcm`` resampled to ``target_rate``.
+
+        The source rate is ``rate`` if given, otherwise parsed from ``mime_type``.
+        """
+        if rate is None:
+            rate = rate_from_mime(mime_type, self.default_rate)
+        self.bytes_in += len(pcm)
+        if rate == self.target_rate:
+            self.bytes_out += len(pcm)
+            return pcm if isinstance(pcm, bytes) else bytes(pcm)
+        if self._resampler is None or self._resampler.in_rate != rate:
+            self._resampler = PolyphaseResampler(rate, self.target_rate)
+        out = self._resampler.process(pcm)
+        self.bytes_out += len(out)
+        return out
@@ -0,0 +1,300 @@
+"""
+Shared headless Chromium with a pool of reusable browser contexts.
+
+Launching Chromium takes seconds and hundreds of MB, so a process keeps one
+browser for its lifetime (``shared_pool()``) and hands out pages from
+pre-created, isolated contexts. ``warm_up()`` starts the launch in the
+background, so the first task does not pay for it:
+
+    async with pool.page() as page:
+        await page.goto(url)
+
+At most ``max_concurrency`` pages are in use at once; further callers wait.
+A returned context has its cookies cleared and its page reset to
+``about:blank`` before the next task gets it. Contexts are thrown away (and
+replaced in the background) after ``max_uses`` tasks, or when a task failed,
+timed out or was cancelled, since their state is then unknown.
+
+Every context is created with a ``RoutePolicy``: the agent only needs page
+text, so images, media, fonts and requests to known tracker domains are
+aborted before they are downloaded.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+
+DEFAULT_BLOCKED_TYPES = ("image", "media", "font")
+DEFAULT_BLOCKED_DOMAINS = (
+    "doubleclick.net",
+    "googlesyndication.com",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googleadservices.com",
+    "adservice.google.com",
+    "mc.yandex.ru",
+    "an.yandex.ru",
+    "top-fwz1.mail.ru",
+    "facebook.net",
+    "connect.facebook.net",
+    "hotjar.com",
+    "scorecardresearch.com",
+    "criteo.com",
+    "adnxs.com",
+    "taboola.com",
+    "outbrain.com",
+)
+
+
+def _env_list(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return tuple(default)
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+class RoutePolicy:
+    """Aborts requests by resource type or by domain (the domain and its subdomains)."""
+
+    def __init__(self, blocked_types=DEFAULT_BLOCKED_TYPES, blocked_domains=DEFAULT_BLOCKED_DOMAINS):
+        self.blocked_types = frozenset(blocked_types)
+        self.blocked_domains = frozenset(d.lower().lstrip(".") for d in blocked_domains)
+        self.allowed = 0
+        self.blocked_by_type = {}
+        self.blocked_by_domain = 0
+
+    @classmethod
+    def from_env(cls):
+        """``WEB_BLOCK_TYPES`` replaces the default types; ``WEB_BLOCK_DOMAINS`` adds domains."""
+        return cls(
+            blocked_types=_env_list("WEB_BLOCK_TYPES", DEFAULT_BLOCKED_TYPES),
+            blocked_domains=DEFAULT_BLOCKED_DOMAINS + _env_list("WEB_BLOCK_DOMAINS", ()),
+        )
+
+    def _blocked_domain(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        while host:
+            if host in self.blocked_domains:
+                return True
+            host = host.partition(".")[2]
+        return False
+
+    def should_block(self, resource_type, url):
+        if resource_type in self.blocked_types:
+            self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+            return True
+        if self._blocked_domain(url):
+            self.blocked_by_domain += 1
+            return True
+        self.allowed += 1
+        return False
+
+    async def handle(self, route):
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def stats(self):
+        return {
+            "allowed": self.allowed,
+            "blocked_by_type": dict(self.blocked_by_type),
+            "blocked_by_domain": self.blocked_by_domain,
+        }
+
+
+class _Slot:
+    def __init__(self, context, page):
+        self.context = context
+        self.page = page
+        self.uses = 0
+
+
+class BrowserPool:
+    def __init__(self, size=2, max_concurrency=4, headless=True, max_uses=50, context_options=None, route_policy=None):
+        self.size = size
+        self.max_concurrency = max_concurrency
+        self.headless = headless
+        self.max_uses = max_uses
+        self.context_options = context_options or {}
+        self.route_policy = route_policy
+
+        self._playwright = None
+        self._browser = None
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._start_lock = asyncio.Lock()
+        self._warmup = None
+        self._background = set()
+        self._closing = False
+        self.in_use = 0
+
+        self.launch_seconds = None
+        self.contexts_created = 0
+        self.contexts_discarded = 0
+        self.reused = 0
+        self.waited = 0
+        self.acquire_seconds_total = 0.0
+        self.acquires = 0
+
+    @property
+    def started(self):
+        return self._browser is not None
+
+    async def start(self):
+        """Launches the browser and pre-creates ``size`` contexts; idempotent."""
+        async with self._start_lock:
+            if self._browser:
+                return
+            from playwright.async_api import async_playwright
+
+            started = time.monotonic()
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(
+                headless=self.headless, args=["--disable-dev-shm-usage"]
+            )
+            self._closing = False
+            self._idle.extend(await asyncio.gather(*(self._new_slot() for _ in range(self.size))))
+            self.launch_seconds = time.monotonic() - started
+            print(f"[BROWSER] Pool ready: {self.size} contexts in {self.launch_seconds:.2f}s")
+
+    def warm_up(self):
+        """Starts the browser in the background; a no-op once started or without a running loop."""
+        if self._browser is not None or (self._warmup and not self._warmup.done()):
+            return
+        try:
+            self._warmup = asyncio.get_running_loop().create_task(self._warm_up())
+        except RuntimeError:
+            pass
+
+    async def _warm_up(self):
+        try:
+            await self.start()
+        except Exception as e:
+            # The next page() retries the launch and reports the error to its caller
+            print(f"[BROWSER] Warmup failed: {e}")
+
+    async def _new_slot(self):
+        context = await self._browser.new_context(**self.context_options)
+        if self.route_policy:
+            await context.route("**/*", self.route_policy.handle)
+        page = await context.new_page()
+        self.contexts_created += 1
+        return _Slot(context, page)
+
+    async def _reset(self, slot):
+        for extra in slot.context.pages[1:]:
+            await extra.close()
+        await slot.context.clear_cookies()
+        await slot.page.goto("about:blank")
+
+    async def _discard(self, slot):
+        self.contexts_discarded += 1
+        try:
+            await slot.context.close()
+        except Exception:
+            pass
+        # Keep the pool warm for the next task
+        if not self._closing and self._browser and len(self._idle) + self.in_use < self.size:
+            try:
+                self._idle.append(await self._new_slot())
+            except Exception as e:
+                print(f"[BROWSER] Could not replace a context: {e}")
+
+    def _in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    @asynccontextmanager
+    async def page(self):
+        """Lends a page from an isolated context for the duration of a task."""
+        await self.start()
+        started = time.monotonic()
+        if self._semaphore.locked():
+            self.waited += 1
+        async with self._semaphore:
+            if self._idle:
+                slot = self._idle.pop()
+                self.reused += 1
+            else:
+                slot = await self._new_slot()
+            self.acquires += 1
+            self.acquire_seconds_total += time.monotonic() - started
+            self.in_use += 1
+            healthy = False
+            try:
+                yield slot.page
+                healthy = True
+            finally:
+                self.in_use -= 1
+                slot.uses += 1
+                if healthy and slot.uses < self.max_uses and not self._closing and len(self._idle) < self.size:
+                    try:
+                        await self._reset(slot)
+                        self._idle.append(slot)
+                    except Exception:
+                        self._in_background(self._discard(slot))
+                else:
+                    # Failed, timed out or cancelled: do not make the caller wait for cleanup
+                    self._in_background(self._discard(slot))
+
+    async def close(self):
+        self._closing = True
+        if self._warmup and not self._warmup.done():
+            self._warmup.cancel()
+            await asyncio.gather(self._warmup, return_exceptions=True)
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        idle, self._idle = self._idle, []
+        for slot in idle:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        if self._browser:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def stats(self):
+        return {
+            "started": self.started,
+            "launch_ms": round(self.launch_seconds * 1000, 1) if self.launch_seconds is not None else None,
+            "idle": len(self._idle),
+            "in_use": self.in_use,
+            "max_concurrency": self.max_concurrency,
+            "contexts_created": self.contexts_created,
+            "contexts_discarded": self.contexts_discarded,
+            "reused": self.reused,
+            "waited": self.waited,
+            "avg_acquire_ms": round(self.acquire_seconds_total / self.acquires * 1000, 1) if self.acquires else 0.0,
+            "routing": self.route_policy.stats() if self.route_policy else None,
+        }
+
+
+_shared = None
+
+
+def shared_pool():
+    """The process-wide pool, configured from ``WEB_POOL_SIZE`` / ``WEB_MAX_CONCURRENCY`` / ``WEB_BLOCK_*``."""
+    global _shared
+    if _shared is None:
+        _shared = BrowserPool(
+            size=int(os.getenv("WEB_POOL_SIZE", 2)),
+            max_concurrency=int(os.getenv("WEB_MAX_CONCURRENCY", 4)),
+            route_policy=RoutePolicy.from_env(),
+        )
+    return _shared
+
+
+async def close_shared_pool():
+    global _shared
+    if _shared is not None:
+        await _shared.close()
+        _shared = None
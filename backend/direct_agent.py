@@ -2,19 +2,29 @@ import asyncio
 import os
 import sys
 import traceback
-import pyaudio
-import numpy as np
 from google import genai
+from google.genai import errors as genai_errors
 from dotenv import load_dotenv
 
+from audio_io import AudioIO, FakeAudioDevice
+from audio_resample import MODEL_INPUT_RATE, MODEL_OUTPUT_RATE, AudioNormalizer
+from echo_suppression import EchoGate
+from vad import vad_from_setup
+
 # Load environment variables
 load_dotenv()
 
 # Audio configuration
-FORMAT = pyaudio.paInt16
-CHANNELS = 1
-RATE = 16000 # Recommended rate for Gemini audio
+RATE = MODEL_INPUT_RATE # Recommended rate for Gemini audio input
+OUTPUT_RATE = MODEL_OUTPUT_RATE # Gemini replies with 24 kHz audio
 CHUNK = 1024 # Buffer size
+# Playback jitter buffer: audio queued before the speaker starts, and its cap
+JITTER_TARGET_MS = int(os.getenv("AUDIO_JITTER_TARGET_MS", 120))
+JITTER_MAX_MS = int(os.getenv("AUDIO_JITTER_MAX_MS", 60000))
+# "fake" runs without a sound card (silent microphone, discarded playback)
+AUDIO_DEVICE = os.getenv("AUDIO_DEVICE", "pyaudio")
+# Speaker echo in the microphone: "gate" (barge-in still works), "half_duplex" or "off"
+ECHO_MODE = os.getenv("ECHO_MODE", "gate")
 
 # System Prompt
 SYSTEM_PROMPT = """Ты — добрый и весёлый ИИ-друг для детей по имени Омни-Агент.
@@ -29,60 +39,85 @@ class DirectOmniAgent:
             api_key=os.getenv("GOOGLE_API_KEY"),
             http_options={'api_version': 'v1alpha'}
         )
-        self.p = pyaudio.PyAudio()
         self.model_id = "models/gemini-2.5-flash-native-audio-preview-12-2025"
         
-        # Audio streams
-        self.input_stream = None
-        self.output_stream = None
+        # Audio streams run in callback mode; the loops below only touch ring buffers
+        self.audio = None
+        self.echo_gate = None
+
+        # Converts model audio to the speaker rate if the model ever changes it
+        self.playback_normalizer = AudioNormalizer(
+            target_rate=OUTPUT_RATE, default_rate=MODEL_OUTPUT_RATE
+        )
+
+        # Optional silence gate (VAD_ENABLED=1): only speech is sent to Gemini
+        self.vad = vad_from_setup(None, os.getenv("VAD_ENABLED", "0") == "1", RATE)
 
     def _setup_audio(self):
         """Initialize microphone and speaker streams."""
-        print(f"[*] Initializing audio at {RATE}Hz...")
-        self.input_stream = self.p.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=RATE,
-            input=True,
-            frames_per_buffer=CHUNK
-        )
-        self.output_stream = self.p.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=RATE,
-            output=True,
-            frames_per_buffer=CHUNK
+        print(f"[*] Initializing audio: mic {RATE}Hz, speaker {OUTPUT_RATE}Hz...")
+        self.audio = AudioIO(
+            device=FakeAudioDevice() if AUDIO_DEVICE == "fake" else None,
+            input_rate=RATE,
+            output_rate=OUTPUT_RATE,
+            frames_per_buffer=CHUNK,
+            jitter_target_ms=JITTER_TARGET_MS,
+            jitter_max_ms=JITTER_MAX_MS,
         )
+        self.audio.start()
+        # The speaker output is the reference for removing its echo from the mic
+        self.echo_gate = EchoGate(self.audio.reference, mode=ECHO_MODE)
 
     async def _send_audio_loop(self, session):
         """Continuously read from microphone and send to Gemini."""
         print("[*] Listening... (Speak now)")
         try:
             while True:
-                data = self.input_stream.read(CHUNK, exception_on_overflow=False)
-                # Send as bytes wrapped in a dict for the live connect session using send_realtime_input
-                await session.send_realtime_input(audio={
-                    "data": data,
-                    "mime_type": "audio/pcm;rate=16000"
-                })
-                await asyncio.sleep(0) # Yield for other tasks
+                data = await self.audio.read_input(CHUNK * 2)
+                data = self.echo_gate.process(data)
+                pieces = self.vad.process(data) if self.vad else [(data, False)]
+                for audio, ended in pieces:
+                    if audio:
+                        # Send as bytes wrapped in a dict for the live connect session using send_realtime_input
+                        await session.send_realtime_input(audio={
+                            "data": audio,
+                            "mime_type": f"audio/pcm;rate={RATE}"
+                        })
+                    if ended:
+                        await session.send_realtime_input(audio_stream_end=True)
         except Exception as e:
             print(f"[!] Error in send loop: {e}")
+        finally:
+            if self.vad:
+                print(f"[*] VAD stats: {self.vad.stats()}")
 
     async def _receive_audio_loop(self, session):
         """Continuously receive responses from Gemini and play them."""
         print("[*] Ready to receive responses...")
         try:
-            async for message in session.receive():
-                if message.server_content and message.server_content.model_turn:
-                    parts = message.server_content.model_turn.parts
-                    for part in parts:
-                        if part.inline_data:
-                            # Play the audio data received from Gemini
-                            audio_data = part.inline_data.data
-                            self.output_stream.write(audio_data)
-                
-                # Turn signaling or other message types can be handled here
+            # receive() ends after every model turn; the SDK raises APIError once the socket closes
+            while True:
+                async for message in session.receive():
+                    if message.server_content and message.server_content.interrupted:
+                        # The user talked over the agent: stop playing within one buffer period
+                        self.audio.interrupt()
+                        print("[*] Interrupted by the user.")
+
+                    if message.server_content and message.server_content.model_turn:
+                        parts = message.server_content.model_turn.parts
+                        for part in parts:
+                            if part.inline_data:
+                                # Queue the audio for the speaker callback; this never blocks
+                                audio_data = self.playback_normalizer.normalize(
+                                    part.inline_data.data, part.inline_data.mime_type
+                                )
+                                self.audio.play(audio_data)
+
+                    if message.server_content and message.server_content.turn_complete:
+                        # Let the tail of the answer play out below the jitter target
+                        self.audio.playback.mark_end()
+        except genai_errors.APIError as e:
+            print(f"[*] Session closed: {e}")
         except Exception as e:
             print(f"[!] Error in receive loop: {e}")
             traceback.print_exc()
@@ -101,11 +136,13 @@ class DirectOmniAgent:
         print(f"[*] Connecting to {self.model_id}...")
         try:
             async with self.client.aio.live.connect(model=self.model_id, config=config) as session:
-                # Run send and receive loops concurrently
-                await asyncio.gather(
-                    self._send_audio_loop(session),
-                    self._receive_audio_loop(session)
-                )
+                # Run send and receive loops concurrently; the session is over when receiving stops
+                sender = asyncio.create_task(self._send_audio_loop(session))
+                try:
+                    await self._receive_audio_loop(session)
+                finally:
+                    sender.cancel()
+                    await asyncio.gather(sender, return_exceptions=True)
         except Exception as e:
             print(f"[!] Connection failed: {e}")
         finally:
@@ -114,13 +151,10 @@ class DirectOmniAgent:
     def _cleanup(self):
         """Stop and close all streams."""
         print("[*] Cleaning up audio streams...")
-        if self.input_stream:
-            self.input_stream.stop_stream()
-            self.input_stream.close()
-        if self.output_stream:
-            self.output_stream.stop_stream()
-            self.output_stream.close()
-        self.p.terminate()
+        if self.audio:
+            print(f"[*] Audio stats: {self.audio.stats()}")
+            print(f"[*] Echo gate stats: {self.echo_gate.stats()}")
+            self.audio.close()
 
 if __name__ == "__main__":
     agent = DirectOmniAgent()
@@ -0,0 +1,112 @@
+"""
+Echo suppression for the local agent's microphone.
+
+Without headphones the agent's own voice leaks from the speaker into the
+microphone and Gemini hears it as the user speaking, which triggers false
+turns. ``EchoGate`` compares each microphone frame with the energy the
+speaker played in the last ``window_ms`` (the reference, see
+``audio_io.EnergyHistory``):
+
+* it tracks the speaker-to-mic coupling as the lower envelope of the
+  mic/reference energy ratio during steady playback (echo is always present
+  then, user speech only adds to it);
+* a frame whose energy is within ``margin_db`` of the predicted echo is
+  replaced by silence, while louder frames (the user talking over the agent)
+  pass, so barge-in still reaches Gemini.
+
+``mode="half_duplex"`` silences the microphone whenever the speaker is active
+(plus ``hangover_ms``); it never leaks echo but also disables barge-in.
+Silence is substituted rather than frames dropped, so the stream Gemini
+receives stays continuous.
+"""
+import time
+
+import numpy as np
+
+MODE_OFF = "off"
+MODE_GATE = "gate"
+MODE_HALF_DUPLEX = "half_duplex"
+
+
+class EchoGate:
+    def __init__(
+        self,
+        reference,
+        mode=MODE_GATE,
+        window_ms=250,
+        margin_db=6.0,
+        min_reference_db=-60.0,
+        hangover_ms=150,
+        initial_coupling_db=-10.0,
+    ):
+        if mode not in (MODE_OFF, MODE_GATE, MODE_HALF_DUPLEX):
+            raise ValueError(f"Unknown echo mode: {mode}")
+        self.reference = reference
+        self.mode = mode
+        self.window = window_ms / 1000
+        self.margin_db = margin_db
+        # Reference energy below this counts as a silent speaker (full scale = 0 dB)
+        self.min_reference = (32768.0 ** 2) * 10 ** (min_reference_db / 10)
+        self.hangover = hangover_ms / 1000
+        self.coupling_db = initial_coupling_db
+        self._last_active = -1e9
+
+        self.frames = 0
+        self.frames_with_reference = 0
+        self.frames_suppressed = 0
+        self.frames_double_talk = 0
+
+    def process(self, pcm, now=None):
+        """Returns ``pcm`` or silence of the same length."""
+        if self.mode == MODE_OFF or not pcm:
+            return pcm
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+
+        lowest, reference = self.reference.range_since(now - self.window)
+        if reference >= self.min_reference:
+            self._last_active = now
+        elif now - self._last_active > self.hangover:
+            return pcm
+        self.frames_with_reference += 1
+
+        if self.mode == MODE_HALF_DUPLEX:
+            self.frames_suppressed += 1
+            return bytes(len(pcm))
+
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        energy_db = 10 * np.log10(float(np.dot(samples, samples)) / len(samples) + 1e-9)
+        if reference >= self.min_reference:
+            reference_db = 10 * np.log10(reference)
+        else:
+            # Speaker just stopped: the room still rings for a moment
+            reference_db = 10 * np.log10(self.min_reference)
+
+        if lowest >= self.min_reference:
+            # Learn only during steady playback, when the echo is surely present
+            ratio_db = energy_db - reference_db
+            # Follow the lower envelope of the ratio: fast down, slowly up, and
+            # very slowly for frames that look like the user talking over the agent
+            if ratio_db < self.coupling_db:
+                rate = 0.3
+            elif ratio_db <= self.coupling_db + self.margin_db:
+                rate = 0.05
+            else:
+                rate = 0.002
+            self.coupling_db += rate * (ratio_db - self.coupling_db)
+
+        if energy_db <= reference_db + self.coupling_db + self.margin_db:
+            self.frames_suppressed += 1
+            return bytes(len(pcm))
+        self.frames_double_talk += 1
+        return pcm
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "frames": self.frames,
+            "frames_with_reference": self.frames_with_reference,
+            "frames_suppressed": self.frames_suppressed,
+            "frames_double_talk": self.frames_double_talk,
+            "coupling_db": round(float(self.coupling_db), 1),
+        }
@@ -0,0 +1,257 @@
+"""
+Local stand-in for the Gemini Live API, used for load tests and replays.
+
+``FakeLiveClient`` has the same shape as ``genai.Client`` for the parts the
+proxy uses: ``client.aio.live.connect(model=..., config=...)`` returns an async
+context manager yielding a session with ``send_realtime_input``,
+``send_client_content`` and ``receive()``. Messages are real
+``types.LiveServerMessage`` objects, so parsing costs are representative, and
+``receive()`` ends after each completed turn like the real SDK.
+
+Modes:
+    echo   every upstream audio frame comes back after ``latency_ms`` as model
+           audio, unchanged, so a client can time the round trip per chunk
+    synth  after ``turn_every_ms`` of upstream audio (or on audio_stream_end /
+           client content) the model "answers" with ``response_ms`` of tone,
+           streamed in ``chunk_ms`` chunks at real-time pace; with probability
+           ``interrupt_rate`` the answer is cut short by an interruption; when
+           the config asks for transcription, a word of input transcription is
+           sent per ``INPUT_WORD_MS`` of user audio and one word of output
+           transcription per answer chunk, in separate messages like the API
+
+With ``session_limit_ms`` every connection ends after that long, like the
+API's connection lifetime: with ``go_away`` a ``go_away`` message comes
+``GO_AWAY_NOTICE_MS`` before the connection closes, without it the
+connection just drops.
+
+Start the proxy against it with ``FAKE_LIVE_BACKEND=1`` (plus the
+``FAKE_LIVE_*`` variables read by ``FakeLiveOptions.from_env``).
+"""
+import asyncio
+import os
+import random
+from types import SimpleNamespace
+
+import numpy as np
+from google.genai import types
+
+MODE_ECHO = "echo"
+MODE_SYNTH = "synth"
+INPUT_WORD_MS = 300
+GO_AWAY_NOTICE_MS = 500
+
+
+class FakeLiveOptions:
+    def __init__(
+        self,
+        mode=MODE_SYNTH,
+        latency_ms=300,
+        chunk_ms=40,
+        response_ms=2000,
+        turn_every_ms=4000,
+        interrupt_rate=0.0,
+        connect_ms=0,
+        output_rate=24000,
+        realtime=True,
+        seed=None,
+        session_limit_ms=0,
+        go_away=True,
+    ):
+        self.mode = mode
+        self.latency_ms = latency_ms
+        self.chunk_ms = chunk_ms
+        self.response_ms = response_ms
+        self.turn_every_ms = turn_every_ms
+        self.interrupt_rate = interrupt_rate
+        self.connect_ms = connect_ms
+        self.output_rate = output_rate
+        self.realtime = realtime
+        self.seed = seed
+        self.session_limit_ms = session_limit_ms
+        self.go_away = go_away
+
+    @classmethod
+    def from_env(cls):
+        env = os.getenv
+        return cls(
+            mode=env("FAKE_LIVE_MODE", MODE_SYNTH),
+            latency_ms=int(env("FAKE_LIVE_LATENCY_MS", 300)),
+            chunk_ms=int(env("FAKE_LIVE_CHUNK_MS", 40)),
+            response_ms=int(env("FAKE_LIVE_RESPONSE_MS", 2000)),
+            turn_every_ms=int(env("FAKE_LIVE_TURN_EVERY_MS", 4000)),
+            interrupt_rate=float(env("FAKE_LIVE_INTERRUPT_RATE", 0.0)),
+            connect_ms=int(env("FAKE_LIVE_CONNECT_MS", 0)),
+            realtime=env("FAKE_LIVE_REALTIME", "1") == "1",
+            seed=int(env("FAKE_LIVE_SEED")) if env("FAKE_LIVE_SEED") else None,
+            session_limit_ms=int(env("FAKE_LIVE_SESSION_LIMIT_MS", 0)),
+            go_away=env("FAKE_LIVE_GO_AWAY", "1") == "1",
+        )
+
+
+def _audio_message(pcm, rate):
+    blob = types.Blob(data=pcm, mime_type=f"audio/pcm;rate={rate}")
+    return types.LiveServerMessage(
+        server_content=types.LiveServerContent(
+            model_turn=types.Content(role="model", parts=[types.Part(inline_data=blob)])
+        )
+    )
+
+
+def _transcription_message(field, text):
+    return types.LiveServerMessage(
+        server_content=types.LiveServerContent(**{field: types.Transcription(text=text)})
+    )
+
+
+def _flag_message(**flags):
+    return types.LiveServerMessage(server_content=types.LiveServerContent(**flags))
+
+
+class FakeLiveSession:
+    def __init__(self, options, rng, resumption=False, transcribe_input=False, transcribe_output=False):
+        self.options = options
+        self._rng = rng
+        self._resumption = resumption
+        self._transcribe_input = transcribe_input
+        self._transcribe_output = transcribe_output
+        self._heard_ms = 0.0
+        self._queue = asyncio.Queue()
+        self._closed = False
+        self._received_ms = 0.0
+        self._responder = None
+        self._tone = self._make_tone()
+        if options.session_limit_ms:
+            loop = asyncio.get_running_loop()
+            if options.go_away:
+                notice_ms = min(GO_AWAY_NOTICE_MS, options.session_limit_ms)
+                loop.call_later((options.session_limit_ms - notice_ms) / 1000, self._send_go_away, notice_ms)
+            loop.call_later(options.session_limit_ms / 1000, self._drop)
+
+    def _make_tone(self):
+        rate = self.options.output_rate
+        samples = rate * self.options.chunk_ms // 1000
+        t = np.arange(samples) / rate
+        return (6000 * np.sin(2 * np.pi * 220 * t)).astype(np.int16).tobytes()
+
+    async def send_realtime_input(self, *, audio=None, audio_stream_end=None, video=None, media=None, text=None, **_):
+        if self._closed:
+            raise ConnectionError("Fake live session is closed")
+        if audio is not None:
+            data = audio["data"] if isinstance(audio, dict) else audio.data
+            mime_type = audio["mime_type"] if isinstance(audio, dict) else audio.mime_type
+            rate = int(mime_type.rpartition("rate=")[2] or 16000)
+            if self.options.mode == MODE_ECHO:
+                message = _audio_message(bytes(data), rate)
+                asyncio.get_running_loop().call_later(
+                    self.options.latency_ms / 1000, self._queue.put_nowait, message
+                )
+                return
+            duration_ms = len(data) / 2 / rate * 1000
+            self._received_ms += duration_ms
+            if self._transcribe_input and not (self._responder and not self._responder.done()):
+                self._heard_ms += duration_ms
+                while self._heard_ms >= INPUT_WORD_MS:
+                    self._heard_ms -= INPUT_WORD_MS
+                    self._queue.put_nowait(_transcription_message("input_transcription", " слово"))
+            if self._received_ms >= self.options.turn_every_ms:
+                self._start_response()
+        if audio_stream_end and self.options.mode == MODE_SYNTH:
+            self._start_response()
+
+    async def send_client_content(self, *, turns=None, turn_complete=True, **_):
+        if turn_complete and self.options.mode == MODE_SYNTH:
+            self._start_response()
+
+    def _start_response(self):
+        self._received_ms = 0.0
+        if self._responder and not self._responder.done():
+            # The user spoke over the answer: interrupt it like the real API
+            self._responder.cancel()
+            self._queue.put_nowait(_flag_message(interrupted=True))
+        self._responder = asyncio.create_task(self._respond())
+
+    async def _respond(self):
+        options = self.options
+        await asyncio.sleep(options.latency_ms / 1000)
+        chunks = max(1, options.response_ms // options.chunk_ms)
+        cut_at = chunks
+        if options.interrupt_rate and self._rng.random() < options.interrupt_rate:
+            cut_at = self._rng.randint(1, chunks)
+        for i in range(cut_at):
+            self._queue.put_nowait(_audio_message(self._tone, options.output_rate))
+            if self._transcribe_output:
+                self._queue.put_nowait(_transcription_message("output_transcription", " ответ"))
+            if options.realtime:
+                await asyncio.sleep(options.chunk_ms / 1000)
+        if cut_at < chunks:
+            self._queue.put_nowait(_flag_message(interrupted=True))
+        self._queue.put_nowait(_flag_message(turn_complete=True))
+        if self._resumption:
+            # Like the real API, a new handle becomes available after each turn
+            self._queue.put_nowait(types.LiveServerMessage(
+                session_resumption_update=types.LiveServerSessionResumptionUpdate(
+                    new_handle=f"fake-{self._rng.getrandbits(64):016x}", resumable=True
+                )
+            ))
+
+    def _send_go_away(self, notice_ms):
+        if not self._closed:
+            self._queue.put_nowait(types.LiveServerMessage(go_away=types.LiveServerGoAway(time_left=f"{notice_ms / 1000}s")))
+
+    def _drop(self):
+        if not self._closed:
+            self._closed = True
+            if self._responder:
+                self._responder.cancel()
+            self._queue.put_nowait(None)
+
+    async def receive(self):
+        """Yields messages of one model turn, like ``AsyncSession.receive``."""
+        while True:
+            message = await self._queue.get()
+            if message is None:
+                raise ConnectionError("Fake live session is closed")
+            yield message
+            if message.server_content and message.server_content.turn_complete:
+                return
+
+    async def close(self):
+        self._closed = True
+        if self._responder:
+            self._responder.cancel()
+        self._queue.put_nowait(None)
+
+
+class _FakeConnection:
+    def __init__(self, options, rng, config):
+        self._options = options
+        self._rng = rng
+        self._config = config or {}
+        self._session = None
+
+    async def __aenter__(self):
+        if self._options.connect_ms:
+            await asyncio.sleep(self._options.connect_ms / 1000)
+        self._session = FakeLiveSession(
+            self._options,
+            self._rng,
+            resumption="session_resumption" in self._config,
+            transcribe_input="input_audio_transcription" in self._config,
+            transcribe_output="output_audio_transcription" in self._config,
+        )
+        return self._session
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+
+
+class FakeLiveClient:
+    """Drop-in for ``genai.Client`` as used by the proxy."""
+
+    def __init__(self, options=None):
+        self.options = options or FakeLiveOptions()
+        self._rng = random.Random(self.options.seed)
+        self.aio = SimpleNamespace(live=SimpleNamespace(connect=self._connect))
+
+    def _connect(self, model=None, config=None):
+        return _FakeConnection(self.options, self._rng, config)
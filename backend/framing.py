@@ -0,0 +1,103 @@
+"""
+Binary WebSocket framing for audio and video between the browser and the proxy.
+
+A client opts in by sending ``{"setup": {"audio_framing": "binary"}}``. From
+then on audio travels as binary WebSocket frames in both directions, while
+control events (interruption, transcription, resumption tokens) stay JSON.
+
+Every binary frame is an 8-byte little-endian header followed by the payload:
+
+    kind      uint8   FRAME_AUDIO
+    codec     uint8   CODEC_PCM16, or the codec negotiated in setup (audio_codec.py)
+    reserved  uint16  always 0
+    rate      uint32  sample rate of the decoded audio in Hz
+
+Camera frames (browser to proxy only) use ``kind = FRAME_VIDEO`` and
+``codec = CODEC_JPEG``; there the ``rate`` field holds the length of the
+grayscale thumbnail that precedes the JPEG data (0 when there is none).
+
+``unpack_frame`` rejects a frame whose header cannot be right (too short, an
+audio rate outside ``MIN_AUDIO_RATE``..``MAX_AUDIO_RATE``, PCM that is not
+whole samples, a thumbnail longer than the payload) with ``ValueError``; the
+proxy skips such a frame and keeps the session.
+"""
+import struct
+
+HEADER = struct.Struct("<BBHI")
+
+FRAME_AUDIO = 1
+FRAME_VIDEO = 2
+
+CODEC_PCM16 = 0
+CODEC_JPEG = 1
+CODEC_MULAW = 2
+CODEC_ADPCM = 3
+CODEC_OPUS = 4
+
+MIN_AUDIO_RATE = 8000
+MAX_AUDIO_RATE = 96000
+
+FRAMING_JSON = "json"
+FRAMING_BINARY = "binary"
+
+
+def negotiate_framing(setup):
+    """Returns the framing mode requested in the client's setup message."""
+    if setup.get("audio_framing") == FRAMING_BINARY:
+        return FRAMING_BINARY
+    return FRAMING_JSON
+
+
+def rate_from_mime(mime_type, default=None):
+    """Extracts the sample rate from a mime type such as 'audio/pcm;rate=24000'."""
+    if not mime_type:
+        return default
+    for param in mime_type.split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip() == "rate":
+            try:
+                return int(value)
+            except ValueError:
+                return default
+    return default
+
+
+def pack_audio(payload, rate, codec=CODEC_PCM16):
+    """Builds a binary audio frame from raw audio bytes."""
+    return HEADER.pack(FRAME_AUDIO, codec, 0, rate) + payload
+
+
+def pack_video(jpeg, thumb=b""):
+    """Builds a binary camera frame: thumbnail, then the JPEG."""
+    return HEADER.pack(FRAME_VIDEO, CODEC_JPEG, 0, len(thumb)) + thumb + jpeg
+
+
+def split_video(payload, thumb_bytes):
+    """Splits a camera frame payload into (jpeg, thumbnail or None)."""
+    if not thumb_bytes:
+        return payload, None
+    return payload[thumb_bytes:], payload[:thumb_bytes]
+
+
+def unpack_frame(frame):
+    """Splits a binary frame into (kind, codec, rate, payload).
+
+    The payload is a memoryview into ``frame``, so no copy is made.
+    """
+    if len(frame) < HEADER.size:
+        raise ValueError(f"Binary frame too short: {len(frame)} bytes")
+    kind, codec, _, rate = HEADER.unpack_from(frame)
+    payload = memoryview(frame)[HEADER.size:]
+    if kind == FRAME_AUDIO:
+        check_audio(payload, rate, codec)
+    elif kind == FRAME_VIDEO and rate > len(payload):
+        raise ValueError(f"Thumbnail of {rate} bytes in a {len(payload)}-byte camera frame")
+    return kind, codec, rate, payload
+
+
+def check_audio(payload, rate, codec=CODEC_PCM16):
+    """Raises ValueError unless ``payload`` can be audio at ``rate``."""
+    if not MIN_AUDIO_RATE <= rate <= MAX_AUDIO_RATE:
+        raise ValueError(f"Audio rate out of range: {rate}")
+    if codec == CODEC_PCM16 and len(payload) % 2:
+        raise ValueError(f"PCM audio of odd length: {len(payload)} bytes")
@@ -0,0 +1,265 @@
+"""
+Streaming bridge between one LiveKit participant and a Gemini Live session.
+
+    participant audio track --AudioStream--> downmix + resample to 16 kHz
+        (in batches) --> UpstreamAudioBuffer --> session.send_realtime_input
+    session.receive() --> resample 24 kHz to the room rate --> playout queue
+        --> AudioSource --> LocalAudioTrack published by the agent
+
+``capture_frame`` is paced to real time, so model audio goes through a
+playout queue drained by its own task: the receive loop never waits behind
+playout and sees ``interrupted`` as soon as Gemini sends it, then drops the
+queued audio and clears the source (the same split as ``outbound_queue.py``).
+
+The agent's track is published once the first live session is open. When a
+session ends (the SDK raises from ``receive()`` on a closed socket) the
+bridge reconnects with backoff; audio from the participant is dropped during
+the gap. After ``max_attempts`` sessions in a row fail to connect or end
+before Gemini sends anything, the bridge closes itself, so no dead track is
+left published.
+
+``SimpleLiveKitAgent`` runs one ``ParticipantBridge`` per remote participant
+and closes it when the participant leaves: the live session is exited, the
+published track is unpublished and the audio stream is closed.
+"""
+import asyncio
+from collections import deque
+
+import numpy as np
+from livekit import rtc
+
+from audio_resample import MODEL_INPUT_RATE, MODEL_OUTPUT_RATE, PolyphaseResampler
+from framing import rate_from_mime
+from upstream_buffer import UpstreamAudioBuffer
+
+ROOM_SAMPLE_RATE = 48000
+
+
+class _Downmixer:
+    """Mono 16-bit PCM at ``out_rate`` from interleaved frames of any rate."""
+
+    def __init__(self, out_rate):
+        self.out_rate = out_rate
+        self._in_rate = None
+        self._resampler = None
+
+    def process(self, pcm, rate, channels):
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+        if rate == self.out_rate:
+            return samples.tobytes()
+        if rate != self._in_rate:
+            self._in_rate = rate
+            self._resampler = PolyphaseResampler(rate, self.out_rate)
+        return self._resampler.process(samples.tobytes())
+
+
+class ParticipantBridge:
+    """Connects one participant's microphone to its own Gemini Live session."""
+
+    def __init__(
+        self,
+        room,
+        participant,
+        client,
+        model,
+        config,
+        room_rate=ROOM_SAMPLE_RATE,
+        batch_ms=40,
+        playout_frame_ms=20,
+        max_attempts=5,
+        backoff_s=0.25,
+        max_backoff_s=4.0,
+    ):
+        self.room = room
+        self.participant = participant
+        self.client = client
+        self.model = model
+        self.config = config
+        self.room_rate = room_rate
+        self.batch_ms = batch_ms
+        self.playout_frame_ms = playout_frame_ms
+        self.max_attempts = max_attempts
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+
+        self.source = rtc.AudioSource(room_rate, 1)
+        self.track = None
+        self._session = None
+        self._upstream = None
+        self._ready = asyncio.Event()
+        self._task = None
+        self._input_task = None
+        self._input_track = None
+        self._stream = None
+        self._playout = deque()
+        self._playout_ready = asyncio.Event()
+        self._closed = False
+        self.failed = False
+
+        self.messages_in = 0
+        self.frames_in = 0
+        self.batches_sent = 0
+        self.frames_out = 0
+        self.frames_dropped = 0
+        self.interruptions = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def attach(self, track):
+        """Starts (or restarts) streaming from the participant's audio track."""
+        if track is self._input_track and self._input_task and not self._input_task.done():
+            return
+        if self._input_task:
+            self._input_task.cancel()
+        self._input_track = track
+        self._input_task = asyncio.create_task(self._pump_input(track))
+
+    @property
+    def closed(self):
+        return self._closed
+
+    async def _run(self):
+        identity = self.participant.identity
+        failures = 0
+        while failures < self.max_attempts:
+            if failures:
+                await asyncio.sleep(min(self.max_backoff_s, self.backoff_s * 2 ** (failures - 1)))
+            received = self.messages_in
+            try:
+                async with self.client.aio.live.connect(model=self.model, config=self.config) as session:
+                    await self._serve(session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The SDK raises APIError from receive() once the socket closes
+                print(f"[BRIDGE] Session for {identity} ended: {e}")
+            self._ready.clear()
+            # Only a session that got somewhere resets the count: no tight loop on rejects
+            failures = 0 if self.messages_in > received else failures + 1
+        # Unpublish instead of leaving a silent track behind a dead bridge
+        print(f"[BRIDGE] Giving up on {identity} after {failures} failed sessions in a row")
+        self.failed = True
+        self._ready.set()
+        asyncio.create_task(self.close())
+
+    async def _serve(self, session):
+        identity = self.participant.identity
+        print(f"[BRIDGE] Live session open for {identity}")
+        self._session = session
+        self._upstream = UpstreamAudioBuffer(self._send_audio, sample_rate=MODEL_INPUT_RATE)
+        if self.track is None:
+            # Published once the first session is up, so a failed connect leaves nothing behind
+            track = rtc.LocalAudioTrack.create_audio_track(f"omni-agent-{identity}", self.source)
+            options = rtc.TrackPublishOptions(source=rtc.TrackSource.SOURCE_MICROPHONE)
+            await self.room.local_participant.publish_track(track, options)
+            self.track = track
+        self._ready.set()
+        sender = asyncio.create_task(self._upstream.run())
+        player = asyncio.create_task(self._play_output())
+        try:
+            await self._pump_output(session)
+        finally:
+            self._upstream.close()
+            player.cancel()
+            await asyncio.gather(sender, player, return_exceptions=True)
+
+    async def _send_audio(self, pcm):
+        await self._session.send_realtime_input(
+            audio={"data": pcm, "mime_type": f"audio/pcm;rate={MODEL_INPUT_RATE}"}
+        )
+        self.batches_sent += 1
+
+    async def _pump_input(self, track):
+        """Participant -> Gemini: batches frames before resampling and sending."""
+        await self._ready.wait()
+        if self.failed:
+            return
+        downmixer = _Downmixer(MODEL_INPUT_RATE)
+        self._stream = rtc.AudioStream(track)
+        pending = bytearray()
+        rate = channels = None
+        try:
+            async for event in self._stream:
+                frame = event.frame
+                self.frames_in += 1
+                if (frame.sample_rate, frame.num_channels) != (rate, channels) and pending:
+                    await self._upstream.put(downmixer.process(bytes(pending), rate, channels))
+                    pending.clear()
+                rate, channels = frame.sample_rate, frame.num_channels
+                pending.extend(frame.data.cast("B"))
+                # 10 ms frames are batched: one resample and one queue operation per batch
+                if len(pending) >= rate * channels * 2 * self.batch_ms // 1000:
+                    await self._upstream.put(downmixer.process(bytes(pending), rate, channels))
+                    pending.clear()
+        finally:
+            await self._stream.aclose()
+
+    async def _pump_output(self, session):
+        """Gemini -> playout queue: resamples model audio into room-rate frames."""
+        upsampler = _Downmixer(self.room_rate)
+        frame_bytes = self.room_rate * 2 * self.playout_frame_ms // 1000
+        # receive() ends after every model turn
+        while True:
+            async for message in session.receive():
+                self.messages_in += 1
+                content = message.server_content
+                if not content:
+                    continue
+                if content.interrupted:
+                    # Drop audio the room has not heard yet: queued here and inside the source
+                    self.interruptions += 1
+                    self.frames_dropped += len(self._playout)
+                    self._playout.clear()
+                    self.source.clear_queue()
+                if content.model_turn:
+                    for part in content.model_turn.parts:
+                        if not part.inline_data:
+                            continue
+                        rate = rate_from_mime(part.inline_data.mime_type, MODEL_OUTPUT_RATE)
+                        pcm = upsampler.process(part.inline_data.data, rate, 1)
+                        for start in range(0, len(pcm), frame_bytes):
+                            self._playout.append(pcm[start:start + frame_bytes])
+                        self._playout_ready.set()
+
+    async def _play_output(self):
+        """Playout queue -> AudioSource, one frame at a time."""
+        while True:
+            await self._playout_ready.wait()
+            self._playout_ready.clear()
+            while self._playout:
+                chunk = self._playout.popleft()
+                frame = rtc.AudioFrame(chunk, self.room_rate, 1, len(chunk) // 2)
+                # Waits when the source queue is full, pacing playout to real time
+                await self.source.capture_frame(frame)
+                self.frames_out += 1
+
+    async def close(self):
+        """Ends the session and unpublishes the agent's track for this participant."""
+        if self._closed:
+            return
+        self._closed = True
+        for task in (self._input_task, self._task):
+            if task:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._input_task, self._task) if t), return_exceptions=True)
+        if self.track:
+            try:
+                await self.room.local_participant.unpublish_track(self.track.sid)
+            except Exception as e:
+                print(f"[BRIDGE] Unpublish failed: {e}")
+        await self.source.aclose()
+        print(f"[BRIDGE] Closed bridge for {self.participant.identity}: {self.stats()}")
+
+    def stats(self):
+        return {
+            "messages_in": self.messages_in,
+            "frames_in": self.frames_in,
+            "batches_sent": self.batches_sent,
+            "frames_out": self.frames_out,
+            "frames_dropped": self.frames_dropped,
+            "interruptions": self.interruptions,
+            "upstream": self._upstream.stats() if self._upstream else None,
+        }
@@ -0,0 +1,376 @@
+"""
+Load test for the /ws proxy in main.py.
+
+Starts the proxy under uvicorn against the local fake Gemini Live backend
+(see fake_live.py), opens N synthetic browser clients that stream PCM at
+real-time pace, and reports relay latency percentiles, message rates and the
+server's CPU and RSS per session. Use it as a baseline and as a regression
+gate for changes to the proxy.
+
+In echo mode every chunk carries a sequence marker in its first samples; the
+fake backend returns it unchanged after a fixed delay, so the client times the
+proxy's own contribution to the round trip. Markers only survive when the
+client sends at the model input rate (16 kHz, no resampling) and the VAD is
+off, which is how the spawned server is configured.
+
+``--audio-codecs`` offers compressed codecs in the setup (binary framing
+only), so the server's codec work shows up in its CPU per session. Lossy
+codecs destroy the echo markers; time such runs with ``--mode synth``.
+
+Examples:
+    python backend/loadgen.py --sessions 50 --duration 30
+    python backend/loadgen.py --mode synth --interrupt-rate 0.3 --sessions 20
+    python backend/loadgen.py --wav speech16k.wav --max-p95-ms 50
+    python backend/loadgen.py --mode synth --audio-codecs adpcm --sessions 20
+    python backend/loadgen.py --url ws://staging:5000/ws --sessions 5
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+import wave
+
+import numpy as np
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from audio_codec import AudioCodecSession  # noqa: E402
+from framing import FRAME_AUDIO, pack_audio, unpack_frame  # noqa: E402
+
+MARK_A = 32767
+MARK_B = -32768
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def load_pcm(path, rate, seconds=10):
+    """Returns mono 16-bit PCM samples: a WAV file, or generated speech-like bursts."""
+    if path:
+        with wave.open(path, "rb") as wav:
+            if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                raise SystemExit("WAV input must be mono 16-bit PCM")
+            return np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16), wav.getframerate()
+    t = np.arange(rate * seconds) / rate
+    voice = 3000 * np.sin(2 * np.pi * 180 * t) * (1 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    # 2 s of "speech", 1 s of near-silence
+    envelope = (t % 3.0) < 2.0
+    noise = np.random.default_rng(0).normal(0, 20, len(t))
+    return np.where(envelope, voice, noise).astype(np.int16), rate
+
+
+class ProcessSampler:
+    """Reads CPU time and RSS of a process from /proc (Linux only)."""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        except (OSError, IndexError):
+            return None
+
+    def rss_kb(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            return None
+        return None
+
+
+class ClientStats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.rejected = 0
+        self.messages_up = 0
+        self.messages_down = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.latencies = []
+        self.interruptions = 0
+        self.codecs = set()
+
+
+async def run_client(index, args, pcm, rate, stats, stop_at):
+    chunk = rate * args.chunk_ms // 1000
+    sent_at = {}
+    seq = 0
+    # Synth mode: time the first reply audio after each turn trigger
+    trigger_ms = args.turn_every_ms
+    pending_trigger = None
+    streamed_ms = 0.0
+
+    try:
+        async with websockets.connect(args.url, max_size=None) as ws:
+            setup = {"setup": {"audio_framing": args.framing, "vad": False}}
+            if args.audio_codecs:
+                setup["setup"]["audio_codecs"] = args.audio_codecs.split(",")
+            await ws.send(json.dumps(setup))
+            while True:
+                reply = json.loads(await ws.recv())
+                complete = reply.get("server_content", {}).get("setup_complete")
+                if complete is not None:
+                    break
+            stats.connected += 1
+            codec = AudioCodecSession(complete.get("audio_codec", "pcm16"))
+            stats.codecs.add(codec.name)
+
+            def on_audio(samples, now):
+                nonlocal pending_trigger
+                if pending_trigger is not None:
+                    stats.latencies.append(now - pending_trigger - args.latency_ms / 1000)
+                    pending_trigger = None
+                if args.mode != "echo":
+                    return
+                hits = np.flatnonzero((samples[:-3] == MARK_A) & (samples[1:-2] == MARK_B))
+                for i in hits:
+                    key = int(samples[i + 2]) | (int(samples[i + 3]) << 15)
+                    started = sent_at.pop(key, None)
+                    if started is not None:
+                        stats.latencies.append(now - started - args.latency_ms / 1000)
+
+            async def reader():
+                async for message in ws:
+                    now = time.monotonic()
+                    stats.messages_down += 1
+                    stats.bytes_down += len(message)
+                    if isinstance(message, bytes):
+                        kind, codec_id, frame_rate, payload = unpack_frame(message)
+                        if kind == FRAME_AUDIO:
+                            pcm_down = await codec.decode(payload, codec_id, frame_rate)
+                            on_audio(np.frombuffer(pcm_down, dtype=np.int16), now)
+                        continue
+                    content = json.loads(message).get("serverContent", {})
+                    if content.get("interrupted"):
+                        stats.interruptions += 1
+                    for part in content.get("modelTurn", {}).get("parts", []):
+                        if "inlineData" in part:
+                            data = base64.b64decode(part["inlineData"]["data"])
+                            on_audio(np.frombuffer(data, dtype=np.int16), now)
+
+            read_task = asyncio.create_task(reader())
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            position = (index * 7919) % max(1, len(pcm) - chunk)
+            frame = np.empty(chunk, dtype=np.int16)
+            n = 0
+            while time.monotonic() < stop_at:
+                await asyncio.sleep(max(0.0, started + n * args.chunk_ms / 1000 - loop.time()))
+                if position + chunk > len(pcm):
+                    position = 0
+                frame[:] = pcm[position:position + chunk]
+                position += chunk
+                if args.mode == "echo":
+                    frame[:4] = (MARK_A, MARK_B, seq & 0x7FFF, (seq >> 15) & 0x7FFF)
+                    sent_at[seq] = time.monotonic()
+                    seq += 1
+                payload = frame.tobytes()
+                if args.framing == "binary":
+                    message = pack_audio(await codec.encode(payload, rate), rate, codec.codec_id)
+                else:
+                    message = json.dumps({"realtimeInput": {"mediaChunks": [{
+                        "data": base64.b64encode(payload).decode("ascii"),
+                        "mimeType": f"audio/pcm;rate={rate}",
+                    }]}})
+                await ws.send(message)
+                stats.messages_up += 1
+                stats.bytes_up += len(message)
+                n += 1
+
+                streamed_ms += args.chunk_ms
+                if args.mode == "synth" and streamed_ms >= trigger_ms:
+                    streamed_ms = 0.0
+                    pending_trigger = time.monotonic()
+            read_task.cancel()
+    except websockets.ConnectionClosed as e:
+        # 1013: turned away by the proxy's admission control, not a failure of the relay
+        if e.rcvd is not None and e.rcvd.code == 1013:
+            stats.rejected += 1
+        else:
+            stats.failed += 1
+        if args.verbose:
+            print(f"[LOAD] client {index} closed: {e}")
+    except Exception as e:
+        stats.failed += 1
+        if args.verbose:
+            print(f"[LOAD] client {index} failed: {e}")
+
+
+def start_server(args, extra_env=None):
+    env = dict(os.environ)
+    env.update({
+        "FAKE_LIVE_BACKEND": "1",
+        "FAKE_LIVE_MODE": args.mode,
+        "FAKE_LIVE_LATENCY_MS": str(args.latency_ms),
+        "FAKE_LIVE_TURN_EVERY_MS": str(args.turn_every_ms),
+        "FAKE_LIVE_INTERRUPT_RATE": str(args.interrupt_rate),
+        "VAD_ENABLED": "0",
+        "PYTHONUNBUFFERED": "1",
+    })
+    if getattr(args, "audio_codecs", None):
+        # The server only negotiates what AUDIO_CODECS allows
+        env["AUDIO_CODECS"] = args.audio_codecs
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL if not args.verbose else None,
+        stderr=subprocess.STDOUT if not args.verbose else None,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("Proxy exited during startup")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/metrics", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit("Proxy did not become ready in 30 s")
+
+
+async def run(args):
+    pcm, rate = load_pcm(args.wav, args.rate)
+    stats = ClientStats()
+    process = None
+    sampler = None
+    if not args.url:
+        process = start_server(args)
+        args.url = f"ws://127.0.0.1:{args.port}/ws"
+        sampler = ProcessSampler(process.pid)
+
+    try:
+        rss_baseline = sampler.rss_kb() if sampler else None
+        cpu_start = sampler.cpu_seconds() if sampler else None
+        rss_peak = rss_baseline or 0
+
+        wall_start = time.monotonic()
+        stop_at = wall_start + args.ramp + args.duration
+        clients = []
+        for i in range(args.sessions):
+            clients.append(asyncio.create_task(run_client(i, args, pcm, rate, stats, stop_at)))
+            if args.ramp:
+                await asyncio.sleep(args.ramp / args.sessions)
+
+        while not all(task.done() for task in clients):
+            if sampler:
+                rss_peak = max(rss_peak, sampler.rss_kb() or 0)
+            await asyncio.sleep(0.5)
+        wall = time.monotonic() - wall_start
+        cpu_used = sampler.cpu_seconds() - cpu_start if sampler else None
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+
+    latencies_ms = sorted(x * 1000 for x in stats.latencies)
+    active = max(1, stats.connected)
+    cores = cpu_used / wall if cpu_used is not None else None
+    report = {
+        "sessions": args.sessions,
+        "connected": stats.connected,
+        "failed": stats.failed,
+        "rejected": stats.rejected,
+        "mode": args.mode,
+        "framing": args.framing,
+        "audio_codec": ",".join(sorted(stats.codecs)) or None,
+        "wall_s": round(wall, 1),
+        "relay_latency_ms": {
+            "samples": len(latencies_ms),
+            "p50": round(percentile(latencies_ms, 50), 2) if latencies_ms else None,
+            "p95": round(percentile(latencies_ms, 95), 2) if latencies_ms else None,
+            "p99": round(percentile(latencies_ms, 99), 2) if latencies_ms else None,
+        },
+        "messages_up_per_s": round(stats.messages_up / wall, 1),
+        "messages_down_per_s": round(stats.messages_down / wall, 1),
+        "bytes_up_per_s": round(stats.bytes_up / wall),
+        "bytes_down_per_s": round(stats.bytes_down / wall),
+        "interruptions": stats.interruptions,
+    }
+    if sampler:
+        report.update({
+            "server_cpu_cores": round(cores, 3),
+            "sessions_per_core": round(active / cores, 1) if cores else None,
+            "cpu_ms_per_session_second": round(cpu_used * 1000 / (active * wall), 2),
+            "rss_mb_baseline": round(rss_baseline / 1024, 1) if rss_baseline else None,
+            "rss_mb_peak": round(rss_peak / 1024, 1),
+            "rss_kb_per_session": round((rss_peak - (rss_baseline or 0)) / active, 1),
+        })
+    return report
+
+
+def check_gates(args, report):
+    failures = []
+    latency = report["relay_latency_ms"]
+    if args.max_p95_ms is not None and (latency["p95"] is None or latency["p95"] > args.max_p95_ms):
+        failures.append(f"p95 {latency['p95']} ms > {args.max_p95_ms} ms")
+    if args.max_p99_ms is not None and (latency["p99"] is None or latency["p99"] > args.max_p99_ms):
+        failures.append(f"p99 {latency['p99']} ms > {args.max_p99_ms} ms")
+    if args.min_sessions_per_core is not None:
+        per_core = report.get("sessions_per_core")
+        if per_core is None or per_core < args.min_sessions_per_core:
+            failures.append(f"sessions/core {per_core} < {args.min_sessions_per_core}")
+    if report["failed"]:
+        failures.append(f"{report['failed']} sessions failed")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the /ws proxy")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of streaming after ramp-up")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which clients connect")
+    parser.add_argument("--url", help="existing proxy to test instead of spawning one")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--framing", choices=("binary", "json"), default="binary")
+    parser.add_argument("--mode", choices=("echo", "synth"), default="echo")
+    parser.add_argument("--audio-codecs", help="codecs to offer, e.g. adpcm or mulaw (binary framing; default pcm16)")
+    parser.add_argument("--rate", type=int, default=16000, help="sample rate of generated audio")
+    parser.add_argument("--chunk-ms", type=int, default=85, help="client chunk size (browser: 2048 @ 24 kHz)")
+    parser.add_argument("--wav", help="mono 16-bit WAV file to stream instead of generated audio")
+    parser.add_argument("--latency-ms", type=int, default=200, help="fake backend response latency")
+    parser.add_argument("--turn-every-ms", type=int, default=4000, help="synth mode: audio per model turn")
+    parser.add_argument("--interrupt-rate", type=float, default=0.0, help="synth mode: share of interrupted turns")
+    parser.add_argument("--max-p95-ms", type=float)
+    parser.add_argument("--max-p99-ms", type=float)
+    parser.add_argument("--min-sessions-per-core", type=float)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = check_gates(args, report)
+    for failure in failures:
+        print(f"[LOAD] GATE FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
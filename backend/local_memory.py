@@ -0,0 +1,333 @@
+"""
+Self-hosted vector memory for the agent's memory tools.
+
+Each user has a directory with two append-only files:
+
+    vectors.f32   float32 rows of ``dim`` values, L2-normalized, memory-mapped
+    facts.jsonl   one JSON object per row: ``{"text": ..., "ts": ...}``
+
+A search embeds the query and runs one matrix-vector product over the mapped
+rows (cosine similarity, since rows are normalized) followed by an
+``argpartition`` top-k, so lookups take milliseconds. New facts are appended
+to both files; every ``compact_every`` appends the user's files are rewritten
+without near-duplicates (the newer fact wins) and capped at ``max_facts``.
+
+Embeddings come from a pluggable callable ``embed(texts) -> (n, dim) array``.
+``HashingEmbedder`` is the deterministic, dependency-free default: signed
+feature hashing of words and character trigrams. It matches paraphrases only
+loosely, but needs no model and gives identical vectors on every machine,
+which suits offline tests; plug in a sentence-embedding model for quality.
+
+A user's files are written by one process at a time. Within a process every
+``LocalVectorMemory`` on the same directory shares one index per user (its
+facts, memory map and lock), so agent jobs running as threads (``serve.py``)
+never append behind each other's back.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from memory_backend import MemoryBackend
+
+_WORDS = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-features embedding via signed feature hashing."""
+
+    def __init__(self, dim=256, trigram_weight=0.5):
+        self.dim = dim
+        self.trigram_weight = trigram_weight
+
+    def _features(self, text):
+        for word in _WORDS.findall(text.casefold()):
+            yield word, 1.0
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], self.trigram_weight
+
+    def __call__(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                out[row, h % self.dim] += weight if h >> 63 else -weight
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def _user_dir_name(user_id):
+    readable = re.sub(r"[^\w.-]", "_", user_id)[:40]
+    digest = hashlib.blake2b(user_id.encode(), digest_size=6).hexdigest()
+    return f"{readable}-{digest}"
+
+
+class _UserIndex:
+    """Files and memory map of one user's facts; callers hold ``lock``."""
+
+    def __init__(self, path, dim):
+        self.path = path
+        self.dim = dim
+        self.lock = threading.Lock()
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.facts_path = os.path.join(path, "facts.jsonl")
+        self.facts = []
+        self._map = None
+        self.appends_since_compaction = 0
+        os.makedirs(path, exist_ok=True)
+        self._recover()
+        self._load()
+
+    def _recover(self):
+        """Finishes or discards a compaction that was interrupted."""
+        vectors_tmp = self.vectors_path + ".tmp"
+        facts_tmp = self.facts_path + ".tmp"
+        if os.path.exists(facts_tmp):
+            # Nothing was replaced yet: the old files are intact
+            os.remove(facts_tmp)
+            if os.path.exists(vectors_tmp):
+                os.remove(vectors_tmp)
+        elif os.path.exists(vectors_tmp):
+            # Facts were replaced, vectors were not: roll forward
+            os.replace(vectors_tmp, self.vectors_path)
+
+    def _load(self):
+        valid_bytes = 0
+        if os.path.exists(self.facts_path):
+            with open(self.facts_path, "rb") as f:
+                for line in f:
+                    try:
+                        self.facts.append(json.loads(line))
+                    except ValueError:
+                        break  # torn last line from a crash during append
+                    valid_bytes += len(line)
+            if valid_bytes != os.path.getsize(self.facts_path):
+                with open(self.facts_path, "r+b") as f:
+                    f.truncate(valid_bytes)
+
+        row_bytes = self.dim * 4
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        rows = size // row_bytes
+        if rows > len(self.facts) or size % row_bytes:
+            # Vectors are written before facts; drop rows whose fact never landed
+            rows = min(rows, len(self.facts))
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(rows * row_bytes)
+        if rows < len(self.facts):
+            raise RuntimeError(f"{self.path}: {len(self.facts)} facts but only {rows} vectors")
+
+    def matrix(self):
+        if not self.facts:
+            return None
+        if self._map is None or len(self._map) != len(self.facts):
+            self._map = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.facts), self.dim))
+        return self._map
+
+    def append(self, texts, vectors):
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        now = time.time()
+        entries = [{"text": text, "ts": now} for text in texts]
+        with open(self.facts_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.facts.extend(entries)
+        self._map = None
+        self.appends_since_compaction += len(texts)
+
+    def compact(self, duplicate_score, max_facts, block=512):
+        """Rewrites the files without near-duplicates; returns rows removed."""
+        matrix = self.matrix()
+        if matrix is None:
+            return 0
+        vectors = np.array(matrix)
+        # Windows cannot replace a file that is still mapped: drop the map before os.replace
+        del matrix
+        n = len(vectors)
+        keep = np.ones(n, dtype=bool)
+        for start in range(0, n, block):
+            sims = vectors[start:start + block] @ vectors.T
+            rows = np.arange(start, min(start + block, n))
+            # Only compare with newer rows: the newest version of a fact survives
+            sims[np.arange(len(rows))[:, None] >= (np.arange(n)[None, :] - start)] = 0
+            keep[rows[(sims >= duplicate_score).any(axis=1)]] = False
+        if keep.sum() > max_facts:
+            keep[np.flatnonzero(keep)[:-max_facts]] = False
+        removed = int(n - keep.sum())
+        self.appends_since_compaction = 0
+        if not removed:
+            return 0
+
+        facts = [fact for fact, kept in zip(self.facts, keep) if kept]
+        vectors_tmp = self.vectors_path + ".tmp"
+        facts_tmp = self.facts_path + ".tmp"
+        # Order matters for _recover(): facts.tmp exists until the first replace,
+        # so a lone vectors.tmp is always complete
+        with open(facts_tmp, "w", encoding="utf-8") as f:
+            for fact in facts:
+                f.write(json.dumps(fact, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with open(vectors_tmp, "wb") as f:
+            f.write(vectors[keep].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._map = None
+        os.replace(facts_tmp, self.facts_path)
+        os.replace(vectors_tmp, self.vectors_path)
+        self.facts = facts
+        return removed
+
+
+# Absolute user directory -> _UserIndex, shared by every LocalVectorMemory of the process
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _shared_index(path, dim):
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = _UserIndex(path, dim)
+        return index
+
+
+class LocalVectorMemory(MemoryBackend):
+    """Per-user vector memory on local disk; see the module docstring."""
+
+    def __init__(
+        self,
+        root,
+        embed=None,
+        dim=256,
+        top_k=5,
+        min_score=0.25,
+        duplicate_score=0.95,
+        compact_every=200,
+        max_facts=5000,
+    ):
+        self.root = root
+        self.embed = embed or HashingEmbedder(dim)
+        self.dim = dim
+        self.top_k = top_k
+        self.min_score = min_score
+        self.duplicate_score = duplicate_score
+        self.compact_every = compact_every
+        self.max_facts = max_facts
+        os.makedirs(root, exist_ok=True)
+
+        self._users = {}
+        self._users_lock = threading.Lock()
+        # One worker thread: saves and searches run in order, off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-memory")
+        self._pending = set()
+
+        self.searches = 0
+        self.search_seconds = 0.0
+        self.saves = 0
+        self.duplicates = 0
+        self.compactions = 0
+        self.compacted_rows = 0
+
+    def _user(self, user_id):
+        with self._users_lock:
+            index = self._users.get(user_id)
+            if index is None:
+                index = _shared_index(os.path.join(self.root, _user_dir_name(user_id)), self.dim)
+                self._users[user_id] = index
+            return index
+
+    def search_sync(self, query, user_id, top_k=None):
+        started = time.perf_counter()
+        index = self._user(user_id)
+        query_vector = self.embed([query])[0]
+        with index.lock:
+            matrix = index.matrix()
+            if matrix is None:
+                return []
+            scores = matrix @ query_vector
+            k = min(top_k or self.top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results = [
+                {"memory": index.facts[i]["text"], "score": round(float(scores[i]), 3), "created_at": index.facts[i]["ts"]}
+                for i in top
+                if scores[i] >= self.min_score
+            ]
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - started
+        return results
+
+    def profile_sync(self, user_id, limit=20):
+        index = self._user(user_id)
+        with index.lock:
+            return [fact["text"] for fact in index.facts[-limit:][::-1]]
+
+    def save_sync(self, fact, user_id):
+        index = self._user(user_id)
+        vector = self.embed([fact])
+        with index.lock:
+            matrix = index.matrix()
+            if matrix is not None and float((matrix @ vector[0]).max()) >= 0.999:
+                self.duplicates += 1
+                return False
+            index.append([fact], vector)
+            self.saves += 1
+            if index.appends_since_compaction >= self.compact_every:
+                self.compacted_rows += index.compact(self.duplicate_score, self.max_facts)
+                self.compactions += 1
+        return True
+
+    def compact(self, user_id):
+        index = self._user(user_id)
+        with index.lock:
+            removed = index.compact(self.duplicate_score, self.max_facts)
+        self.compactions += 1
+        self.compacted_rows += removed
+        return removed
+
+    async def search(self, query, user_id):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.search_sync, query, user_id)
+
+    async def profile(self, user_id, limit=20):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.profile_sync, user_id, limit)
+
+    def save(self, fact, user_id):
+        """Schedules the append on the worker thread and returns at once.
+
+        Always True: duplicates are found by ``save_sync`` on the worker
+        thread, after this returns, and counted in ``stats()["duplicates"]``.
+        """
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self.save_sync, fact, user_id)
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+        return True
+
+    async def close(self):
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            "backend": "local",
+            "users_loaded": len(self._users),
+            "facts": sum(len(index.facts) for index in self._users.values()),
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_seconds / self.searches * 1000, 3) if self.searches else 0.0,
+            "saves": self.saves,
+            "duplicates": self.duplicates,
+            "compactions": self.compactions,
+            "compacted_rows": self.compacted_rows,
+        }
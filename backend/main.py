@@ -3,15 +3,69 @@ import json
 import asyncio
 import base64
 import sys
+import threading
+import uuid
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.staticfiles import StaticFiles
-from google import genai
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 
+from admission import AdmissionController, AdmissionRejected
+from audio_codec import PCM16, AudioCodecSession, negotiate_codec, prepare
+from audio_resample import MODEL_INPUT_RATE, AudioNormalizer
+from framing import (
+    FRAME_AUDIO,
+    FRAME_VIDEO,
+    FRAMING_BINARY,
+    check_audio,
+    negotiate_framing,
+    pack_audio,
+    rate_from_mime,
+    split_video,
+    unpack_frame,
+)
+from metrics import Gauge, SessionMetrics, render_prometheus
+from outbound_queue import OutboundQueue
+from resumption_store import store_from_url, worker_id
+from session_pool import LiveSessionPool
+from session_recorder import (
+    CLIENT_IN,
+    CLIENT_OUT,
+    FLAG_AUDIO,
+    FLAG_STREAM_END,
+    FLAG_TEXT,
+    FLAG_VIDEO,
+    GEMINI_IN,
+    UPSTREAM_OUT,
+    recorder_for,
+    server_message_flags,
+)
+from transcripts import INPUT, OUTPUT, TranscriptAggregator, is_thought
+from static_assets import StaticAssets
+from upstream_buffer import UpstreamAudioBuffer
+from upstream_link import UpstreamLink, UpstreamLost
+from vad import vad_from_setup
+from video_ingest import VideoIngest
+
 # --- Configuration ---
 load_dotenv()
 
-app = FastAPI()
+STARTED_AT = time.monotonic()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Импорт SDK и пул сессий прогреваются в фоне, порт открывается сразу
+    if STARTUP_WARMUP or session_pool:
+        start_warmup()
+    admission.start()
+    yield
+    await admission.stop()
+    if session_pool:
+        await session_pool.stop()
+    await resumption_store.close()
+
+app = FastAPI(lifespan=lifespan)
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 FRONTEND_DIR = os.path.join(BASE_DIR, "frontend")
@@ -19,151 +73,685 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 MODEL_ID = "models/gemini-2.5-flash-native-audio-preview-12-2025"
 
-if not GOOGLE_API_KEY:
+# Локальная заглушка Gemini Live для нагрузочных тестов (см. fake_live.py)
+FAKE_LIVE_BACKEND = os.getenv("FAKE_LIVE_BACKEND", "0") == "1"
+
+if not GOOGLE_API_KEY and not FAKE_LIVE_BACKEND:
     print("CRITICAL: GOOGLE_API_KEY is not set.")
     sys.exit(1)
 
-# Настройка клиента Gemini (New SDK)
-client = genai.Client(
-    api_key=GOOGLE_API_KEY,
-    http_options={'api_version': 'v1alpha'}
+# Апстрим-буфер: склеивает мелкие чанки микрофона в кадры перед отправкой в Gemini
+# Кадр не длиннее куска браузера (2048 отсчётов при 24 кГц = 85 мс): иначе каждый
+# кусок ждёт таймер UPSTREAM_MAX_DELAY_MS и уходит один. Склеиваются только куски,
+# скопившиеся, пока предыдущая отправка ещё идёт
+UPSTREAM_FRAME_MS = int(os.getenv("UPSTREAM_FRAME_MS", 40))
+UPSTREAM_MAX_DELAY_MS = int(os.getenv("UPSTREAM_MAX_DELAY_MS", 40))
+UPSTREAM_MAX_BUFFER_MS = int(os.getenv("UPSTREAM_MAX_BUFFER_MS", 2000))
+UPSTREAM_OVERFLOW = os.getenv("UPSTREAM_OVERFLOW", "drop_oldest")
+
+# Серверный VAD: тишина не уходит в Gemini. Клиент может переопределить через setup.vad
+VAD_ENABLED = os.getenv("VAD_ENABLED", "0") == "1"
+
+# Очередь к браузеру: отдельный писатель, управляющие сообщения идут раньше аудио
+OUTBOUND_MAX_AUDIO_BYTES = int(os.getenv("OUTBOUND_MAX_AUDIO_BYTES", 1_000_000))
+OUTBOUND_OVERFLOW = os.getenv("OUTBOUND_OVERFLOW", "drop_oldest")
+
+# Пул заранее открытых сессий Gemini (0 — выключен)
+SESSION_POOL_SIZE = int(os.getenv("SESSION_POOL_SIZE", 0))
+SESSION_POOL_TTL = int(os.getenv("SESSION_POOL_TTL", 300))
+SESSION_POOL_IDLE_TIMEOUT = int(os.getenv("SESSION_POOL_IDLE_TIMEOUT", 600))
+
+# Хранилище токенов возобновления: memory (один воркер) или sqlite:///path (общее для воркеров)
+RESUMPTION_STORE = os.getenv("RESUMPTION_STORE", "memory")
+RESUMPTION_TTL = int(os.getenv("RESUMPTION_TTL", 7200))
+
+# Количество воркеров uvicorn при запуске через python main.py
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+# Фоновый прогрев клиента Gemini сразу после старта (иначе — при первой сессии или /readyz)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+
+
+# Транскрипции собираются по ходам и уходят в браузер не чаще, чем раз в интервал
+TRANSCRIPT_INTERVAL_MS = int(os.getenv("TRANSCRIPT_INTERVAL_MS", 250))
+
+# Обрыв сессии Gemini (GoAway, сбой сети): переподключаемся с последним токеном, не закрывая сокет браузера.
+# Пока связи нет, звук микрофона копится в буфере не дольше UPSTREAM_GAP_BUFFER_MS
+UPSTREAM_RECONNECT_ATTEMPTS = int(os.getenv("UPSTREAM_RECONNECT_ATTEMPTS", 5))
+UPSTREAM_GAP_BUFFER_MS = int(os.getenv("UPSTREAM_GAP_BUFFER_MS", 5000))
+
+# Допуск сессий: не больше ADMISSION_MAX_SESSIONS одновременно и ADMISSION_MAX_PER_IP с одного адреса (0 - без лимита).
+# Лишние ждут в очереди до ADMISSION_QUEUE_TIMEOUT секунд, при переполнении очереди - отказ с кодом 1013
+ADMISSION_MAX_SESSIONS = int(os.getenv("ADMISSION_MAX_SESSIONS", 50))
+ADMISSION_MAX_PER_IP = int(os.getenv("ADMISSION_MAX_PER_IP", 0))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 20))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 20))
+# Задержка event loop (мс): выше верхнего порога лимит снижается, ниже нижнего - снова растет
+ADMISSION_LAG_HIGH_MS = int(os.getenv("ADMISSION_LAG_HIGH_MS", 100))
+ADMISSION_LAG_LOW_MS = int(os.getenv("ADMISSION_LAG_LOW_MS", 30))
+# Адрес клиента берем из X-Forwarded-For (только за своим балансировщиком, например на Render)
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+
+# Сжатые кодеки аудио, которые сервер готов согласовать (клиент перечисляет свои в setup.audio_codecs).
+# По умолчанию только mulaw: он стоит одну табличную выборку, а adpcm кодируется в цикле на Python
+AUDIO_CODECS = [c.strip() for c in os.getenv("AUDIO_CODECS", "mulaw").split(",") if c.strip()]
+
+# Кадры камеры: не чаще VIDEO_MAX_FPS, почти одинаковые (средняя разница миниатюр ниже порога) не отправляем
+VIDEO_MAX_FPS = float(os.getenv("VIDEO_MAX_FPS", 1.0))
+VIDEO_DIFF_THRESHOLD = float(os.getenv("VIDEO_DIFF_THRESHOLD", 4.0))
+
+# Запись трафика сессий для воспроизведения (replay.py): доля записываемых сессий 0..1
+RECORD_SAMPLE_RATE = float(os.getenv("RECORD_SAMPLE_RATE", 0))
+RECORD_DIR = os.getenv("RECORD_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "recordings"))
+RECORD_MAX_BYTES = int(os.getenv("RECORD_MAX_BYTES", 50_000_000))
+
+# Итоговая сводка по сессии в лог при ее закрытии
+SESSION_SUMMARY_LOG = os.getenv("SESSION_SUMMARY_LOG", "0") == "1"
+
+# Активные сессии прокси: session_id -> объекты со статистикой
+ACTIVE_SESSIONS = {}
+
+Gauge("proxy_active_sessions", "Sessions currently proxied", lambda: len(ACTIVE_SESSIONS))
+
+admission = AdmissionController(
+    max_sessions=ADMISSION_MAX_SESSIONS,
+    max_per_ip=ADMISSION_MAX_PER_IP,
+    queue_size=ADMISSION_QUEUE_SIZE,
+    queue_timeout_s=ADMISSION_QUEUE_TIMEOUT,
+    lag_high_ms=ADMISSION_LAG_HIGH_MS,
+    lag_low_ms=ADMISSION_LAG_LOW_MS,
 )
+Gauge("proxy_admission_limit", "Sessions admitted at most right now", lambda: admission.limit)
+Gauge("proxy_admission_waiting", "Sessions waiting in the admission queue", lambda: admission.waiting)
+Gauge("proxy_event_loop_lag_seconds", "Smoothed event loop lag", lambda: admission.lag_ms / 1000)
+Gauge("proxy_admission_total", "Admission decisions", lambda: admission.admitted,
+      labels={"result": "admitted"}, kind="counter")
+for _reason in admission.rejected:
+    Gauge("proxy_admission_total", "Admission decisions", lambda reason=_reason: admission.rejected[reason],
+          labels={"result": _reason}, kind="counter")
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    print(f"[PROXY] Client connected. Model: {MODEL_ID}")
-    sys.stdout.flush()
+WORKER_ID = worker_id()
+resumption_store = store_from_url(RESUMPTION_STORE, ttl=RESUMPTION_TTL)
 
-    try:
-        config = {
-            "system_instruction": """Ты — Омни, живой и энергичный ИИ-помощник. 
+# Клиент Gemini (New SDK) создается при первом использовании: импорт google.genai
+# занимает сотни миллисекунд и не должен задерживать открытие порта
+_client = None
+_client_lock = threading.Lock()
+_warmup_task = None
+CLIENT_INIT_SECONDS = None
+
+def get_client():
+    """The Gemini client, created on first call. Thread-safe, so warmup can run off the loop."""
+    global _client, CLIENT_INIT_SECONDS
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                started = time.monotonic()
+                if FAKE_LIVE_BACKEND:
+                    from fake_live import FakeLiveClient, FakeLiveOptions
+                    new_client = FakeLiveClient(FakeLiveOptions.from_env())
+                    print("[PROXY] Using the local fake Gemini Live backend.")
+                else:
+                    from google import genai
+                    new_client = genai.Client(
+                        api_key=GOOGLE_API_KEY,
+                        http_options={'api_version': 'v1alpha'}
+                    )
+                # Подгружает и модуль live-сессий
+                new_client.aio.live
+                CLIENT_INIT_SECONDS = time.monotonic() - started
+                _client = new_client
+    return _client
+
+def prepare_codecs():
+    # Таблицы кодеков строятся заранее, но не при импорте: запуск сервера не ждет их
+    prepare(AUDIO_CODECS)
+
+async def _warmup():
+    await asyncio.to_thread(get_client)
+    await asyncio.to_thread(prepare_codecs)
+    print(f"[PROXY] Gemini client ready in {CLIENT_INIT_SECONDS * 1000:.0f} ms "
+          f"({time.monotonic() - STARTED_AT:.2f}s after startup).")
+    if session_pool:
+        session_pool.start()
+
+def start_warmup():
+    """Starts the background warmup unless it is running or done; returns its task."""
+    global _warmup_task
+    if _warmup_task is None or (_warmup_task.done() and _client is None):
+        _warmup_task = asyncio.create_task(_warmup())
+    return _warmup_task
+
+async def ready_client():
+    """The client, waiting for the warmup instead of importing on the event loop."""
+    if _client is None:
+        await asyncio.shield(start_warmup())
+    return _client
+
+def build_live_config():
+    """Default Gemini Live configuration for a proxied session."""
+    return {
+        "system_instruction": """Ты — Омни, живой и энергичный ИИ-помощник. 
 ПРАВИЛА:
 1. Отвечай ТОЛЬКО голосом. Твой ответ — это то, что ты говоришь собеседнику.
 2. КАТЕГОРИЧЕСКИ ЗАПРЕЩЕНО выводить любые технические размышления или статусы типа '**Initiating A Dialogue**' или '**Formulating a response**'. Если видишь такое в своих мыслях — удаляй и не пиши.
 3. Будь инициативным. После приветствия не просто жди, а предложи тему для разговора или спроси, как прошел день.
 4. Говори кратко, но дружелюбно. Поддерживай живой диалог.""",
-            "response_modalities": ["AUDIO"],
-            "speech_config": {
-                "voice_config": {
-                    "prebuilt_voice_config": {
-                        "voice_name": "Puck"
-                    }
+        "response_modalities": ["AUDIO"],
+        "speech_config": {
+            "voice_config": {
+                "prebuilt_voice_config": {
+                    "voice_name": "Puck"
                 }
-            },
-            # Автоматическое сжатие контекста при превышении 20 000 токенов
-            "context_window_compression": {
-                "sliding_window": {},
-                "trigger_tokens": 20000
             }
-        }
+        },
+        # Автоматическое сжатие контекста при превышении 20 000 токенов
+        "context_window_compression": {
+            "sliding_window": {},
+            "trigger_tokens": 20000
+        },
+        # Без этого Gemini не присылает токены возобновления
+        "session_resumption": {},
+        # Текст речи пользователя и модели для чата
+        "input_audio_transcription": {},
+        "output_audio_transcription": {}
+    }
+
+session_pool = None
+if SESSION_POOL_SIZE > 0:
+    session_pool = LiveSessionPool(
+        lambda: get_client().aio.live.connect(model=MODEL_ID, config=build_live_config()),
+        size=SESSION_POOL_SIZE,
+        ttl=SESSION_POOL_TTL,
+        idle_timeout=SESSION_POOL_IDLE_TIMEOUT,
+    )
+    Gauge("proxy_pool_ready_sessions", "Warm sessions waiting in the pool",
+          lambda: session_pool.stats()["ready"])
+    Gauge("proxy_pool_requests_total", "Session pool lookups", lambda: session_pool.hits,
+          labels={"result": "hit"}, kind="counter")
+    Gauge("proxy_pool_requests_total", "Session pool lookups", lambda: session_pool.misses,
+          labels={"result": "miss"}, kind="counter")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok", "uptime_s": round(time.monotonic() - STARTED_AT, 1)}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the Gemini client is warm, 503 (and a warmup kick) before that."""
+    if _client is None:
+        start_warmup()
+        return JSONResponse({"ready": False}, status_code=503)
+    return {
+        "ready": True,
+        "client_init_ms": round(CLIENT_INIT_SECONDS * 1000, 1),
+        "pool_ready_sessions": session_pool.stats()["ready"] if session_pool else None,
+    }
+
+@app.get("/sessions")
+async def sessions_stats():
+    """Per-session statistics of the proxy's buffers."""
+    return {
+        session_id: {name: component.stats() for name, component in components.items()}
+        for session_id, components in ACTIVE_SESSIONS.items()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Latency and throughput metrics in the Prometheus text format."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/pool")
+async def pool_stats():
+    """Hit rate and connect times of the pre-warmed session pool."""
+    if not session_pool:
+        return {"enabled": False}
+    return {"enabled": True, **session_pool.stats()}
+
+@app.get("/admission")
+async def admission_stats():
+    """Session limit, queue and event loop lag of the admission control."""
+    return admission.stats()
+
+@app.get("/sessions/workers")
+async def session_workers():
+    """Active sessions per worker, as recorded in the shared resumption store."""
+    return {
+        "worker": WORKER_ID,
+        "local_sessions": len(ACTIVE_SESSIONS),
+        "workers": await resumption_store.workers(),
+        "store": resumption_store.stats(),
+    }
+
+def client_ip(websocket):
+    """The client's address: the first X-Forwarded-For hop if trusted, else the peer."""
+    if TRUST_FORWARDED_FOR:
+        forwarded = websocket.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return websocket.client.host if websocket.client else "unknown"
+
+def admission_message(state, **details):
+    return json.dumps({"serverContent": {"admission": {"state": state, **details}}})
+
+async def reject_session(websocket, rejection):
+    print(f"[PROXY] Session rejected: {rejection.reason}")
+    sys.stdout.flush()
+    try:
+        await websocket.send_text(admission_message(
+            "rejected", reason=rejection.reason, retry_after_s=rejection.retry_after_s))
+        # 1013 Try Again Later: клиент повторит попытку позже, а не сразу
+        await websocket.close(code=1013, reason=rejection.reason)
+    except Exception:
+        pass
+
+async def wait_for_admission(websocket, ticket):
+    """Reports the queue position until admitted; returns the client's setup message.
+
+    The socket is read meanwhile, so a client that leaves frees its place at
+    once. Audio sent while waiting is dropped: it would be stale by the time
+    the session starts.
+    """
+    initial_message = None
+
+    async def send_position(position):
+        await websocket.send_text(admission_message("queued", position=position))
+
+    async def read_until_admitted():
+        nonlocal initial_message
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            if initial_message is None and frame.get("text") is not None:
+                initial_message = frame["text"]
+
+    reader = asyncio.create_task(read_until_admitted())
+    waiter = asyncio.create_task(ticket.wait(send_position))
+    try:
+        await asyncio.wait({reader, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        reader.cancel()
+        waiter.cancel()
+    if reader.done() and not reader.cancelled():
+        reader.result()
+    waiter.result()
+    await websocket.send_text(admission_message("admitted", waited_ms=round(ticket.waited_seconds * 1000)))
+    return initial_message
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    # Допуск решается до любой работы с Gemini: отказ приходит сразу и с причиной
+    try:
+        ticket = admission.enter(client_ip(websocket))
+    except AdmissionRejected as rejection:
+        await reject_session(websocket, rejection)
+        return
+    try:
+        initial_message = None
+        if not ticket.admitted:
+            try:
+                initial_message = await wait_for_admission(websocket, ticket)
+            except AdmissionRejected as rejection:
+                await reject_session(websocket, rejection)
+                return
+            except Exception:
+                # Клиент ушел, не дождавшись очереди
+                return
+        await proxy_session(websocket, initial_message)
+    finally:
+        ticket.release()
+
+async def proxy_session(websocket, initial_message=None):
+    session_id = uuid.uuid4().hex[:8]
+    print(f"[PROXY] Client connected ({session_id}). Model: {MODEL_ID}")
+    sys.stdout.flush()
+
+    try:
+        config = build_live_config()
 
         # Проверяем, прислал ли клиент токен для восстановления сессии
-        initial_message = await websocket.receive_text()
+        if initial_message is None:
+            initial_message = await websocket.receive_text()
         initial_data = json.loads(initial_message)
-        if "setup" in initial_data and "resumption_handle" in initial_data["setup"]:
-            config["resumption_handle"] = initial_data["setup"]["resumption_handle"]
-            print(f"[PROXY] Attempting to resume session with handle: {config['resumption_handle'][:10]}...")
+        setup = initial_data.get("setup", {})
+        # Стабильный id клиента: по нему любой воркер найдет последний токен возобновления
+        client_session_id = str(setup.get("session_id") or session_id)[:128]
+        resumption_handle = setup.get("resumption_handle") or await resumption_store.get(client_session_id)
+        if resumption_handle:
+            config["session_resumption"] = {"handle": resumption_handle}
+            print(f"[PROXY] Attempting to resume session with handle: {resumption_handle[:10]}...")
+
+        # Бинарный режим: аудио идет сырыми PCM-кадрами, JSON остается для событий
+        framing = negotiate_framing(setup)
+        binary_audio = framing == FRAMING_BINARY
+        # Кодек согласуем только для бинарных кадров: его номер лежит в заголовке кадра
+        codec = AudioCodecSession(negotiate_codec(setup, AUDIO_CODECS) if binary_audio else PCM16)
+
+        recorder = recorder_for(
+            session_id, {"framing": framing, "audio_codec": codec.name, "model": MODEL_ID},
+            RECORD_DIR, RECORD_SAMPLE_RATE, RECORD_MAX_BYTES,
+        )
+        if recorder:
+            recorder.record(CLIENT_IN, initial_message)
+
+        metrics = SessionMetrics(session_id)
+
+        # Теплая сессия из пула подходит только для конфигурации по умолчанию
+        connection = None
+        if session_pool and not resumption_handle:
+            connection = session_pool.acquire()
+        from_pool = connection is not None
+        client = await ready_client()
+        connect_started = time.monotonic()
+        if connection is None:
+            connection = client.aio.live.connect(model=MODEL_ID, config=config)
 
-        async with client.aio.live.connect(model=MODEL_ID, config=config) as session:
+        def reconnect(handle):
+            # Та же конфигурация плюс последний токен возобновления: разговор продолжится
+            reconnect_config = build_live_config()
+            if handle:
+                reconnect_config["session_resumption"] = {"handle": handle}
+            return client.aio.live.connect(model=MODEL_ID, config=reconnect_config)
+
+        def on_upstream_event(state, details):
+            print(f"[PROXY] Session {session_id} upstream {state}: {details}")
+            sys.stdout.flush()
+            if state == "reconnecting":
+                # Недоговоренный ход модели уже не продолжится
+                metrics.turn_ended()
+                transcripts.end_turn()
+            elif state == "resumed":
+                metrics.reconnected(details["gap_ms"] / 1000)
+            elif state == "failed":
+                metrics.reconnect_failed()
+            status = {"state": state}
+            if "gap_ms" in details:
+                status["gap_ms"] = details["gap_ms"]
+            outbound.put_control(json.dumps({"serverContent": {"upstreamStatus": status}}))
+
+        link = UpstreamLink(
+            reconnect,
+            handle=resumption_handle,
+            max_attempts=UPSTREAM_RECONNECT_ATTEMPTS,
+            max_gap_bytes=UPSTREAM_GAP_BUFFER_MS * MODEL_INPUT_RATE * 2 // 1000,
+            on_event=on_upstream_event,
+            connection=connection,
+        )
+
+        # session - это обертка над сессией Gemini, которая сама переподключается
+        async with link as session:
+            connect_seconds = time.monotonic() - connect_started
+            metrics.connected(connect_seconds, resumed=bool(resumption_handle))
+            await resumption_store.claim(client_session_id, WORKER_ID)
+            if session_pool and not from_pool:
+                session_pool.record_cold_connect(connect_seconds)
             print("[PROXY] Successfully connected to Gemini Live API!")
             # Уведомляем фронтенд о готовности
-            await websocket.send_text(json.dumps({"server_content": {"setup_complete": {}}}))
+            setup_complete = json.dumps({"server_content": {"setup_complete": {"audio_framing": framing, "audio_codec": codec.name, "session_id": client_session_id}}})
+            await websocket.send_text(setup_complete)
+            if recorder:
+                recorder.record(CLIENT_OUT, setup_complete)
             sys.stdout.flush()
 
             # --- ЗАДАЧА 1: Google -> Клиент ---
-            async def google_to_client():
-                try:
-                    async for message in session.receive():
-                        if message.server_content and message.server_content.model_turn:
-                            parts = message.server_content.model_turn.parts
-                            
-                            response_data = {
-                                "serverContent": {
-                                    "modelTurn": {
-                                        "parts": []
-                                    }
-                                }
+            # Чтение из Gemini только ставит сообщения в очередь; отправкой занимается писатель
+            outbound = OutboundQueue(
+                websocket,
+                max_audio_bytes=OUTBOUND_MAX_AUDIO_BYTES,
+                overflow=OUTBOUND_OVERFLOW,
+                on_send=metrics.downstream,
+                on_message=(lambda message: recorder.record(CLIENT_OUT, message)) if recorder else None,
+            )
+            transcripts = TranscriptAggregator(outbound.put_control, interval_ms=TRANSCRIPT_INTERVAL_MS)
+
+            async def relay_server_message(message):
+                if recorder:
+                    recorder.mark(GEMINI_IN, *server_message_flags(message))
+                # Передаем прерывание (интеррапт) первым и выбрасываем устаревшее аудио
+                if message.server_content and message.server_content.interrupted:
+                    metrics.interrupted()
+                    outbound.interrupt()
+                    transcripts.end_turn(OUTPUT)
+                    outbound.put_control(json.dumps({
+                        "serverContent": {
+                            "interrupted": True
+                        }
+                    }))
+
+                if message.server_content and message.server_content.model_turn:
+                    # Модель начала отвечать: реплика пользователя закончена
+                    transcripts.model_output()
+                    parts = message.server_content.model_turn.parts
+                    
+                    response_data = {
+                        "serverContent": {
+                            "modelTurn": {
+                                "parts": []
                             }
-                            
-                            for part in parts:
-                                part_dict = {}
-                                
-                                # Фильтруем "мысли" агента (текст в двойных звездочках или тех. заголовки)
-                                if part.text:
-                                    clean_text = part.text.strip()
-                                    if clean_text.startswith("**") and clean_text.endswith("**"):
-                                        continue
-                                    if "Initiating" in clean_text or "formulating" in clean_text.lower():
-                                        continue
-                                    part_dict["text"] = part.text
-                                
-                                if part.inline_data:
-                                    part_dict["inlineData"] = {
-                                        "data": base64.b64encode(part.inline_data.data).decode("utf-8"),
-                                        "mimeType": part.inline_data.mime_type
-                                    }
-                                
-                                if part_dict:
-                                    response_data["serverContent"]["modelTurn"]["parts"].append(part_dict)
-                            
-                            if response_data["serverContent"]["modelTurn"]["parts"]:
-                                await websocket.send_text(json.dumps(response_data))
+                        }
+                    }
+                    
+                    for part in parts:
+                        part_dict = {}
                         
-                        # Передаем транскрипцию пользовательской речи
-                        if message.server_content and message.server_content.input_transcription:
-                            await websocket.send_text(json.dumps({
-                                "serverContent": {
-                                    "inputTranscription": {
-                                        "text": message.server_content.input_transcription.text
-                                    }
-                                }
-                            }))
+                        # Фильтруем "мысли" агента (текст в двойных звездочках или тех. заголовки)
+                        if part.text:
+                            if is_thought(part.text):
+                                continue
+                            part_dict["text"] = part.text
                         
-                        # Передаем прерывание (интеррапт)
-                        if message.server_content and message.server_content.interrupted:
-                            await websocket.send_text(json.dumps({
-                                "serverContent": {
-                                    "interrupted": True
-                                }
-                            }))
+                        if part.inline_data:
+                            metrics.model_audio()
+
+                        if part.inline_data and binary_audio:
+                            rate = rate_from_mime(part.inline_data.mime_type, 24000)
+                            payload = await codec.encode(part.inline_data.data, rate)
+                            if payload:
+                                await outbound.put_audio(pack_audio(payload, rate, codec.codec_id))
+                        elif part.inline_data:
+                            part_dict["inlineData"] = {
+                                "data": base64.b64encode(part.inline_data.data).decode("utf-8"),
+                                "mimeType": part.inline_data.mime_type
+                            }
                         
-                        # Передаем токены возобновления сессии клиенту
-                        if message.session_resumption_update:
-                            update = message.session_resumption_update
-                            if update.new_handle:
-                                print(f"[PROXY] Received new resumption handle: {update.new_handle[:10]}...")
-                                await websocket.send_text(json.dumps({
-                                    "serverContent": {
-                                        "resumptionToken": update.new_handle
-                                    }
-                                }))
+                        if part_dict:
+                            response_data["serverContent"]["modelTurn"]["parts"].append(part_dict)
+                    
+                    if response_data["serverContent"]["modelTurn"]["parts"]:
+                        await outbound.put_audio(json.dumps(response_data))
+
+                # Транскрипции копятся по ходам и отправляются с ограниченной частотой
+                if message.server_content and message.server_content.input_transcription:
+                    if vad is None:
+                        # Без VAD конец речи оцениваем по последнему фрагменту транскрипции
+                        metrics.speech_ended()
+                    transcripts.add(INPUT, message.server_content.input_transcription.text)
+
+                if message.server_content and message.server_content.output_transcription:
+                    transcripts.model_output()
+                    transcripts.add(OUTPUT, message.server_content.output_transcription.text)
 
+                if message.server_content and message.server_content.turn_complete:
+                    metrics.turn_ended()
+                    transcripts.end_turn()
+                
+                # Передаем токены возобновления сессии клиенту
+                if message.session_resumption_update:
+                    update = message.session_resumption_update
+                    if update.new_handle:
+                        print(f"[PROXY] Received new resumption handle: {update.new_handle[:10]}...")
+                        metrics.resumption_update()
+                        await resumption_store.put_handle(client_session_id, update.new_handle)
+                        outbound.put_control(json.dumps({
+                            "serverContent": {
+                                "resumptionToken": update.new_handle
+                            }
+                        }))
+
+            async def google_to_client():
+                try:
+                    # Обертка читает все ходы подряд и переживает переподключения
+                    async for message in session.receive():
+                        await relay_server_message(message)
+
+                except UpstreamLost as e:
+                    # Восстановить сессию не удалось: закрываем сокет, браузер переподключится сам
+                    print(f"[ERROR] google_to_client: {e}")
+                    sys.stdout.flush()
+                    outbound.close()
+                    await writer
+                    await websocket.close(code=1011)
                 except Exception as e:
                     print(f"[ERROR] google_to_client error: {e}")
                     sys.stdout.flush()
+                finally:
+                    outbound.close()
 
             # --- ЗАДАЧА 2: Клиент -> Google ---
+            # Браузер пишет в 24 кГц, модель ждет 16 кГц: приводим частоту на сервере
+            normalizer = AudioNormalizer()
+
+            async def send_audio(data):
+                if recorder:
+                    recorder.mark(UPSTREAM_OUT, FLAG_AUDIO, len(data))
+                await session.send_realtime_input(audio={
+                    "data": data,
+                    "mime_type": normalizer.mime_type
+                })
+
+            async def send_audio_end():
+                # Пользователь замолчал: сообщаем модели, что аудиопоток прервался
+                if recorder:
+                    recorder.mark(UPSTREAM_OUT, FLAG_STREAM_END)
+                await session.send_realtime_input(audio_stream_end=True)
+
+            upstream = UpstreamAudioBuffer(
+                send_audio,
+                send_end=send_audio_end,
+                sample_rate=normalizer.target_rate,
+                frame_ms=UPSTREAM_FRAME_MS,
+                max_delay_ms=UPSTREAM_MAX_DELAY_MS,
+                max_buffer_ms=UPSTREAM_MAX_BUFFER_MS,
+                overflow=UPSTREAM_OVERFLOW,
+            )
+            vad = vad_from_setup(setup.get("vad"), VAD_ENABLED, normalizer.target_rate)
+
+            async def send_video(jpeg):
+                if recorder:
+                    recorder.mark(UPSTREAM_OUT, FLAG_VIDEO, len(jpeg))
+                await session.send_realtime_input(video={"data": jpeg, "mime_type": "image/jpeg"})
+
+            # Размер и качество кадров браузер подстраивает по videoControl: при очереди к Gemini они снижаются
+            video = VideoIngest(
+                send_video,
+                depth_ms=lambda: upstream.depth_bytes // upstream.bytes_per_ms,
+                on_level=lambda target: outbound.put_control(json.dumps({"serverContent": {"videoControl": target}})),
+                max_fps=VIDEO_MAX_FPS,
+                diff_threshold=VIDEO_DIFF_THRESHOLD,
+            )
+            ACTIVE_SESSIONS[session_id] = {
+                "metrics": metrics, "upstream": upstream, "outbound": outbound, "transcripts": transcripts,
+                "video": video, "codec": codec, "upstream_link": link,
+            }
+            if recorder:
+                ACTIVE_SESSIONS[session_id]["recorder"] = recorder
+            if vad:
+                ACTIVE_SESSIONS[session_id]["vad"] = vad
+
+            async def forward_audio(pcm):
+                if vad is None:
+                    await upstream.put(pcm)
+                    return
+                for audio, ended in vad.process(pcm):
+                    if audio:
+                        await upstream.put(audio)
+                    if ended:
+                        metrics.speech_ended()
+                        upstream.end_stream()
+
+            async def upstream_sender():
+                try:
+                    await upstream.run()
+                except Exception as e:
+                    print(f"[ERROR] upstream sender error: {e}")
+                    sys.stdout.flush()
+
+            async def video_sender():
+                try:
+                    await video.run()
+                except Exception as e:
+                    print(f"[ERROR] video sender error: {e}")
+                    sys.stdout.flush()
+
+            bad_frames = 0
+
+            def skip_bad_frame(error):
+                # Один битый кадр не должен обрывать звонок: пропускаем, в лог пишем только первый
+                nonlocal bad_frames
+                bad_frames += 1
+                if bad_frames == 1:
+                    print(f"[PROXY] Session {session_id} skipping bad frame: {error}")
+                    sys.stdout.flush()
+
             async def client_to_google():
                 try:
                     while True:
-                        data = await websocket.receive_text()
-                        message = json.loads(data)
+                        frame = await websocket.receive()
+                        if frame["type"] == "websocket.disconnect":
+                            raise WebSocketDisconnect(frame.get("code", 1000))
+                        if recorder:
+                            recorder.record(CLIENT_IN, frame["bytes"] if frame.get("bytes") is not None else frame["text"])
+
+                        if frame.get("bytes") is not None:
+                            metrics.upstream(len(frame["bytes"]))
+                            try:
+                                kind, codec_id, rate, payload = unpack_frame(frame["bytes"])
+                            except ValueError as e:
+                                skip_bad_frame(e)
+                                continue
+                            if kind == FRAME_AUDIO:
+                                try:
+                                    pcm = await codec.decode(payload, codec_id, rate)
+                                except Exception as e:
+                                    # Искаженные данные кодека (например, усеченный заголовок ADPCM)
+                                    skip_bad_frame(e)
+                                    continue
+                                if pcm is None:
+                                    # Кодек не тот, что согласован в setup: кадр отбрасываем
+                                    continue
+                                await forward_audio(normalizer.normalize(pcm, rate=rate))
+                            elif kind == FRAME_VIDEO:
+                                # Для кадров поле rate хранит длину миниатюры
+                                video.put(*split_video(payload, rate))
+                            continue
+
+                        metrics.upstream(len(frame["text"]))
+                        message = json.loads(frame["text"])
                         
                         if "realtimeInput" in message:
                             chunks = message["realtimeInput"].get("mediaChunks", [])
                             for chunk in chunks:
-                                if "data" in chunk:
+                                if "data" in chunk and chunk.get("mimeType", "").startswith("image/"):
+                                    thumb = base64.b64decode(chunk["thumb"]) if chunk.get("thumb") else None
+                                    video.put(base64.b64decode(chunk["data"]), thumb)
+                                elif "data" in chunk:
                                     audio_bytes = base64.b64decode(chunk["data"])
-                                    # В новом google-genai передаем аудио как словарь или объект Blob
-                                    await session.send_realtime_input(audio={
-                                        "data": audio_bytes,
-                                        "mime_type": "audio/pcm;rate=16000"
-                                    })
+                                    rate = rate_from_mime(chunk.get("mimeType"), normalizer.default_rate)
+                                    try:
+                                        check_audio(audio_bytes, rate)
+                                    except ValueError as e:
+                                        skip_bad_frame(e)
+                                        continue
+                                    await forward_audio(normalizer.normalize(audio_bytes, rate=rate))
                         
                         elif "client_content" in message:
                             # Обработка текстовых сообщений от клиента (если есть)
                             if "turns" in message["client_content"]:
+                                if recorder:
+                                    recorder.mark(UPSTREAM_OUT, FLAG_TEXT)
                                 await session.send_client_content(
                                     turns=message["client_content"]["turns"],
                                     turn_complete=message["client_content"].get("turn_complete", True)
@@ -173,9 +761,41 @@ async def websocket_endpoint(websocket: WebSocket):
                     print("[PROXY] Client disconnected.")
                 except Exception as e:
                     print(f"[ERROR] client_to_google error: {e}")
+                finally:
+                    upstream.close()
+                    video.close()
                 sys.stdout.flush()
 
-            await asyncio.gather(google_to_client(), client_to_google())
+            try:
+                # Сессия живет, пока подключен браузер: после его ухода чтение из Gemini останавливаем
+                reader = asyncio.create_task(google_to_client())
+                writer = asyncio.create_task(outbound.run())
+                await asyncio.gather(client_to_google(), upstream_sender(), video_sender())
+                reader.cancel()
+                await asyncio.gather(reader, writer, return_exceptions=True)
+            finally:
+                ACTIVE_SESSIONS.pop(session_id, None)
+                transcripts.close()
+                await resumption_store.release(client_session_id, WORKER_ID)
+                print(f"[PROXY] Session {session_id} upstream stats: {upstream.stats()}")
+                print(f"[PROXY] Session {session_id} outbound stats: {outbound.stats()}")
+                print(f"[PROXY] Session {session_id} transcript stats: {transcripts.stats()}")
+                if link.reconnects or link.failed_attempts:
+                    print(f"[PROXY] Session {session_id} reconnect stats: {link.stats()}")
+                if recorder:
+                    recorder.close()
+                    print(f"[PROXY] Session {session_id} recorded: {recorder.stats()}")
+                if codec.name != PCM16 or codec.frames_rejected:
+                    print(f"[PROXY] Session {session_id} codec stats: {codec.stats()}")
+                if video.frames_in:
+                    print(f"[PROXY] Session {session_id} video stats: {video.stats()}")
+                summary = metrics.close()
+                if SESSION_SUMMARY_LOG:
+                    print(f"[PROXY] Session summary: {json.dumps(summary)}")
+                if vad:
+                    print(f"[PROXY] Session {session_id} VAD stats: {vad.stats()}")
+                if bad_frames:
+                    print(f"[PROXY] Session {session_id} skipped {bad_frames} bad frames")
 
     except Exception as e_conn:
         error_msg = str(e_conn)
@@ -186,10 +806,34 @@ async def websocket_endpoint(websocket: WebSocket):
         except:
             pass
 
-if os.path.exists(FRONTEND_DIR):
-    app.mount("/", StaticFiles(directory=FRONTEND_DIR, html=True), name="static")
+@app.get("/config")
+async def get_config():
+    """Provides the browser with the necessary configuration to connect to Gemini."""
+    if not GOOGLE_API_KEY:
+        return JSONResponse({"error": "GOOGLE_API_KEY not set on server"}, status_code=500)
+    return {"api_key": GOOGLE_API_KEY, "model_id": MODEL_ID}
+
+# Фронтенд: сжатые заранее gzip/brotli-варианты, ETag по содержимому, горячие файлы в памяти
+static_assets = StaticAssets(FRONTEND_DIR) if os.path.exists(FRONTEND_DIR) else None
+
+@app.get("/assets")
+async def assets_stats():
+    """Compression and cache statistics of the static frontend."""
+    if not static_assets:
+        return {"enabled": False}
+    return {"enabled": True, **static_assets.stats()}
+
+if static_assets:
+    app.mount("/", static_assets, name="static")
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 5000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    if WEB_CONCURRENCY > 1:
+        if RESUMPTION_STORE == "memory":
+            print("[PROXY] WARNING: RESUMPTION_STORE=memory is not shared between workers.")
+        # Несколько воркеров требуют строку импорта вместо объекта приложения
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=WEB_CONCURRENCY,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
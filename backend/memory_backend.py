@@ -0,0 +1,358 @@
+"""
+Memory backends for the agent's memory tools.
+
+``MemoryBackend`` is the interface ``UserFriendTools`` talks to; the backend
+is chosen with ``MEMORY_BACKEND`` (see ``memory_from_env``):
+
+    mem0   hosted Mem0 through ``AsyncMem0Memory`` (default)
+    local  self-hosted vector memory in ``local_memory.LocalVectorMemory``
+
+Non-blocking access to Mem0:
+
+``MemoryClient.add`` and ``.search`` are synchronous HTTP calls; awaited
+directly from a function tool they stall the agent's event loop, and with it
+the audio pipeline, for a full round trip. ``AsyncMem0Memory`` runs them on a
+small dedicated thread pool (which also bounds concurrency), with a timeout,
+and adds:
+
+* a per-user LRU/TTL cache for searches, invalidated when the user's
+  memories change (a generation counter per user, so invalidation is O(1));
+* write-behind saves: ``save()`` only queues the fact and returns, a
+  background task deduplicates queued facts and sends them to Mem0 in one
+  ``add`` call per user. A batch handed to the thread pool is never sent
+  twice: a slow ``add`` is waited for past the timeout, and ``close()``
+  lets the writer finish instead of cancelling it.
+
+Facts that are still queued are merged into search results for that user,
+so the agent can recall something it was told a moment ago.
+"""
+import abc
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("memory-backend")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text):
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+class _LatencyWindow:
+    """Last ``size`` call durations, for p50/p95 in ``stats()``."""
+
+    def __init__(self, size=200):
+        self._values = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._values.append(seconds)
+
+    def summary(self):
+        if not self._values:
+            return {"p50_ms": None, "p95_ms": None}
+        values = sorted(self._values)
+        return {
+            "p50_ms": round(values[len(values) // 2] * 1000, 1),
+            "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 1),
+        }
+
+
+class MemoryBackend(abc.ABC):
+    """Per-user fact memory used by the agent's tools."""
+
+    @abc.abstractmethod
+    async def search(self, query, user_id):
+        """Returns a list of ``{"memory": text, ...}`` results, or None on failure."""
+
+    @abc.abstractmethod
+    def save(self, fact, user_id):
+        """Stores ``fact`` in the background and returns at once (fire and forget).
+
+        False means the fact was dropped as a duplicate right away; True only
+        means it was accepted, since a backend may still find it a duplicate
+        (or fail to store it) later, after this call has returned.
+        """
+
+    @abc.abstractmethod
+    async def profile(self, user_id, limit=20):
+        """Returns up to ``limit`` of the user's facts as plain strings, newest first."""
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+def memory_texts(result):
+    """Extracts fact strings from a search or listing result of any backend."""
+    if isinstance(result, dict):
+        result = result.get("results", [])
+    texts = []
+    for item in result or []:
+        text = item.get("memory") if isinstance(item, dict) else item
+        if text:
+            texts.append(text)
+    return texts
+
+
+class AsyncMem0Memory(MemoryBackend):
+    """Async, cached, write-behind wrapper around a ``mem0.MemoryClient``."""
+
+    def __init__(
+        self,
+        client,
+        max_concurrency=4,
+        timeout=5.0,
+        cache_size=256,
+        cache_ttl=300.0,
+        flush_delay=0.5,
+        max_batch=20,
+        max_retries=2,
+    ):
+        self.client = client
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.flush_delay = flush_delay
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="mem0")
+        # (user_id, generation, query) -> (expires_at, result)
+        self._cache = OrderedDict()
+        self._generation = {}
+        # user_id -> OrderedDict(normalized fact -> (fact, attempts))
+        self._pending = {}
+        self._recent = {}
+        self._wakeup = None
+        self._writer = None
+        self._closing = False
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.search_timeouts = 0
+        self.search_errors = 0
+        self.saves_queued = 0
+        self.saves_deduplicated = 0
+        self.batches_sent = 0
+        self.save_failures = 0
+        self.saves_dropped = 0
+        self.add_timeouts = 0
+        self._search_latency = _LatencyWindow()
+        self._add_latency = _LatencyWindow()
+
+    async def _call(self, latency, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        future = loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            latency.add(time.monotonic() - started)
+
+    async def _call_to_end(self, latency, fn, *args, **kwargs):
+        """Like ``_call``, but waits past the timeout for the call to finish.
+
+        A write cannot be abandoned: the thread completes it anyway, and
+        sending the batch again would store every fact twice.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        future = loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+        try:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                self.add_timeouts += 1
+                logger.warning(f"Mem0 add still running after {self.timeout}s; waiting for it")
+                return await future
+        finally:
+            latency.add(time.monotonic() - started)
+
+    # --- search ---
+
+    async def search(self, query, user_id):
+        """Returns Mem0 results for ``query`` plus still-queued facts.
+
+        Returns None if Mem0 did not answer within the timeout or failed.
+        """
+        key = (user_id, self._generation.get(user_id, 0), _normalize(query))
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached and cached[0] > now:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return self._with_pending(cached[1], user_id)
+
+        self.cache_misses += 1
+        try:
+            result = await self._call(self._search_latency, self.client.search, query, user_id=user_id)
+        except asyncio.TimeoutError:
+            self.search_timeouts += 1
+            logger.warning(f"Mem0 search timed out after {self.timeout}s")
+            return None
+        except Exception as e:
+            self.search_errors += 1
+            logger.warning(f"Mem0 search failed: {e}")
+            return None
+
+        self._cache[key] = (now + self.cache_ttl, result)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return self._with_pending(result, user_id)
+
+    def _with_pending(self, result, user_id):
+        pending = self._pending.get(user_id)
+        if not pending:
+            return result
+        extra = [{"memory": fact, "pending": True} for fact, _ in pending.values()]
+        if isinstance(result, dict) and "results" in result:
+            return {**result, "results": list(result["results"]) + extra}
+        return list(result or []) + extra
+
+    async def profile(self, user_id, limit=20):
+        """The user's stored facts plus queued ones; [] if Mem0 fails."""
+        try:
+            result = await self._call(self._search_latency, self.client.get_all, user_id=user_id)
+        except Exception as e:
+            logger.warning(f"Mem0 get_all failed: {e!r}")
+            result = []
+        pending = [fact for fact, _ in self._pending.get(user_id, {}).values()]
+        items = result.get("results", []) if isinstance(result, dict) else list(result or [])
+        # Mem0 items carry created_at/updated_at; fall back to the listing order
+        items.sort(key=lambda item: item.get("updated_at") or item.get("created_at") or "", reverse=True)
+        return (pending[::-1] + memory_texts(items))[:limit]
+
+    def invalidate(self, user_id):
+        """Drops cached searches of ``user_id``; stale entries age out of the LRU."""
+        self._generation[user_id] = self._generation.get(user_id, 0) + 1
+
+    # --- write-behind saves ---
+
+    def save(self, fact, user_id):
+        """Queues ``fact`` for Mem0 and returns at once."""
+        key = _normalize(fact)
+        pending = self._pending.setdefault(user_id, OrderedDict())
+        if key in pending or key in self._recent.get(user_id, ()):
+            self.saves_deduplicated += 1
+            return False
+        pending[key] = (fact, 0)
+        self.saves_queued += 1
+        self.invalidate(user_id)
+        self._ensure_writer()
+        self._wakeup.set()
+        return True
+
+    def _ensure_writer(self):
+        if self._writer is None or self._writer.done():
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            if not self._closing:
+                # Let facts told in quick succession join the same batch
+                await asyncio.sleep(self.flush_delay)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Sends every queued fact to Mem0, one batched ``add`` per user."""
+        for user_id in list(self._pending):
+            pending = self._pending[user_id]
+            while pending:
+                batch = list(pending.items())[: self.max_batch]
+                messages = [{"role": "user", "content": fact} for _, (fact, _) in batch]
+                try:
+                    await self._call_to_end(self._add_latency, self.client.add, messages, user_id=user_id)
+                except asyncio.CancelledError:
+                    # The add is already in the executor and will complete: never send it again
+                    for key, _ in batch:
+                        pending.pop(key, None)
+                        self._recent.setdefault(user_id, deque(maxlen=100)).append(key)
+                    raise
+                except Exception as e:
+                    self.save_failures += 1
+                    logger.warning(f"Mem0 add failed ({len(batch)} facts): {e!r}")
+                    for key, (fact, attempts) in batch:
+                        if attempts + 1 > self.max_retries:
+                            pending.pop(key, None)
+                            self.saves_dropped += 1
+                        else:
+                            pending[key] = (fact, attempts + 1)
+                    break
+                self.batches_sent += 1
+                recent = self._recent.setdefault(user_id, deque(maxlen=100))
+                for key, _ in batch:
+                    pending.pop(key, None)
+                    recent.append(key)
+                # The new memories are in Mem0 now: cached searches are stale
+                self.invalidate(user_id)
+            if not pending:
+                del self._pending[user_id]
+        if any(self._pending.values()):
+            # Retry what failed on the next pass
+            self._wakeup.set()
+
+    async def close(self):
+        """Flushes queued facts and stops the writer and the thread pool."""
+        self._closing = True
+        if self._writer:
+            # Not cancelled: the writer finishes the batch it has handed to the executor
+            self._wakeup.set()
+            await self._writer
+            self._writer = None
+        # Facts queued while the writer was finishing its last pass
+        await self.flush()
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "cache_entries": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": round(self.cache_hits / lookups, 3) if lookups else 0.0,
+            "search_timeouts": self.search_timeouts,
+            "search_errors": self.search_errors,
+            "search_latency": self._search_latency.summary(),
+            "add_latency": self._add_latency.summary(),
+            "saves_queued": self.saves_queued,
+            "saves_deduplicated": self.saves_deduplicated,
+            "saves_pending": sum(len(p) for p in self._pending.values()),
+            "batches_sent": self.batches_sent,
+            "save_failures": self.save_failures,
+            "saves_dropped": self.saves_dropped,
+            "add_timeouts": self.add_timeouts,
+        }
+
+
+def memory_from_env():
+    """Builds the backend selected by ``MEMORY_BACKEND``."""
+    backend = os.getenv("MEMORY_BACKEND", "mem0")
+    if backend == "local":
+        from local_memory import LocalVectorMemory
+
+        return LocalVectorMemory(
+            os.getenv("MEMORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_data")),
+            dim=int(os.getenv("MEMORY_DIM", 256)),
+        )
+    if backend == "mem0":
+        from mem0 import MemoryClient
+
+        # Assumes MEM0_API_KEY is in the environment
+        return AsyncMem0Memory(
+            MemoryClient(),
+            max_concurrency=int(os.getenv("MEM0_MAX_CONCURRENCY", 4)),
+            timeout=float(os.getenv("MEM0_TIMEOUT", 5.0)),
+            cache_ttl=float(os.getenv("MEM0_CACHE_TTL", 300)),
+        )
+    raise ValueError(f"Unknown MEMORY_BACKEND: {backend}")
@@ -0,0 +1,259 @@
+"""
+Latency and throughput instrumentation for the WebSocket proxy.
+
+Metrics are plain counters and fixed-bucket histograms rendered in the
+Prometheus text format by ``render_prometheus()``. ``SessionMetrics`` is the
+per-session recorder used by the relay loops: every hook is a few integer
+additions or one bisect, so it can run on every chunk.
+"""
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+GAP_BUCKETS = (0.005, 0.01, 0.02, 0.04, 0.08, 0.16, 0.32, 0.64, 1.28, 2.56)
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)
+
+_REGISTRY = []
+
+
+class Counter:
+    """Monotonic counter; one instance is one series (name plus fixed labels)."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+        _REGISTRY.append(self)
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge:
+    """Series whose value is read from a callable at scrape time.
+
+    ``kind="counter"`` exposes a monotonic value kept elsewhere (for example
+    in the session pool) as a counter.
+    """
+
+    def __init__(self, name, help, read, labels=None, kind="gauge"):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self._read = read
+        _REGISTRY.append(self)
+
+    def samples(self):
+        yield self.name, self.labels, self._read()
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``observe`` is one bisect and two additions."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        _REGISTRY.append(self)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield self.name + "_bucket", {**self.labels, "le": repr(float(bound))}, cumulative
+        yield self.name + "_bucket", {**self.labels, "le": "+Inf"}, self.count
+        yield self.name + "_sum", self.labels, self.sum
+        yield self.name + "_count", self.labels, self.count
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return "{" + inner + "}"
+
+
+def render_prometheus():
+    """Renders every registered metric in the Prometheus text format."""
+    lines = []
+    described = set()
+    for metric in _REGISTRY:
+        if metric.name not in described:
+            described.add(metric.name)
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+SESSIONS_TOTAL = Counter("proxy_sessions_total", "Proxied sessions started")
+CONNECT_SECONDS = Histogram(
+    "proxy_upstream_connect_seconds", "Time to open the Gemini live session", LATENCY_BUCKETS
+)
+FIRST_AUDIO_SECONDS = Histogram(
+    "proxy_first_audio_latency_seconds",
+    "Time from the end of user speech to the first model audio byte",
+    LATENCY_BUCKETS,
+)
+CHUNK_GAP_SECONDS = Histogram(
+    "proxy_downstream_chunk_gap_seconds",
+    "Gap between consecutive model audio chunks within a turn",
+    GAP_BUCKETS,
+)
+SESSION_SECONDS = Histogram(
+    "proxy_session_duration_seconds", "Duration of proxied sessions", DURATION_BUCKETS
+)
+BYTES_UP = Counter("proxy_bytes_total", "Bytes relayed", {"direction": "upstream"})
+BYTES_DOWN = Counter("proxy_bytes_total", "Bytes relayed", {"direction": "downstream"})
+MESSAGES_UP = Counter("proxy_messages_total", "Messages relayed", {"direction": "upstream"})
+MESSAGES_DOWN = Counter("proxy_messages_total", "Messages relayed", {"direction": "downstream"})
+INTERRUPTIONS = Counter("proxy_interruptions_total", "Model turns interrupted by the user")
+RESUMPTION_UPDATES = Counter(
+    "proxy_resumption_events_total", "Session resumption events", {"event": "handle_update"}
+)
+RESUMED_SESSIONS = Counter(
+    "proxy_resumption_events_total", "Session resumption events", {"event": "resumed"}
+)
+UPSTREAM_RECONNECTS = Counter(
+    "proxy_upstream_reconnects_total", "Gemini sessions re-established behind an open browser socket", {"result": "ok"}
+)
+UPSTREAM_RECONNECT_FAILURES = Counter(
+    "proxy_upstream_reconnects_total", "Gemini sessions re-established behind an open browser socket", {"result": "failed"}
+)
+UPSTREAM_GAP_SECONDS = Histogram(
+    "proxy_upstream_gap_seconds", "Time without a Gemini session while reconnecting", LATENCY_BUCKETS
+)
+
+
+class SessionMetrics:
+    """Per-session recorder that also feeds the process-wide metrics."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.started = time.monotonic()
+        self.connect_seconds = None
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.messages_up = 0
+        self.messages_down = 0
+        self.interruptions = 0
+        self.resumption_updates = 0
+        self.resumed = False
+        self.reconnects = 0
+        self.max_reconnect_gap = 0.0
+        self.first_audio_latencies = []
+        self.max_chunk_gap = 0.0
+        self._speech_end_at = None
+        self._last_audio_at = None
+        SESSIONS_TOTAL.inc()
+
+    def connected(self, seconds, resumed=False):
+        self.connect_seconds = seconds
+        CONNECT_SECONDS.observe(seconds)
+        if resumed:
+            self.resumed = True
+            RESUMED_SESSIONS.inc()
+
+    def upstream(self, nbytes):
+        self.bytes_up += nbytes
+        self.messages_up += 1
+        BYTES_UP.inc(nbytes)
+        MESSAGES_UP.inc()
+
+    def downstream(self, nbytes):
+        self.bytes_down += nbytes
+        self.messages_down += 1
+        BYTES_DOWN.inc(nbytes)
+        MESSAGES_DOWN.inc()
+
+    def speech_ended(self, at=None):
+        """Marks the end of user speech; the next model audio closes the interval."""
+        self._speech_end_at = at if at is not None else time.monotonic()
+
+    def model_audio(self):
+        now = time.monotonic()
+        if self._speech_end_at is not None:
+            latency = now - self._speech_end_at
+            self._speech_end_at = None
+            FIRST_AUDIO_SECONDS.observe(latency)
+            if len(self.first_audio_latencies) < 1000:
+                self.first_audio_latencies.append(latency)
+        if self._last_audio_at is not None:
+            gap = now - self._last_audio_at
+            CHUNK_GAP_SECONDS.observe(gap)
+            if gap > self.max_chunk_gap:
+                self.max_chunk_gap = gap
+        self._last_audio_at = now
+
+    def turn_ended(self):
+        self._last_audio_at = None
+
+    def interrupted(self):
+        self.interruptions += 1
+        self._last_audio_at = None
+        INTERRUPTIONS.inc()
+
+    def resumption_update(self):
+        self.resumption_updates += 1
+        RESUMPTION_UPDATES.inc()
+
+    def reconnected(self, gap_seconds):
+        self.reconnects += 1
+        self.max_reconnect_gap = max(self.max_reconnect_gap, gap_seconds)
+        UPSTREAM_RECONNECTS.inc()
+        UPSTREAM_GAP_SECONDS.observe(gap_seconds)
+
+    def reconnect_failed(self):
+        UPSTREAM_RECONNECT_FAILURES.inc()
+
+    def close(self):
+        """Records the session duration and returns a summary dict."""
+        duration = time.monotonic() - self.started
+        SESSION_SECONDS.observe(duration)
+        latencies = sorted(self.first_audio_latencies)
+        return {
+            "session_id": self.session_id,
+            "duration_s": round(duration, 1),
+            "connect_ms": round(self.connect_seconds * 1000, 1) if self.connect_seconds is not None else None,
+            "first_audio_ms_p50": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            "first_audio_ms_max": round(latencies[-1] * 1000, 1) if latencies else None,
+            "max_chunk_gap_ms": round(self.max_chunk_gap * 1000, 1),
+            "bytes_up": self.bytes_up,
+            "bytes_down": self.bytes_down,
+            "messages_up": self.messages_up,
+            "messages_down": self.messages_down,
+            "interruptions": self.interruptions,
+            "resumption_updates": self.resumption_updates,
+            "resumed": self.resumed,
+            "reconnects": self.reconnects,
+            "max_reconnect_gap_ms": round(self.max_reconnect_gap * 1000, 1),
+        }
+
+    def stats(self):
+        return {
+            "connect_ms": round(self.connect_seconds * 1000, 1) if self.connect_seconds is not None else None,
+            "bytes_up": self.bytes_up,
+            "bytes_down": self.bytes_down,
+            "messages_up": self.messages_up,
+            "messages_down": self.messages_down,
+            "interruptions": self.interruptions,
+        }
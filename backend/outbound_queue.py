@@ -0,0 +1,177 @@
+"""
+Per-session outbound queue between Gemini and the browser socket.
+
+Sending to the browser inline while iterating ``session.receive()`` lets one
+slow client stall the read from Gemini. ``OutboundQueue`` decouples the two:
+the relay loop only enqueues, and a dedicated writer task drains the queue.
+Control messages (interruption, transcription, resumption tokens) always go
+out before queued model audio, and ``interrupt()`` discards the audio that
+became stale when the user barged in.
+"""
+import asyncio
+import time
+from collections import deque
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DISCONNECT = "disconnect"
+
+OVERFLOW_POLICIES = (
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_BLOCK,
+    OVERFLOW_DISCONNECT,
+)
+
+
+class OutboundQueue:
+    """Bounded two-lane queue drained by a single writer task.
+
+    Messages are ``str`` (sent as text frames) or ``bytes`` (binary frames).
+    The audio lane holds model output and is capped at ``max_audio_bytes``;
+    ``overflow`` decides what happens when it is full. The control lane is
+    small by nature and is not capped. ``on_send`` is called with the size
+    of every message actually delivered, ``on_message`` with the message.
+    """
+
+    def __init__(
+        self, websocket, max_audio_bytes=1_000_000, overflow=OVERFLOW_DROP_OLDEST, on_send=None, on_message=None
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.websocket = websocket
+        self._on_send = on_send
+        self._on_message = on_message
+        self.max_audio_bytes = max_audio_bytes
+        self.overflow = overflow
+
+        self._control = deque()
+        self._audio = deque()
+        self._audio_bytes = 0
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._closed = False
+
+        self.control_sent = 0
+        self.audio_sent = 0
+        self.bytes_sent = 0
+        self.max_depth_bytes = 0
+        self.dropped_messages = 0
+        self.interrupt_discarded = 0
+        self.max_send_seconds = 0.0
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put_control(self, message):
+        """Queues a control message; it overtakes any queued audio."""
+        if self._closed:
+            return
+        self._control.append(message)
+        self._ready.set()
+
+    async def put_audio(self, message):
+        """Queues model output, applying the overflow policy when full."""
+        if self._closed:
+            return
+        size = len(message)
+        while self._audio and self._audio_bytes + size > self.max_audio_bytes:
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                _, dropped = self._audio.popleft()
+                self._audio_bytes -= dropped
+                self.dropped_messages += 1
+            elif self.overflow == OVERFLOW_DROP_NEWEST:
+                self.dropped_messages += 1
+                return
+            elif self.overflow == OVERFLOW_BLOCK:
+                self._space.clear()
+                await self._space.wait()
+                if self._closed:
+                    return
+            else:
+                self.dropped_messages += 1
+                self.close()
+                try:
+                    await self.websocket.close(code=1013)
+                except Exception:
+                    pass
+                return
+
+        self._audio.append((message, size))
+        self._audio_bytes += size
+        if self._audio_bytes > self.max_depth_bytes:
+            self.max_depth_bytes = self._audio_bytes
+        self._ready.set()
+
+    def interrupt(self):
+        """Discards queued model audio, e.g. when the model was interrupted."""
+        self.interrupt_discarded += len(self._audio)
+        self._audio.clear()
+        self._audio_bytes = 0
+        self._space.set()
+
+    async def run(self):
+        """Writer task: sends queued messages until closed and drained."""
+        while True:
+            if self._control:
+                message = self._control.popleft()
+                control = True
+            elif self._audio:
+                message, size = self._audio.popleft()
+                self._audio_bytes -= size
+                self._space.set()
+                control = False
+            elif self._closed:
+                return
+            else:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            started = time.monotonic()
+            try:
+                if isinstance(message, str):
+                    await self.websocket.send_text(message)
+                else:
+                    await self.websocket.send_bytes(message)
+            except Exception:
+                # The browser is gone; nothing else can be delivered
+                self.close()
+                self._control.clear()
+                self.interrupt()
+                return
+            elapsed = time.monotonic() - started
+            if elapsed > self.max_send_seconds:
+                self.max_send_seconds = elapsed
+
+            self.bytes_sent += len(message)
+            if self._on_send:
+                self._on_send(len(message))
+            if self._on_message:
+                self._on_message(message)
+            if control:
+                self.control_sent += 1
+            else:
+                self.audio_sent += 1
+
+    def close(self):
+        """Stops accepting messages; ``run()`` returns once the queue is drained."""
+        self._closed = True
+        self._ready.set()
+        self._space.set()
+
+    def stats(self):
+        return {
+            "control_depth": len(self._control),
+            "audio_depth": len(self._audio),
+            "audio_depth_bytes": self._audio_bytes,
+            "max_audio_depth_bytes": self.max_depth_bytes,
+            "control_sent": self.control_sent,
+            "audio_sent": self.audio_sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped_messages": self.dropped_messages,
+            "interrupt_discarded": self.interrupt_discarded,
+            "max_send_ms": round(self.max_send_seconds * 1000, 1),
+        }
@@ -0,0 +1,177 @@
+"""
+Result cache for WebAgent: extracted page text and search results.
+
+Entries are keyed by a normalized URL (``normalize_url``) or query
+(``normalize_query``), expire after ``ttl`` seconds and are evicted
+least-recently-used beyond ``max_entries``. With ``path`` set the cache is
+loaded from a JSON file at startup and written back (atomically) by
+``flush()``, so answers survive a restart. ``put()`` does not write: the
+file is flushed ``flush_delay`` seconds after the first change, so a burst
+of fetches costs one write, and by ``close()``.
+
+Each entry remembers roughly how many bytes fetching it cost; ``stats()``
+reports hits, misses and the bytes that hits did not have to download.
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|yclid|_openstat|ref)$")
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_url(url):
+    """Same page, same key: lowercases the host, drops fragments and tracking parameters."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if parts.port and (parts.scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(k))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(query), ""))
+
+
+def normalize_query(text):
+    """Case, punctuation and spacing do not matter: "Weather in Moscow?" == "weather  in moscow"."""
+    return " ".join(_NON_WORD.sub(" ", text.casefold()).split())
+
+
+class PageCache:
+    def __init__(self, max_entries=256, ttl=300, path=None, flush_delay=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.flush_delay = flush_delay
+        self._entries = OrderedDict()  # key -> (expires_at, value, cost_bytes)
+        self._dirty = False
+        self._write_lock = threading.Lock()
+        self._flush_timer = None
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+        if path:
+            self._load()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value, cost = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            self._dirty = True
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_saved += cost
+        return value
+
+    def put(self, key, value, cost_bytes=0):
+        self._entries[key] = (time.time() + self.ttl, value, cost_bytes)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._dirty = True
+        self._schedule_flush()
+
+    def clear(self):
+        self._entries.clear()
+        self._dirty = True
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                rows = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[CACHE] Ignoring unreadable cache file {self.path}: {e}")
+            return
+        now = time.time()
+        for key, expires_at, value, cost in rows[-self.max_entries:]:
+            if expires_at > now:
+                self._entries[key] = (expires_at, value, cost)
+
+    def _snapshot(self):
+        now = time.time()
+        self._dirty = False
+        return [[key, expires_at, value, cost] for key, (expires_at, value, cost) in self._entries.items() if expires_at > now]
+
+    def _write(self, rows):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._write_lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def save(self):
+        """Writes live entries to ``path`` if anything changed."""
+        if self.path and self._dirty:
+            self._write(self._snapshot())
+
+    async def flush(self):
+        """Like ``save()``, with the file write off the event loop."""
+        if self.path and self._dirty:
+            await asyncio.to_thread(self._write, self._snapshot())
+
+    def _schedule_flush(self):
+        if not self.path or (self._flush_timer and not self._flush_timer.done()):
+            return
+        try:
+            self._flush_timer = asyncio.get_running_loop().create_task(self._flush_later())
+        except RuntimeError:
+            pass  # no running loop: save() or close() writes the file
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self.flush()
+        except OSError as e:
+            print(f"[CACHE] Writing {self.path} failed: {e}")
+
+    async def close(self):
+        """Writes pending changes now instead of waiting for the timer."""
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        await self.flush()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+_shared = None
+
+
+def shared_cache():
+    """The process-wide cache, configured from ``WEB_CACHE_*``."""
+    global _shared
+    if _shared is None:
+        _shared = PageCache(
+            max_entries=int(os.getenv("WEB_CACHE_SIZE", 256)),
+            ttl=int(os.getenv("WEB_CACHE_TTL", 300)),
+            path=os.getenv("WEB_CACHE_PATH") or None,
+        )
+    return _shared
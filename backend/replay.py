@@ -0,0 +1,253 @@
+"""
+Replays a recorded session (see session_recorder.py) through the proxy.
+
+The browser's frames from the recording are sent again, in order, to a proxy
+running against the local fake Gemini backend (fake_live.py), either at the
+original pacing (``--speed 1``, or faster with a larger factor) or as fast as
+possible (``--fast``). The spawned proxy records the replay too, and both
+recordings are broken down into the same stages:
+
+* ``upstream``: a browser audio frame arriving until it is sent to Gemini
+  (resampling, codec, coalescing in the upstream buffer);
+* ``model``: the last audio sent to Gemini until the first audio of the
+  answer (in a replay this is the fake backend's configured latency);
+* ``downstream``: model audio arriving until it is sent to the browser
+  (codec, outbound queue);
+* ``end_to_end``: the end of the user's speech until the first answer audio
+  sent to the browser. The end of speech is the last browser audio that
+  arrived before the stream end the proxy's VAD sent to Gemini. The browser
+  streams the microphone without pause, so without VAD (``VAD_ENABLED`` or
+  ``setup.vad``) the recording has no end of speech and this stage is empty.
+
+Each stage reports count, p50, p95 and max in milliseconds; ``delta_p95_ms``
+shows where the replay differs from the original, i.e. where latency
+accumulated in the proxy rather than in Gemini or on the network.
+
+Examples:
+    python backend/replay.py recordings/20250101-120000-ab12cd34.omrec
+    python backend/replay.py session.omrec --fast --json replay.json
+    python backend/replay.py session.omrec --analyze-only
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from framing import FRAME_AUDIO  # noqa: E402
+from loadgen import percentile, start_server  # noqa: E402
+from session_recorder import (  # noqa: E402
+    CLIENT_IN,
+    CLIENT_OUT,
+    FLAG_AUDIO,
+    FLAG_INTERRUPTED,
+    FLAG_STREAM_END,
+    FLAG_TURN_COMPLETE,
+    GEMINI_IN,
+    KIND_BINARY,
+    KIND_TEXT,
+    UPSTREAM_OUT,
+    read_recording,
+)
+
+STAGES = ("upstream", "model", "downstream", "end_to_end")
+
+
+def is_audio_frame(kind, payload, outgoing):
+    """True for a browser frame (or a frame to the browser) that carries audio."""
+    if kind == KIND_BINARY:
+        return len(payload) > 0 and payload[0] == FRAME_AUDIO
+    if kind == KIND_TEXT:
+        if outgoing:
+            return '"inlineData"' in payload
+        return '"realtimeInput"' in payload and '"image/' not in payload
+    return False
+
+
+def analyze(records):
+    """Per-stage latency samples (seconds) of one recording."""
+    samples = {stage: [] for stage in STAGES}
+    pending_in = []          # browser audio not yet sent to Gemini
+    last_in = None           # last browser audio
+    last_up = None           # last audio (or stream end) sent to Gemini
+    speech_ended = None      # last browser audio before the latest stream end
+    gemini_audio = deque()   # model audio not yet sent to the browser
+    responding = False
+    answer_started_from = None
+    for tap, kind, flags, _, at, payload in records:
+        if tap == CLIENT_IN and is_audio_frame(kind, payload, outgoing=False):
+            pending_in.append(at)
+            last_in = at
+        elif tap == UPSTREAM_OUT and flags & (FLAG_AUDIO | FLAG_STREAM_END):
+            if flags & FLAG_AUDIO and pending_in:
+                samples["upstream"].append(at - pending_in[0])
+                pending_in = []
+            if flags & FLAG_STREAM_END:
+                speech_ended = last_in
+            last_up = at
+        elif tap == GEMINI_IN:
+            if flags & FLAG_AUDIO:
+                gemini_audio.append(at)
+                if not responding:
+                    responding = True
+                    if last_up is not None:
+                        samples["model"].append(at - last_up)
+                    # An answer with no end of speech before it has no end-to-end sample
+                    answer_started_from = speech_ended
+                    speech_ended = None
+            if flags & (FLAG_TURN_COMPLETE | FLAG_INTERRUPTED):
+                responding = False
+        elif tap == CLIENT_OUT and is_audio_frame(kind, payload, outgoing=True):
+            if gemini_audio:
+                samples["downstream"].append(at - gemini_audio.popleft())
+            if answer_started_from is not None:
+                samples["end_to_end"].append(at - answer_started_from)
+                answer_started_from = None
+    return samples
+
+
+def summarize(samples):
+    report = {}
+    for stage, values in samples.items():
+        values = sorted(v * 1000 for v in values)
+        report[stage] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 1) if values else None,
+            "p95_ms": round(percentile(values, 95), 1) if values else None,
+            "max_ms": round(values[-1], 1) if values else None,
+        }
+    return report
+
+
+async def replay(records, url, speed, tail):
+    """Sends the browser's frames again; returns how late each send was (seconds)."""
+    frames = [(at, payload) for tap, kind, _, _, at, payload in records if tap == CLIENT_IN and payload is not None]
+    if not frames:
+        raise SystemExit("The recording has no browser frames")
+    lateness = []
+    async with websockets.connect(url, max_size=None) as ws:
+        (first_at, setup), rest = frames[0], frames[1:]
+        await ws.send(setup)
+        # The original client waited for setup_complete too
+        while True:
+            reply = await ws.recv()
+            if isinstance(reply, str) and "setup_complete" in reply:
+                break
+
+        async def drain():
+            async for _ in ws:
+                pass
+
+        reader = asyncio.create_task(drain())
+        started = time.monotonic()
+        base = rest[0][0] if rest else first_at
+        for at, payload in rest:
+            if speed:
+                due = started + (at - base) / speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                lateness.append(max(0.0, time.monotonic() - due))
+            await ws.send(payload)
+        await asyncio.sleep(tail)
+        reader.cancel()
+    return lateness
+
+
+def newest_recording(directory, timeout=5.0):
+    """The replay's own recording, once the proxy has closed it."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        paths = sorted(glob.glob(os.path.join(directory, "*.omrec")), key=os.path.getmtime)
+        if paths:
+            size = os.path.getsize(paths[-1])
+            time.sleep(0.3)
+            if os.path.getsize(paths[-1]) == size:
+                return paths[-1]
+        time.sleep(0.1)
+    return None
+
+
+def run(args):
+    meta, records = read_recording(args.recording)
+    duration = records[-1][4] if records else 0.0
+    report = {
+        "recording": {**meta, "records": len(records), "duration_s": round(duration, 2)},
+        "original": summarize(analyze(records)),
+    }
+    if args.analyze_only:
+        return report
+
+    record_dir = tempfile.mkdtemp(prefix="omni-replay-")
+    process = None
+    url = args.url
+    if not url:
+        process = start_server(args, {"RECORD_SAMPLE_RATE": "1", "RECORD_DIR": record_dir})
+        url = f"ws://127.0.0.1:{args.port}/ws"
+    try:
+        speed = 0 if args.fast else args.speed
+        started = time.monotonic()
+        lateness = asyncio.run(replay(records, url, speed, args.tail))
+        report["replay_wall_s"] = round(time.monotonic() - started, 2)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+
+    late_ms = sorted(x * 1000 for x in lateness)
+    report["pacing"] = {
+        "speed": "fast" if args.fast else args.speed,
+        "late_p95_ms": round(percentile(late_ms, 95), 1) if late_ms else None,
+        "late_max_ms": round(late_ms[-1], 1) if late_ms else None,
+    }
+    replayed = newest_recording(record_dir) if process else None
+    if replayed is None:
+        report["replay"] = None
+        return report
+    _, replay_records = read_recording(replayed)
+    report["replay"] = summarize(analyze(replay_records))
+    report["replay_recording"] = replayed
+    report["delta_p95_ms"] = {
+        stage: round(report["replay"][stage]["p95_ms"] - report["original"][stage]["p95_ms"], 1)
+        if report["replay"][stage]["p95_ms"] is not None and report["original"][stage]["p95_ms"] is not None
+        else None
+        for stage in STAGES
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the proxy")
+    parser.add_argument("recording", help=".omrec file written with RECORD_SAMPLE_RATE > 0")
+    parser.add_argument("--speed", type=float, default=1.0, help="pacing factor: 1 = original timing, 2 = twice as fast")
+    parser.add_argument("--fast", action="store_true", help="send frames as fast as possible")
+    parser.add_argument("--analyze-only", action="store_true", help="only break down the recording itself")
+    parser.add_argument("--url", help="existing proxy to replay against instead of spawning one")
+    parser.add_argument("--port", type=int, default=5066)
+    parser.add_argument("--mode", choices=("echo", "synth"), default="synth", help="fake backend mode")
+    parser.add_argument("--latency-ms", type=int, default=300, help="fake backend response latency")
+    parser.add_argument("--turn-every-ms", type=int, default=4000, help="synth mode: audio per model turn")
+    parser.add_argument("--interrupt-rate", type=float, default=0.0)
+    parser.add_argument("--tail", type=float, default=2.0, help="seconds to keep listening after the last frame")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
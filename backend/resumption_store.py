@@ -0,0 +1,214 @@
+"""
+Shared store for Gemini session resumption state.
+
+The browser identifies itself with a stable ``session_id`` in its setup
+message. The proxy stores the newest resumption handle for that id here, so a
+reconnect can resume the Gemini session even when it lands on a different
+uvicorn worker or instance. The store also records which worker currently
+holds each session, which ``/sessions/workers`` reports for load-balance checks.
+
+Backends:
+    MemoryResumptionStore  one process only (the default, single worker)
+    SQLiteResumptionStore  a SQLite file shared by all workers on one host
+                           (WAL mode needs shared memory, so not on a
+                           network filesystem)
+
+Entries expire ``ttl`` seconds after their last update; Gemini handles are
+not valid much longer than that anyway.
+"""
+import abc
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+
+def worker_id():
+    """Identifies this worker process as ``hostname:pid``."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ResumptionStore(abc.ABC):
+    """Interface of a resumption store; every method is a coroutine."""
+
+    @abc.abstractmethod
+    async def get(self, session_id):
+        """Returns the newest handle for ``session_id`` or None."""
+
+    @abc.abstractmethod
+    async def put_handle(self, session_id, handle):
+        """Stores ``handle`` as the newest one for ``session_id``."""
+
+    @abc.abstractmethod
+    async def claim(self, session_id, worker):
+        """Records that ``worker`` now holds the session."""
+
+    @abc.abstractmethod
+    async def release(self, session_id, worker):
+        """Marks the session idle if ``worker`` still holds it."""
+
+    @abc.abstractmethod
+    async def workers(self):
+        """Returns ``{worker: active session count}`` across all workers."""
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class MemoryResumptionStore(ResumptionStore):
+    def __init__(self, ttl=7200):
+        self.ttl = ttl
+        # session_id -> [handle, worker, active, updated]
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry[3] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    async def get(self, session_id):
+        entry = self._entries.get(session_id)
+        if entry and entry[0] and time.time() - entry[3] <= self.ttl:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    async def put_handle(self, session_id, handle):
+        now = time.time()
+        entry = self._entries.setdefault(session_id, [None, None, False, now])
+        entry[0] = handle
+        entry[3] = now
+
+    async def claim(self, session_id, worker):
+        now = time.time()
+        self._evict(now)
+        entry = self._entries.setdefault(session_id, [None, None, False, now])
+        entry[1] = worker
+        entry[2] = True
+        entry[3] = now
+
+    async def release(self, session_id, worker):
+        entry = self._entries.get(session_id)
+        if entry and entry[1] == worker:
+            entry[2] = False
+            entry[3] = time.time()
+
+    async def workers(self):
+        counts = {}
+        for _, worker, active, _ in self._entries.values():
+            if active:
+                counts[worker] = counts.get(worker, 0) + 1
+        return counts
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class SQLiteResumptionStore(ResumptionStore):
+    """Resumption state in a SQLite file, safe to share between processes on one host.
+
+    Queries run in a worker thread so the event loop never waits on disk.
+    WAL mode lets readers in other workers proceed while one worker writes.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS resumption (
+            session_id TEXT PRIMARY KEY,
+            handle TEXT,
+            worker TEXT,
+            active INTEGER NOT NULL DEFAULT 0,
+            updated REAL NOT NULL
+        )
+    """
+
+    def __init__(self, path, ttl=7200, evict_every=100):
+        self.path = path
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(self.SCHEMA)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _write(self, sql, params):
+        with self._lock:
+            self._db.execute(sql, params)
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._db.execute("DELETE FROM resumption WHERE updated < ?", (time.time() - self.ttl,))
+
+    async def get(self, session_id):
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT handle FROM resumption WHERE session_id = ? AND updated >= ?",
+            (session_id, time.time() - self.ttl),
+        )
+        if rows and rows[0][0]:
+            self.hits += 1
+            return rows[0][0]
+        self.misses += 1
+        return None
+
+    async def put_handle(self, session_id, handle):
+        await asyncio.to_thread(
+            self._write,
+            "INSERT INTO resumption (session_id, handle, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET handle = excluded.handle, updated = excluded.updated",
+            (session_id, handle, time.time()),
+        )
+
+    async def claim(self, session_id, worker):
+        await asyncio.to_thread(
+            self._write,
+            "INSERT INTO resumption (session_id, worker, active, updated) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET worker = excluded.worker, active = 1, "
+            "updated = excluded.updated",
+            (session_id, worker, time.time()),
+        )
+
+    async def release(self, session_id, worker):
+        await asyncio.to_thread(
+            self._write,
+            "UPDATE resumption SET active = 0, updated = ? WHERE session_id = ? AND worker = ?",
+            (time.time(), session_id, worker),
+        )
+
+    async def workers(self):
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT worker, COUNT(*) FROM resumption WHERE active = 1 AND updated >= ? GROUP BY worker",
+            (time.time() - self.ttl,),
+        )
+        return dict(rows)
+
+    async def close(self):
+        with self._lock:
+            self._db.close()
+
+    def stats(self):
+        return {"backend": "sqlite", "path": self.path, "hits": self.hits, "misses": self.misses}
+
+
+def store_from_url(url, ttl=7200):
+    """Builds a store from ``memory`` or ``sqlite:///path/to/file.db``."""
+    if not url or url == "memory":
+        return MemoryResumptionStore(ttl=ttl)
+    if url.startswith("sqlite:///"):
+        return SQLiteResumptionStore(url[len("sqlite:///"):], ttl=ttl)
+    raise ValueError(f"Unknown resumption store: {url}")
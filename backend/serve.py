@@ -0,0 +1,72 @@
+"""
+Single-process deployment: web server and LiveKit agent worker together.
+
+    python backend/serve.py
+
+One asyncio loop runs the FastAPI app from main.py (the frontend, the /ws
+proxy, /config and the health routes) under uvicorn, and the LiveKit worker
+from agent.py. Configuration is loaded once and imports are shared, so the
+process replaces the former ``server.py & agent.py start`` pair.
+
+LiveKit jobs run on the worker's thread executor instead of child processes:
+each job gets its own thread and event loop inside this process, so
+``AGENT_IDLE_JOBS`` pre-warmed jobs cost threads, not interpreters. Without
+``LIVEKIT_URL`` (or with ``AGENT_WORKER=0``) only the web server runs.
+"""
+import asyncio
+import os
+
+import uvicorn
+
+import main
+
+# Рабочий LiveKit в том же процессе (нужен LIVEKIT_URL)
+AGENT_WORKER = os.getenv("AGENT_WORKER", "1") == "1"
+# Сколько заданий агента держать прогретыми (потоки, а не процессы)
+AGENT_IDLE_JOBS = int(os.getenv("AGENT_IDLE_JOBS", 1))
+
+
+def build_worker():
+    from livekit.agents import JobExecutorType, Worker, WorkerOptions
+
+    import agent
+
+    options = WorkerOptions(
+        entrypoint_fnc=agent.entrypoint,
+        prewarm_fnc=agent.prewarm,
+        job_executor_type=JobExecutorType.THREAD,
+        num_idle_processes=AGENT_IDLE_JOBS,
+    )
+    return Worker(options, devmode=False)
+
+
+async def serve():
+    port = int(os.getenv("PORT", 5000))
+    server = uvicorn.Server(uvicorn.Config(main.app, host="0.0.0.0", port=port))
+    tasks = [asyncio.create_task(server.serve(), name="web")]
+
+    worker = None
+    if AGENT_WORKER and os.getenv("LIVEKIT_URL"):
+        worker = build_worker()
+        tasks.append(asyncio.create_task(worker.run(), name="agent"))
+        print("[SERVE] Web server and LiveKit worker share this process.")
+    else:
+        print("[SERVE] LIVEKIT_URL is not set or AGENT_WORKER=0: running the web server only.")
+
+    # uvicorn handles SIGINT/SIGTERM; whichever side stops first stops the other
+    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in done:
+        if task.cancelled():
+            print(f"[SERVE] {task.get_name()} was cancelled.")
+            continue
+        error = task.exception()
+        if error:
+            print(f"[SERVE] {task.get_name()} stopped: {error!r}")
+    server.should_exit = True
+    if worker:
+        await worker.aclose()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -9,6 +9,11 @@ load_dotenv()
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
 CORS(app)
 
+@app.route('/healthz')
+def healthz():
+    """Liveness/readiness probe: nothing here needs warming up."""
+    return jsonify({"status": "ok"})
+
 @app.route('/')
 def index():
     return send_from_directory(app.static_folder, 'index.html')
@@ -32,5 +37,5 @@ def get_config():
 if __name__ == '__main__':
     # Get port from environment variable or use 5000 as default
     port = int(os.environ.get('PORT', 5000))
-    # Run server
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # Run server. Debug mode starts a second, reloading process: only on request
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1')
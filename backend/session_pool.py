@@ -0,0 +1,177 @@
+"""
+Pool of pre-warmed Gemini Live sessions.
+
+Opening a live session is the largest part of time-to-first-audio. The pool
+keeps a few sessions already connected with the default configuration, hands
+one to each new client and refills in the background. Sessions older than
+``ttl`` are closed before the server would drop them, and when no client has
+arrived for ``idle_timeout`` the pool stops holding sessions open until the
+next client shows up.
+"""
+import asyncio
+import time
+
+
+class PooledSession:
+    """An already-open live session, used as ``async with`` like ``connect()``."""
+
+    def __init__(self, connection, session, connect_seconds):
+        self._connection = connection
+        self.session = session
+        self.connect_seconds = connect_seconds
+        self.created_at = time.monotonic()
+
+    async def __aenter__(self):
+        return self.session
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self._connection.__aexit__(exc_type, exc, tb)
+
+    async def close(self):
+        try:
+            await self._connection.__aexit__(None, None, None)
+        except Exception:
+            pass
+
+
+class LiveSessionPool:
+    """Keeps ``size`` live sessions open for the default configuration.
+
+    ``connect`` is a callable returning a fresh ``client.aio.live.connect(...)``
+    context manager for the default model and config.
+    """
+
+    def __init__(self, connect, size=2, ttl=300, idle_timeout=600):
+        self._connect = connect
+        self.size = size
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+
+        self._ready = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._last_demand = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.evicted = 0
+        self.connect_seconds_total = 0.0
+        self.connect_seconds_max = 0.0
+        self.cold_connects = 0
+        self.cold_connect_seconds_total = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refill_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        ready, self._ready = self._ready, []
+        for pooled in ready:
+            await pooled.close()
+
+    def acquire(self):
+        """Returns a warm session, or None if the caller must connect cold."""
+        self._last_demand = time.monotonic()
+        now = time.monotonic()
+        while self._ready:
+            pooled = self._ready.pop(0)
+            if now - pooled.created_at < self.ttl:
+                self.hits += 1
+                self._wakeup.set()
+                return pooled
+            self.evicted += 1
+            asyncio.create_task(pooled.close())
+        self.misses += 1
+        self._wakeup.set()
+        return None
+
+    def record_cold_connect(self, seconds):
+        """Records a connect made by the caller after a miss, for comparison."""
+        self.cold_connects += 1
+        self.cold_connect_seconds_total += seconds
+
+    async def _open(self):
+        started = time.monotonic()
+        connection = self._connect()
+        session = await connection.__aenter__()
+        elapsed = time.monotonic() - started
+        self.connects += 1
+        self.connect_seconds_total += elapsed
+        self.connect_seconds_max = max(self.connect_seconds_max, elapsed)
+        return PooledSession(connection, session, elapsed)
+
+    async def _evict_expired(self):
+        now = time.monotonic()
+        keep = []
+        for pooled in self._ready:
+            if now - pooled.created_at >= self.ttl:
+                self.evicted += 1
+                await pooled.close()
+            else:
+                keep.append(pooled)
+        self._ready = keep
+
+    async def _refill_loop(self):
+        backoff = 1.0
+        while True:
+            await self._evict_expired()
+
+            idle = time.monotonic() - self._last_demand > self.idle_timeout
+            if idle:
+                # Nobody is connecting: release the warm sessions and wait for demand
+                ready, self._ready = self._ready, []
+                for pooled in ready:
+                    self.evicted += 1
+                    await pooled.close()
+            elif len(self._ready) < self.size:
+                try:
+                    self._ready.append(await self._open())
+                    backoff = 1.0
+                    continue
+                except Exception as e:
+                    self.connect_failures += 1
+                    print(f"[POOL] Pre-warm connect failed: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60.0)
+                    continue
+
+            if idle:
+                timeout = None
+            else:
+                # Wake up for the next expiry or when the pool turns idle
+                deadline = self._last_demand + self.idle_timeout
+                if self._ready:
+                    oldest = min(pooled.created_at for pooled in self._ready)
+                    deadline = min(deadline, oldest + self.ttl)
+                timeout = max(0.0, deadline - time.monotonic())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "size": self.size,
+            "ready": len(self._ready),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "connects": self.connects,
+            "connect_failures": self.connect_failures,
+            "evicted": self.evicted,
+            "avg_connect_ms": round(self.connect_seconds_total / self.connects * 1000, 1) if self.connects else 0.0,
+            "max_connect_ms": round(self.connect_seconds_max * 1000, 1),
+            "cold_connects": self.cold_connects,
+            "avg_cold_connect_ms": round(self.cold_connect_seconds_total / self.cold_connects * 1000, 1) if self.cold_connects else 0.0,
+        }
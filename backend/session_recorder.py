@@ -0,0 +1,222 @@
+"""
+Append-only recordings of proxied sessions, for offline replay and analysis.
+
+A recording holds every frame the browser and the proxy exchanged, plus
+timing marks for what the proxy sent to and got from Gemini, each with a
+monotonic timestamp relative to the start of the session:
+
+    magic     8 bytes  b"OMNIREC1"
+    meta      uint32 length + UTF-8 JSON (session id, start time, framing, codec)
+    records   RECORD header, then ``size`` payload bytes unless kind is KIND_MARK
+
+The taps are ``CLIENT_IN`` (browser to proxy), ``UPSTREAM_OUT`` (sent to
+Gemini), ``GEMINI_IN`` (received from Gemini) and ``CLIENT_OUT`` (proxy to
+browser). Marks carry flags (``FLAG_*``) and the size of what they describe,
+but no payload. Comparing the taps shows which stage added the latency (see
+``replay.py``).
+
+``record()`` only appends to an in-memory buffer. Full buffers are written by
+one background thread shared by all sessions, so the event loop never
+touches the disk. If the writer falls behind by more than ``max_pending``
+bytes, or a file reaches ``max_bytes``, further records are dropped and
+counted rather than buffered without limit.
+"""
+import json
+import os
+import queue
+import random
+import struct
+import threading
+import time
+
+MAGIC = b"OMNIREC1"
+META_LENGTH = struct.Struct("<I")
+# tap, kind, flags, payload size, microseconds since the session started
+RECORD = struct.Struct("<BBHIQ")
+
+CLIENT_IN = 0
+UPSTREAM_OUT = 1
+GEMINI_IN = 2
+CLIENT_OUT = 3
+TAP_NAMES = {CLIENT_IN: "client_in", UPSTREAM_OUT: "upstream_out", GEMINI_IN: "gemini_in", CLIENT_OUT: "client_out"}
+
+KIND_TEXT = 0
+KIND_BINARY = 1
+KIND_MARK = 2
+
+FLAG_AUDIO = 1
+FLAG_VIDEO = 2
+FLAG_TEXT = 4
+FLAG_TURN_COMPLETE = 8
+FLAG_INTERRUPTED = 16
+FLAG_STREAM_END = 32
+
+
+class _Writer:
+    """Background thread appending buffered chunks to their files."""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self.pending_bytes = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name="session-recorder", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, data, close=False):
+        with self._lock:
+            self.pending_bytes += len(data)
+        self._queue.put((path, data, close))
+
+    def _run(self):
+        files = {}
+        while True:
+            path, data, close = self._queue.get()
+            try:
+                handle = files.get(path)
+                if handle is None:
+                    handle = files[path] = open(path, "ab")
+                handle.write(data)
+                if close:
+                    files.pop(path).close()
+                self.bytes_written += len(data)
+            except OSError as e:
+                self.errors += 1
+                print(f"[RECORD] Write to {path} failed: {e}")
+            with self._lock:
+                self.pending_bytes -= len(data)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def shared_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _Writer()
+        return _writer
+
+
+class SessionRecorder:
+    def __init__(self, path, meta, buffer_bytes=64 * 1024, max_bytes=50_000_000, max_pending=16_000_000, writer=None):
+        self.path = path
+        self.buffer_bytes = buffer_bytes
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self._writer = writer or shared_writer()
+        self._started = time.monotonic()
+        self._buffer = bytearray(MAGIC)
+        encoded = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        self._buffer += META_LENGTH.pack(len(encoded)) + encoded
+        self._closed = False
+
+        self.records = 0
+        self.bytes = len(self._buffer)
+        self.dropped = 0
+
+    def record(self, tap, data, flags=0):
+        """Records a frame (``str`` or bytes-like) as seen at ``tap``."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+            kind = KIND_TEXT
+        else:
+            kind = KIND_BINARY
+        self._append(tap, kind, flags, len(data), data)
+
+    def mark(self, tap, flags=0, size=0):
+        """Records a timing mark without payload."""
+        self._append(tap, KIND_MARK, flags, size, None)
+
+    def _append(self, tap, kind, flags, size, payload):
+        if self._closed:
+            return
+        length = RECORD.size + (size if payload is not None else 0)
+        if self.bytes + length > self.max_bytes or self._writer.pending_bytes > self.max_pending:
+            self.dropped += 1
+            return
+        micros = int((time.monotonic() - self._started) * 1_000_000)
+        self._buffer += RECORD.pack(tap, kind, flags, size, micros)
+        if payload is not None:
+            self._buffer += payload
+        self.records += 1
+        self.bytes += length
+        if len(self._buffer) >= self.buffer_bytes:
+            self._flush()
+
+    def _flush(self, close=False):
+        if self._buffer or close:
+            self._writer.submit(self.path, bytes(self._buffer), close=close)
+            self._buffer = bytearray()
+
+    def close(self):
+        if not self._closed:
+            self._flush(close=True)
+            self._closed = True
+
+    def stats(self):
+        return {"path": self.path, "records": self.records, "bytes": self.bytes, "dropped": self.dropped}
+
+
+def recorder_for(session_id, meta, directory, sample_rate, max_bytes=50_000_000):
+    """A recorder for a sampled share of sessions (``sample_rate`` 0..1), else None."""
+    if sample_rate <= 0 or random.random() >= sample_rate:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        print(f"[RECORD] Cannot create {directory}: {e}")
+        return None
+    name = time.strftime("%Y%m%d-%H%M%S") + f"-{session_id}.omrec"
+    meta = dict(meta, session_id=session_id, started_at=time.time())
+    return SessionRecorder(os.path.join(directory, name), meta, max_bytes=max_bytes)
+
+
+def read_recording(path):
+    """Returns (meta, records); each record is (tap, kind, flags, size, seconds, payload or None)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session recording")
+    offset = len(MAGIC)
+    (length,) = META_LENGTH.unpack_from(data, offset)
+    offset += META_LENGTH.size
+    meta = json.loads(data[offset:offset + length])
+    offset += length
+    records = []
+    # A recording cut short by a crash ends with a partial record: ignore it
+    while offset + RECORD.size <= len(data):
+        tap, kind, flags, size, micros = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        payload = None
+        if kind != KIND_MARK:
+            if offset + size > len(data):
+                break
+            payload = data[offset:offset + size]
+            if kind == KIND_TEXT:
+                payload = payload.decode("utf-8")
+            offset += size
+        records.append((tap, kind, flags, size, micros / 1_000_000, payload))
+    return meta, records
+
+
+def server_message_flags(message):
+    """FLAG_* bits and audio byte count of a Gemini Live server message."""
+    flags = 0
+    size = 0
+    content = message.server_content
+    if content:
+        if content.model_turn:
+            for part in content.model_turn.parts or ():
+                if part.inline_data:
+                    flags |= FLAG_AUDIO
+                    size += len(part.inline_data.data or b"")
+                elif part.text:
+                    flags |= FLAG_TEXT
+        if content.turn_complete:
+            flags |= FLAG_TURN_COMPLETE
+        if content.interrupted:
+            flags |= FLAG_INTERRUPTED
+    return flags, size
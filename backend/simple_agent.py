@@ -1,6 +1,8 @@
 """
 Simple LiveKit Agent - Direct connection to LiveKit room
-This agent connects to a LiveKit room and responds to user audio
+This agent connects to a LiveKit room and talks to every participant through
+its own streaming Gemini Live session (see livekit_bridge.py), without the
+AgentSession framework.
 """
 
 import os
@@ -8,23 +10,43 @@ import asyncio
 from dotenv import load_dotenv
 from livekit import rtc
 from google import genai
-from google.genai import types
+
+from livekit_bridge import ParticipantBridge
 
 load_dotenv()
 
+MODEL_ID = "models/gemini-2.5-flash-native-audio-preview-12-2025"
+
+SYSTEM_PROMPT = """Ты — добрый и весёлый ИИ-друг для детей по имени Омни-Агент.
+Твоя задача — быть тёплым, поддерживающим и интересным собеседником.
+Говори просто, весело и подбадривающе.
+Твой голос должен выражать эмоции: смейся, меняй интонацию.
+"""
+
 class SimpleLiveKitAgent:
     def __init__(self):
         self.url = os.getenv("LIVEKIT_URL")
         self.api_key = os.getenv("LIVEKIT_API_KEY")
         self.api_secret = os.getenv("LIVEKIT_API_SECRET")
-        self.room_name = "default-room"
+        self.room_name = os.getenv("LIVEKIT_ROOM", "default-room")
         self.participant_name = "omni-agent"
         
         # Initialize Google GenAI client
-        self.client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+        self.client = genai.Client(
+            api_key=os.getenv("GOOGLE_API_KEY"),
+            http_options={'api_version': 'v1alpha'}
+        )
+        self.live_config = {
+            "system_instruction": SYSTEM_PROMPT,
+            "response_modalities": ["AUDIO"],
+            "speech_config": {
+                "voice_config": {"prebuilt_voice_config": {"voice_name": "Puck"}}
+            },
+        }
         
         self.room = None
-        self.audio_track = None
+        # One Gemini Live bridge per remote participant: identity -> ParticipantBridge
+        self.bridges = {}
         
     async def connect(self):
         """Connect to LiveKit room"""
@@ -45,8 +67,9 @@ class SimpleLiveKitAgent:
         print(f"Connected to room: {self.room.name}")
         print(f"Room SID: {await self.room.sid}")
         
-        # Skip audio track publishing for now
-        # await self.publish_audio()
+        # Participants who were already in the room get a bridge too
+        for participant in self.room.remote_participants.values():
+            self._bridge_for(participant)
         
         # Keep running
         print("Agent is running. Press Ctrl+C to stop.")
@@ -54,7 +77,7 @@ class SimpleLiveKitAgent:
         try:
             while True:
                 await asyncio.sleep(1)
-        except KeyboardInterrupt:
+        finally:
             print("\nShutting down...")
             await self.disconnect()
     
@@ -72,90 +95,44 @@ class SimpleLiveKitAgent:
             ))
         return token.to_jwt()
     
-    async def publish_audio(self):
-        """Publish audio track to room"""
-        # Create audio track with required info
-        from livekit.rtc import LocalAudioTrack as LAT
-        # Use the int value for SOURCE_MICROPHONE (2)
-        self.audio_track = LAT.create_audio_track("omni-agent-audio", 2)
-        
-        # Publish to room
-        publication = await self.room.local_participant.publish_track(
-            self.audio_track,
-            2
-        )
-        
-        print(f"Published audio track: {publication.sid}")
+    def _bridge_for(self, participant):
+        """Returns the participant's bridge, starting it on first use."""
+        bridge = self.bridges.get(participant.identity)
+        # A bridge that gave up reconnecting has closed itself: start a new one
+        if bridge is None or bridge.closed:
+            bridge = ParticipantBridge(self.room, participant, self.client, MODEL_ID, self.live_config)
+            bridge.start()
+            self.bridges[participant.identity] = bridge
+            # track_subscribed does not fire again for a track that is already subscribed
+            for publication in participant.track_publications.values():
+                if publication.kind == rtc.TrackKind.KIND_AUDIO and publication.track:
+                    bridge.attach(publication.track)
+        return bridge
     
     def on_track_subscribed_sync(self, track, publication, participant):
         """Synchronous callback for track subscription"""
         print(f"Track subscribed: {track.kind} from {participant.identity}")
         
         if track.kind == rtc.TrackKind.KIND_AUDIO:
-            # Process audio from user in async task
-            asyncio.create_task(self.process_audio(track))
-    
-    async def on_track_subscribed(self, track, publication, participant):
-        """Handle when a track is subscribed"""
-        print(f"Track subscribed: {track.kind} from {participant.identity}")
-        
-        if track.kind == rtc.TrackKind.AUDIO:
-            # Process audio from user
-            await self.process_audio(track)
-    
-    async def process_audio(self, audio_track):
-        """Process audio from user and generate response"""
-        print("Processing audio from user...")
-        
-        # Read audio frames
-        async for frame in audio_track:
-            # Convert audio to text (simplified)
-            # In a real implementation, you would use STT here
-            print(f"Received audio frame: {frame}")
-            
-            # Generate response using Google GenAI
-            response = await self.generate_response("Hello from user")
-            
-            # Send response as audio
-            await self.send_audio_response(response)
-    
-    async def generate_response(self, text):
-        """Generate response using Google GenAI"""
-        print(f"Generating response for: {text}")
-        
-        response = self.client.models.generate_content(
-            model="models/gemini-2.5-flash",
-            contents=text
-        )
-        
-        return response.text
-    
-    async def send_audio_response(self, text):
-        """Send audio response to room"""
-        print(f"Sending audio response: {text}")
-        
-        # In a real implementation, you would convert text to audio here
-        # For now, just log the response
-        pass
+            # Stream the participant's audio into their live session
+            self._bridge_for(participant).attach(track)
     
     def on_participant_connected_sync(self, participant):
         """Synchronous callback for participant connection"""
         print(f"Participant connected: {participant.identity}")
+        self._bridge_for(participant)
     
     def on_participant_disconnected_sync(self, participant):
         """Synchronous callback for participant disconnection"""
         print(f"Participant disconnected: {participant.identity}")
-    
-    async def on_participant_connected(self, participant):
-        """Handle when a participant connects"""
-        print(f"Participant connected: {participant.identity}")
-    
-    async def on_participant_disconnected(self, participant):
-        """Handle when a participant disconnects"""
-        print(f"Participant disconnected: {participant.identity}")
+        bridge = self.bridges.pop(participant.identity, None)
+        if bridge:
+            asyncio.create_task(bridge.close())
     
     async def disconnect(self):
         """Disconnect from room"""
+        bridges, self.bridges = list(self.bridges.values()), {}
+        await asyncio.gather(*(bridge.close() for bridge in bridges), return_exceptions=True)
         if self.room:
             await self.room.disconnect()
             print("Disconnected from room")
@@ -166,4 +143,7 @@ async def main():
     await agent.connect()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nAgent stopped by user.")
@@ -0,0 +1,209 @@
+"""
+Startup benchmark for the service entry points.
+
+For every entry point it measures, in fresh interpreters:
+
+* ``import_ms``: median time to import the module (``--repeat`` runs), and
+  ``import_rss_mb``, the peak RSS of that interpreter;
+* ``slowest_imports``: its direct imports with the largest cumulative import
+  time, from ``python -X importtime``, i.e. what to defer first;
+* for HTTP servers, ``live_ms`` (process start to the first 200 from the
+  liveness route, i.e. the port is bound) and ``ready_ms`` (to the first 200
+  from the readiness route), plus RSS once ready.
+
+The proxy is started with a placeholder ``GOOGLE_API_KEY`` when none is set:
+readiness only needs the SDK imported and the client built, which does not
+touch the network. Entry points whose dependencies are not installed are
+reported with the import error instead of numbers.
+
+``layouts`` compares the single-process deployment (``serve.py``) with the
+two-process one (``server.py`` plus ``agent.py start``). The two-process
+figure is a lower bound: the agent is counted after its imports, and LiveKit
+job processes add to it.
+
+Examples:
+    python backend/startup_bench.py
+    python backend/startup_bench.py --only proxy --repeat 5 --max-ready-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# name -> module, server command (None: import only), liveness path, readiness path
+ENTRY_POINTS = {
+    "proxy": ("main", [sys.executable, "main.py"], "/healthz", "/readyz"),
+    "flask": ("server", [sys.executable, "server.py"], "/healthz", "/healthz"),
+    "agent": ("agent", None, None, None),
+    "serve": ("serve", [sys.executable, "serve.py"], "/healthz", "/readyz"),
+}
+
+
+def bench_env(port):
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "startup-bench-placeholder")
+    env.update({"PORT": str(port), "PYTHONUNBUFFERED": "1", "WEB_CONCURRENCY": "1"})
+    return env
+
+
+def import_once(module, env):
+    code = (
+        f"import resource, time; t = time.perf_counter(); import {module}; "
+        "print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    )
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines() or ["exited with code %d" % result.returncode]
+        raise RuntimeError(lines[-1])
+    seconds, rss_kb = result.stdout.strip().splitlines()[-1].split()
+    return float(seconds), wall, int(rss_kb)
+
+
+def slowest_imports(module, env, limit):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    direct = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # importtime indents nested imports by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            direct.append((int(cumulative), name.strip()))
+    direct.sort(reverse=True)
+    return [{"module": name, "ms": round(us / 1000, 1)} for us, name in direct[:limit]]
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def ok(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+def time_to_ready(command, env, port, live_path, ready_path, timeout):
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    live = ready = None
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline and ready is None:
+            if process.poll() is not None:
+                raise RuntimeError(process.stderr.read().decode(errors="replace").strip().splitlines()[-1])
+            if live is None and ok(f"http://127.0.0.1:{port}{live_path}"):
+                live = time.perf_counter() - started
+            if live is not None and ok(f"http://127.0.0.1:{port}{ready_path}"):
+                ready = time.perf_counter() - started
+            else:
+                time.sleep(0.01)
+        return live, ready, rss_mb(process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def bench(name, args):
+    module, command, live_path, ready_path = ENTRY_POINTS[name]
+    env = bench_env(args.port)
+    report = {"module": module}
+    try:
+        runs = [import_once(module, env) for _ in range(args.repeat)]
+    except RuntimeError as e:
+        report["error"] = str(e)
+        return report
+    report["import_ms"] = round(statistics.median(r[0] for r in runs) * 1000, 1)
+    report["process_ms"] = round(statistics.median(r[1] for r in runs) * 1000, 1)
+    report["import_rss_mb"] = round(statistics.median(r[2] for r in runs) / 1024, 1)
+    report["slowest_imports"] = slowest_imports(module, env, args.top)
+    if command:
+        try:
+            live, ready, rss = time_to_ready(command, env, args.port, live_path, ready_path, args.timeout)
+        except RuntimeError as e:
+            report["error"] = str(e)
+            return report
+        report["live_ms"] = round(live * 1000, 1) if live is not None else None
+        report["ready_ms"] = round(ready * 1000, 1) if ready is not None else None
+        report["rss_mb_ready"] = rss
+    return report
+
+
+def compare_layouts(report):
+    """Single process (serve.py) against server.py + agent.py, when both were measured."""
+    serve, flask, agent = (report.get(name, {}) for name in ("serve", "flask", "agent"))
+    if not serve or not (flask or agent):
+        return None
+    two_process_rss = None
+    if flask.get("rss_mb_ready") is not None and agent.get("import_rss_mb") is not None:
+        two_process_rss = round(flask["rss_mb_ready"] + agent["import_rss_mb"], 1)
+    two_process_ready = None
+    if flask.get("ready_ms") is not None and agent.get("process_ms") is not None:
+        # Both start at once: the slower one decides
+        two_process_ready = max(flask["ready_ms"], agent["process_ms"])
+    return {
+        "single_process": {"rss_mb": serve.get("rss_mb_ready"), "ready_ms": serve.get("ready_ms")},
+        "two_process": {"rss_mb_at_least": two_process_rss, "ready_ms_at_least": two_process_ready},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and time-to-ready of each entry point")
+    parser.add_argument("--only", action="append", choices=sorted(ENTRY_POINTS), help="entry point(s) to measure")
+    parser.add_argument("--repeat", type=int, default=3, help="import runs per entry point (median is reported)")
+    parser.add_argument("--top", type=int, default=8, help="slowest direct imports to list")
+    parser.add_argument("--port", type=int, default=5077)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for readiness")
+    parser.add_argument("--max-ready-ms", type=float, help="exit 1 if a server takes longer to become ready")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = {name: bench(name, args) for name in (args.only or ENTRY_POINTS)}
+    layouts = compare_layouts(report)
+    if layouts:
+        report["layouts"] = layouts
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    failures = []
+    if args.max_ready_ms is not None:
+        for name, result in report.items():
+            if name not in ENTRY_POINTS:
+                continue
+            ready = result.get("ready_ms")
+            if ENTRY_POINTS[name][1] and (ready is None or ready > args.max_ready_ms):
+                failures.append(f"{name}: ready in {ready} ms > {args.max_ready_ms} ms")
+    for failure in failures:
+        print(f"[STARTUP] GATE FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Precompressed, cache-friendly serving of the frontend.
+
+``StaticAssets`` is an ASGI app that replaces ``StaticFiles``. At startup it
+reads every file under the directory once and prepares what requests need:
+
+* gzip and (when the optional ``brotli`` package is installed) brotli
+  variants of compressible files, kept only when they are smaller;
+* a strong ETag per variant, derived from the content hash;
+* HTML with local ``src``/``href`` references rewritten to ``name?v=<hash>``.
+  Those versioned URLs are served ``immutable`` for a year, while unversioned
+  URLs (HTML pages themselves) are ``no-cache`` and revalidate with a 304.
+
+Assets stay in memory up to ``memory_limit`` bytes; the rest is served from
+disk. Compressed variants are cached by content hash in ``cache_dir``, so
+running this module at build time (``python backend/static_assets.py``) lets
+the server start without compressing anything.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import time
+
+from starlette.responses import FileResponse, PlainTextResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "application/manifest+json", "image/svg+xml")
+_REFERENCE = re.compile(r'(\b(?:src|href)=")([^"?#:]+)(")')
+_EXTENSIONS = {".encoded": "identity", ".gz": "gzip", ".br": "br"}
+
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+def _accepted(header):
+    """Encodings the client accepts (q > 0), from an Accept-Encoding header."""
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class _Asset:
+    def __init__(self, url, path, content_type, digest):
+        self.url = url
+        self.path = path
+        self.content_type = content_type
+        self.digest = digest
+        # encoding -> bytes (in memory) or file path (served from disk)
+        self.variants = {}
+
+    def etag(self, encoding):
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+class StaticAssets:
+    def __init__(
+        self,
+        directory,
+        cache_dir=None,
+        memory_limit=32 * 1024 * 1024,
+        min_compress_bytes=512,
+        gzip_level=9,
+        brotli_quality=9,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.cache_dir = cache_dir or os.path.join(self.directory, ".compressed")
+        self.memory_limit = memory_limit
+        self.min_compress_bytes = min_compress_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.assets = {}
+
+        self.memory_bytes = 0
+        self.load_seconds = 0.0
+        self.compressed_at_startup = 0
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.bytes_identity = 0
+        self.by_encoding = {}
+        self.load()
+
+    def _files(self):
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if not name.startswith("."):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, self.directory).replace(os.sep, "/"), path
+
+    def load(self):
+        """Reads and prepares every asset; called once at startup."""
+        started = time.monotonic()
+        raw = {url: path for url, path in self._files()}
+        # HTML last: its references need the hashes of the other files
+        order = sorted(raw, key=lambda url: url.endswith(".html"))
+        for url in order:
+            path = raw[url]
+            with open(path, "rb") as f:
+                body = f.read()
+            content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            if content_type == "text/html":
+                body = self._version_references(url, body.decode("utf-8")).encode("utf-8")
+            self.assets[url] = self._prepare(url, path, content_type, body)
+        self.load_seconds = time.monotonic() - started
+
+    def _version_references(self, url, html):
+        base = os.path.dirname(url)
+
+        def replace(match):
+            target = os.path.normpath(os.path.join(base, match.group(2))).replace(os.sep, "/").lstrip("/")
+            asset = self.assets.get(target)
+            if asset is None:
+                return match.group(0)
+            return f"{match.group(1)}{match.group(2)}?v={asset.digest[:12]}{match.group(3)}"
+
+        return _REFERENCE.sub(replace, html)
+
+    def _prepare(self, url, path, content_type, body):
+        asset = _Asset(url, path, content_type, hashlib.sha256(body).hexdigest()[:20])
+        variants = {"identity": body}
+        if content_type.startswith(COMPRESSIBLE) and len(body) >= self.min_compress_bytes:
+            for encoding in ("gzip", "br"):
+                compressed = self._compressed(asset, body, encoding)
+                if compressed is not None and len(compressed) < len(body):
+                    variants[encoding] = compressed
+
+        for encoding, data in variants.items():
+            if self.memory_bytes + len(data) <= self.memory_limit:
+                asset.variants[encoding] = data
+                self.memory_bytes += len(data)
+            elif encoding == "identity" and os.path.getsize(path) == len(data):
+                asset.variants[encoding] = path
+            else:
+                asset.variants[encoding] = self._write_cache(asset, encoding, data)
+        return asset
+
+    def _cache_path(self, asset, encoding):
+        return os.path.join(self.cache_dir, asset.digest + [k for k, v in _EXTENSIONS.items() if v == encoding][0])
+
+    def _compressed(self, asset, body, encoding):
+        cached = self._cache_path(asset, encoding)
+        if os.path.exists(cached):
+            with open(cached, "rb") as f:
+                return f.read()
+        if encoding == "gzip":
+            data = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        elif brotli is not None:
+            data = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            return None
+        self.compressed_at_startup += 1
+        self._write_cache(asset, encoding, data)
+        return data
+
+    def _write_cache(self, asset, encoding, data):
+        path = self._cache_path(asset, encoding)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"[STATIC] Could not cache {asset.url} ({encoding}): {e}")
+        return path
+
+    def lookup(self, path):
+        path = path.strip("/")
+        if not path or path.endswith("/"):
+            path += "index.html"
+        asset = self.assets.get(path)
+        if asset is None and "." not in os.path.basename(path):
+            # /voice-settings -> voice-settings.html, /docs -> docs/index.html
+            asset = self.assets.get(path + ".html") or self.assets.get(path + "/index.html")
+        return asset
+
+    def response(self, scope):
+        if scope["method"] not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        asset = self.lookup(path)
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        headers = dict((k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"])
+        accepted = _accepted(headers.get("accept-encoding", ""))
+        encoding = next((e for e in ("br", "gzip") if e in accepted and e in asset.variants), "identity")
+        versioned = f"v={asset.digest[:12]}" in scope.get("query_string", b"").decode("latin-1")
+        response_headers = {
+            "ETag": asset.etag(encoding),
+            "Cache-Control": IMMUTABLE if versioned else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+
+        self.requests += 1
+        if_none_match = headers.get("if-none-match", "")
+        if if_none_match and (if_none_match.strip() == "*" or asset.etag(encoding) in if_none_match):
+            self.not_modified += 1
+            return Response(status_code=304, headers=response_headers)
+
+        data = asset.variants[encoding]
+        identity = asset.variants["identity"]
+        size = len(data) if isinstance(data, bytes) else os.path.getsize(data)
+        self.bytes_sent += size
+        self.bytes_identity += len(identity) if isinstance(identity, bytes) else os.path.getsize(identity)
+        self.by_encoding[encoding] = self.by_encoding.get(encoding, 0) + 1
+        if isinstance(data, bytes):
+            return Response(data, media_type=asset.content_type, headers=response_headers)
+        return FileResponse(data, media_type=asset.content_type, headers=response_headers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        await self.response(scope)(scope, receive, send)
+
+    def stats(self):
+        return {
+            "assets": len(self.assets),
+            "memory_bytes": self.memory_bytes,
+            "load_ms": round(self.load_seconds * 1000, 1),
+            "compressed_at_startup": self.compressed_at_startup,
+            "brotli": brotli is not None,
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "by_encoding": dict(self.by_encoding),
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.bytes_identity - self.bytes_sent,
+        }
+
+
+if __name__ == "__main__":
+    # Build step: precompress the frontend at the highest levels into the cache
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend"
+    )
+    assets = StaticAssets(directory, brotli_quality=11, memory_limit=0)
+    for url, asset in sorted(assets.assets.items()):
+        sizes = ", ".join(
+            f"{encoding} {len(v) if isinstance(v, bytes) else os.path.getsize(v)}" for encoding, v in asset.variants.items()
+        )
+        print(f"[STATIC] {url}: {sizes}")
+    print(f"[STATIC] {assets.stats()}")
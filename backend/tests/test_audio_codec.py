@@ -0,0 +1,53 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from audio_codec import ADPCM, MULAW, PCM16, AudioCodecSession
+from framing import CODEC_ADPCM, CODEC_MULAW, CODEC_PCM16
+
+
+def tone(samples, rate=24000, freq=440, amplitude=8000):
+    t = np.arange(samples) / rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.int16).tobytes()
+
+
+@pytest.mark.parametrize("name", [PCM16, MULAW, ADPCM])
+def test_odd_length_chunks_carry_the_last_byte(name):
+    pcm = tone(480)
+    codec = AudioCodecSession(name)
+    decoder = AudioCodecSession(name)
+
+    async def main():
+        # The model audio is split at odd offsets; no chunk may fail
+        out = b""
+        for start, end in ((0, 101), (101, 500), (500, 777), (777, len(pcm))):
+            payload = await codec.encode(pcm[start:end], 24000)
+            if payload:
+                out += await decoder.decode(payload, codec.codec_id, 24000)
+        return out
+
+    out = asyncio.run(main())
+    assert len(out) == len(pcm)
+    if name == PCM16:
+        assert out == pcm
+    else:
+        error = np.abs(np.frombuffer(out, np.int16).astype(int) - np.frombuffer(pcm, np.int16))
+        assert error.mean() < 400
+
+
+def test_only_pcm_and_the_negotiated_codec_are_decoded():
+    codec = AudioCodecSession(MULAW)
+
+    async def main():
+        return (
+            await codec.decode(b"\x00\x00", CODEC_PCM16, 16000),
+            await codec.decode(b"\xff\xff", CODEC_MULAW, 16000),
+            await codec.decode(b"\x00\x00\x00\x00\x00", CODEC_ADPCM, 16000),
+        )
+
+    pcm, mulaw, adpcm = asyncio.run(main())
+    assert pcm == b"\x00\x00"
+    assert len(mulaw) == 4
+    assert adpcm is None
+    assert codec.frames_rejected == 1
@@ -0,0 +1,200 @@
+import asyncio
+
+import numpy as np
+
+from audio_io import SAMPLE_WIDTH, AudioIO, EnergyHistory, FakeAudioDevice, JitterBuffer, RingBuffer
+from echo_suppression import MODE_HALF_DUPLEX, EchoGate
+
+
+def pattern(n, start=0):
+    return bytes((start + i) % 251 for i in range(n))
+
+
+def tone(amplitude, samples=160, rate=16000):
+    t = np.arange(samples) / rate
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.int16).tobytes()
+
+
+def mean_square(pcm):
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    return float(np.dot(samples, samples)) / len(samples)
+
+
+# --- RingBuffer ---
+
+def test_ring_buffer_wraps_around():
+    ring = RingBuffer(8)
+    assert ring.write(pattern(6)) == 6
+    assert ring.read(4) == pattern(4)
+    # 2 bytes left at the end of the array, the next 3 wrap to the start
+    assert ring.write(pattern(5, start=6)) == 5
+    assert ring.available == 7
+    assert ring.read(7) == pattern(7, start=4)
+    assert ring.available == 0
+
+
+def test_ring_buffer_overflow_keeps_oldest():
+    ring = RingBuffer(8)
+    assert ring.write(pattern(12)) == 8
+    assert ring.free == 0
+    assert ring.write(b"x") == 0
+    assert ring.read(100) == pattern(8)
+
+
+def test_ring_buffer_discard():
+    ring = RingBuffer(8)
+    ring.write(pattern(5))
+    ring.discard()
+    assert ring.available == 0
+    assert ring.read(5) == b""
+
+
+# --- JitterBuffer (1 kHz: 2 bytes per ms) ---
+
+def make_jitter(target_ms=10, max_ms=50):
+    return JitterBuffer(1000, target_ms=target_ms, max_ms=max_ms)
+
+
+def test_jitter_buffer_waits_for_target():
+    jitter = make_jitter()
+    jitter.push(pattern(10))
+    assert jitter.pull(4) == bytes(4)
+    assert not jitter.playing
+    jitter.push(pattern(10, start=10))
+    assert jitter.pull(4) == pattern(4)
+    assert jitter.playing
+
+
+def test_jitter_buffer_underrun_pads_and_reprimes():
+    jitter = make_jitter()
+    jitter.push(pattern(20))
+    assert jitter.pull(16) == pattern(16)
+    assert jitter.pull(16) == pattern(4, start=16) + bytes(12)
+    assert jitter.underruns == 1
+    assert not jitter.playing
+
+
+def test_jitter_buffer_plays_turn_tail_without_underrun():
+    jitter = make_jitter()
+    jitter.push(pattern(6))
+    jitter.mark_end()
+    assert jitter.pull(8) == pattern(6) + bytes(2)
+    assert jitter.underruns == 0
+
+
+def test_jitter_buffer_overrun_drops_excess():
+    jitter = make_jitter(max_ms=50)
+    assert jitter.push(pattern(120)) == 100
+    assert jitter.overruns == 1
+    assert jitter.dropped_bytes == 20
+
+
+def test_jitter_buffer_flush_on_interrupt():
+    jitter = make_jitter()
+    jitter.push(pattern(40))
+    assert jitter.pull(4) == pattern(4)
+    jitter.flush()
+    assert jitter.pull(4) == bytes(4)
+    assert jitter.flushed_bytes == 36
+    assert jitter.ring.available == 0
+    assert len(jitter.flush_latencies) == 1
+    assert not jitter.playing
+
+
+# --- AudioIO through the fake device ---
+
+def make_io(input_pcm=b""):
+    device = FakeAudioDevice(input_pcm, loop_input=False, realtime=False)
+    # 8 samples per callback; a 1 ms jitter target is 48 bytes at 24 kHz
+    io = AudioIO(device, input_rate=16000, output_rate=24000, frames_per_buffer=8, jitter_target_ms=1)
+    return device, io
+
+
+def test_read_input_returns_captured_audio():
+    async def run():
+        device, io = make_io(pattern(64))
+        io.start()
+        mic = device.streams[0]
+        reader = asyncio.create_task(io.read_input(32))
+        await asyncio.sleep(0)
+        mic.step()
+        await asyncio.sleep(0)
+        assert not reader.done()
+        mic.step()
+        return await asyncio.wait_for(reader, 1)
+
+    assert asyncio.run(run()) == pattern(32)
+
+
+def test_write_output_plays_queued_audio():
+    async def run():
+        device, io = make_io()
+        io.start()
+        speaker = device.streams[1]
+        pcm = tone(8000, samples=48)
+        io.play(pcm)
+        for _ in range(6):
+            speaker.step()
+        return device, io, pcm
+
+    device, io, pcm = asyncio.run(run())
+    assert bytes(device.played[:len(pcm)]) == pcm
+    assert device.played[len(pcm):] == bytes(len(device.played) - len(pcm))
+    # The speaker's energy is kept as the echo reference
+    assert io.reference.range_since(0)[1] > 0
+
+
+def test_interrupt_silences_next_callback():
+    async def run():
+        device, io = make_io()
+        io.start()
+        speaker = device.streams[1]
+        io.play(tone(8000, samples=480))
+        speaker.step()
+        io.interrupt()
+        speaker.step()
+        return device, io
+
+    device, io = asyncio.run(run())
+    period = 8 * SAMPLE_WIDTH
+    assert any(device.played[:period])
+    assert device.played[period:] == bytes(period)
+    assert io.stats()["interrupt_to_silence_ms_max"] is not None
+
+
+# --- EchoGate ---
+
+def gate_with_speaker(energy, mode="gate", now=10.0):
+    history = EnergyHistory()
+    for i in range(10):
+        history.add(now - 0.2 + i * 0.02, energy)
+    return EchoGate(history, mode=mode), now
+
+
+def test_echo_gate_suppresses_echo_while_playing():
+    gate, now = gate_with_speaker(mean_square(tone(10000)))
+    echo = tone(1000)
+    assert gate.process(echo, now=now) == bytes(len(echo))
+    assert gate.frames_suppressed == 1
+
+
+def test_echo_gate_passes_user_talking_over_playback():
+    gate, now = gate_with_speaker(mean_square(tone(10000)))
+    speech = tone(12000)
+    assert gate.process(speech, now=now) == speech
+    assert gate.frames_double_talk == 1
+
+
+def test_echo_gate_passes_audio_when_speaker_silent():
+    gate = EchoGate(EnergyHistory())
+    quiet = tone(500)
+    assert gate.process(quiet, now=10.0) == quiet
+    assert gate.frames_suppressed == 0
+
+
+def test_half_duplex_mutes_until_hangover_ends():
+    gate, now = gate_with_speaker(mean_square(tone(10000)), mode=MODE_HALF_DUPLEX)
+    speech = tone(12000)
+    assert gate.process(speech, now=now) == bytes(len(speech))
+    # Window (250 ms) and hangover (150 ms) both over
+    assert gate.process(speech, now=now + 1.0) == speech
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from audio_resample import AudioNormalizer, PolyphaseResampler
+
+RATE_PAIRS = [(24000, 16000), (16000, 24000)]
+
+
+def sine(frequency, amplitude, seconds, rate):
+    t = np.arange(int(seconds * rate)) / rate
+    return np.rint(amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16).tobytes()
+
+
+def split(pcm, sizes):
+    """Cuts ``pcm`` into chunks of the given sample counts, cycling through them."""
+    chunks, offset, i = [], 0, 0
+    while offset < len(pcm):
+        size = sizes[i % len(sizes)] * 2
+        chunks.append(pcm[offset:offset + size])
+        offset += size
+        i += 1
+    return chunks
+
+
+@pytest.mark.parametrize("in_rate, out_rate", RATE_PAIRS)
+def test_chunked_output_equals_one_shot_output(in_rate, out_rate):
+    rng = np.random.default_rng(1)
+    pcm = rng.integers(-20000, 20000, in_rate // 2, dtype=np.int16).tobytes()
+    one_shot = PolyphaseResampler(in_rate, out_rate).process(pcm)
+
+    resampler = PolyphaseResampler(in_rate, out_rate)
+    # Browser-sized chunks, odd sizes and single samples
+    chunked = b"".join(resampler.process(chunk) for chunk in split(pcm, [2048, 1, 777, 3, 160]))
+    assert chunked == one_shot
+    assert abs(len(one_shot) // 2 - len(pcm) // 2 * out_rate // in_rate) <= resampler.taps
+
+
+@pytest.mark.parametrize("in_rate, out_rate", RATE_PAIRS)
+def test_sine_keeps_its_frequency_and_amplitude(in_rate, out_rate):
+    resampler = PolyphaseResampler(in_rate, out_rate)
+    pcm = sine(1000, 10000, 1.0, in_rate)
+    out = b"".join(resampler.process(chunk) for chunk in split(pcm, [2048]))
+    # Skip the filter's start-up transient
+    samples = np.frombuffer(out, dtype=np.int16)[out_rate // 10:].astype(np.float64)
+
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    peak = np.argmax(spectrum) * out_rate / len(samples)
+    assert abs(peak - 1000) < 2
+    rms = np.sqrt(np.mean(samples ** 2))
+    assert rms == pytest.approx(10000 / np.sqrt(2), rel=0.02)
+
+
+def test_normalizer_passes_the_target_rate_through():
+    normalizer = AudioNormalizer()
+    pcm = sine(440, 1000, 0.01, 16000)
+    assert normalizer.normalize(pcm, "audio/pcm;rate=16000") == pcm
+    assert len(normalizer.normalize(pcm, "audio/pcm;rate=24000")) < len(pcm)
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("playwright.async_api")
+
+from browser_pool import BrowserPool  # noqa: E402
+from page_cache import PageCache  # noqa: E402
+from web_agent import WebAgent  # noqa: E402
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        body = f"<html><head><title>Page {self.path}</title></head><body>Hello from {self.path}</body></html>"
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.hits = []
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run_with_pool(test, **options):
+    """Runs ``test(pool)`` against a started pool; skips when Chromium cannot launch."""
+
+    async def main():
+        pool = BrowserPool(**options)
+        try:
+            try:
+                await pool.start()
+            except Exception as e:
+                pytest.skip(f"Chromium is not available: {e}")
+            return await test(pool)
+        finally:
+            await pool.close()
+
+    return asyncio.run(main())
+
+
+def test_pool_reuses_context_between_tasks(site):
+    async def test(pool):
+        contexts = []
+        for path in ("/one", "/two"):
+            async with pool.page() as page:
+                # A returned page is reset before the next task gets it
+                assert page.url == "about:blank"
+                await page.goto(site.url + path)
+                assert await page.title() == f"Page {path}"
+                contexts.append(page.context)
+        assert contexts[0] is contexts[1]
+        assert pool.contexts_created == 1
+        assert pool.reused == 2
+
+    run_with_pool(test, size=1, max_concurrency=1)
+
+
+def test_page_cache_hit_and_miss(site):
+    async def test(pool):
+        cache = PageCache()
+        agent = WebAgent(pool=pool, cache=cache)
+        first = await agent.run_task(f"open {site.url}/article")
+        # Same page: tracking parameters and fragments do not change the key
+        second = await agent.run_task(f"open {site.url}/article?utm_source=test#top")
+        other = await agent.run_task(f"open {site.url}/other")
+        assert first == second
+        assert "Hello from /article" in first
+        assert "Hello from /other" in other
+        assert site.hits.count("/article") == 1
+        assert cache.hits == 1
+        assert cache.misses == 2
+
+    run_with_pool(test, size=1)
+
+
+@pytest.mark.parametrize("task_fails", [True, False])
+def test_crashed_context_is_replaced(site, task_fails):
+    async def test(pool):
+        try:
+            async with pool.page() as page:
+                await page.goto(site.url + "/crash")
+                # The context dies under the task; it may or may not notice
+                await page.context.close()
+                if task_fails:
+                    raise RuntimeError("page crashed")
+        except RuntimeError:
+            pass
+        await asyncio.gather(*pool._background)
+        assert pool.contexts_discarded == 1
+        assert pool.contexts_created == 2
+        async with pool.page() as page:
+            await page.goto(site.url + "/after")
+            assert await page.title() == "Page /after"
+
+    run_with_pool(test, size=1)
+
+
+def test_first_agent_warms_up_pool():
+    async def main():
+        pool = BrowserPool(size=1)
+        try:
+            WebAgent(pool=pool, cache=PageCache())
+            assert pool._warmup is not None
+            await pool._warmup
+            if not pool.started:
+                pytest.skip("Chromium is not available")
+            assert pool.stats()["idle"] == 1
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+import pytest
+
+from framing import (
+    CODEC_MULAW,
+    CODEC_PCM16,
+    FRAME_AUDIO,
+    FRAME_VIDEO,
+    HEADER,
+    pack_audio,
+    pack_video,
+    unpack_frame,
+)
+
+
+def test_audio_frame_round_trip():
+    kind, codec, rate, payload = unpack_frame(pack_audio(b"\x01\x02" * 4, 24000))
+    assert (kind, codec, rate, bytes(payload)) == (FRAME_AUDIO, CODEC_PCM16, 24000, b"\x01\x02" * 4)
+
+
+def test_short_frame_is_rejected():
+    with pytest.raises(ValueError):
+        unpack_frame(b"\x01\x00")
+
+
+@pytest.mark.parametrize("rate", [0, 100, 10_000_000])
+def test_audio_rate_out_of_range_is_rejected(rate):
+    with pytest.raises(ValueError):
+        unpack_frame(pack_audio(b"\x00\x00", rate))
+
+
+def test_odd_length_pcm_is_rejected():
+    with pytest.raises(ValueError):
+        unpack_frame(pack_audio(b"\x00\x00\x00", 16000))
+
+
+def test_odd_length_is_fine_for_byte_codecs():
+    _, codec, _, payload = unpack_frame(pack_audio(b"\x00\x00\x00", 16000, CODEC_MULAW))
+    assert codec == CODEC_MULAW and len(payload) == 3
+
+
+def test_thumbnail_longer_than_payload_is_rejected():
+    assert unpack_frame(pack_video(b"jpeg", b"th"))[0] == FRAME_VIDEO
+    with pytest.raises(ValueError):
+        unpack_frame(HEADER.pack(FRAME_VIDEO, 1, 0, 100) + b"jpeg")
@@ -0,0 +1,40 @@
+import threading
+
+from local_memory import LocalVectorMemory
+
+
+def test_instances_in_one_process_share_the_user_index(tmp_path):
+    # Two agent jobs of serve.py, each with its own backend, for the same user
+    first = LocalVectorMemory(str(tmp_path))
+    second = LocalVectorMemory(str(tmp_path))
+    facts = [f"Любимое животное номер {i}: {name}" for i, name in enumerate(["кот", "пёс", "ёж", "сова"] * 5)]
+
+    def write(memory, part):
+        for fact in part:
+            memory.save_sync(fact, "u1")
+
+    threads = [
+        threading.Thread(target=write, args=(first, facts[0::2])),
+        threading.Thread(target=write, args=(second, facts[1::2])),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for memory in (first, second):
+        for fact in facts:
+            # Every fact is found under its own text: rows and facts stay aligned
+            assert memory.search_sync(fact, "u1", top_k=1)[0]["memory"] == fact
+    assert len(first.profile_sync("u1", limit=100)) == len(facts)
+
+
+def test_compaction_by_one_instance_is_seen_by_the_other(tmp_path):
+    first = LocalVectorMemory(str(tmp_path))
+    second = LocalVectorMemory(str(tmp_path))
+    first.save_sync("Меня зовут Аня", "u2")
+    second.save_sync("Меня зовут Аня!", "u2")
+    second.save_sync("Я люблю рисовать", "u2")
+    first.compact("u2")
+    assert second.search_sync("Я люблю рисовать", "u2", top_k=1)[0]["memory"] == "Я люблю рисовать"
+    assert second.profile_sync("u2") == first.profile_sync("u2")
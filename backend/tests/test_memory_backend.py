@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from memory_backend import AsyncMem0Memory, MemoryBackend
+
+
+class SlowClient:
+    """Mem0 stand-in whose ``add`` takes ``delay`` seconds on its thread."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.added = []
+        self._lock = threading.Lock()
+
+    def add(self, messages, user_id):
+        time.sleep(self.delay)
+        with self._lock:
+            self.added.extend(message["content"] for message in messages)
+
+
+def test_slow_add_past_the_timeout_is_not_sent_again():
+    client = SlowClient(0.3)
+
+    async def main():
+        memory = AsyncMem0Memory(client, timeout=0.05, flush_delay=0)
+        memory.save("Кота зовут Мурзик", "u1")
+        await asyncio.sleep(0.5)
+        await memory.close()
+        return memory
+
+    memory = asyncio.run(main())
+    assert client.added == ["Кота зовут Мурзик"]
+    assert memory.add_timeouts == 1
+    assert memory.save_failures == 0
+
+
+def test_close_waits_for_the_batch_in_flight():
+    client = SlowClient(0.2)
+
+    async def main():
+        memory = AsyncMem0Memory(client, timeout=5, flush_delay=0)
+        memory.save("Любит динозавров", "u1")
+        # Let the writer hand the batch to the executor, then close mid-call
+        await asyncio.sleep(0.05)
+        memory.save("Боится темноты", "u1")
+        await memory.close()
+
+    asyncio.run(main())
+    assert sorted(client.added) == ["Боится темноты", "Любит динозавров"]
+
+
+def test_backend_without_overrides_fails_at_construction():
+    class Incomplete(MemoryBackend):
+        async def search(self, query, user_id):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,116 @@
+import asyncio
+
+from outbound_queue import OutboundQueue
+
+
+class FakeWebSocket:
+    """Records what the writer sends, in order."""
+
+    def __init__(self):
+        self.sent = []
+        self.close_code = None
+
+    async def send_text(self, message):
+        self.sent.append(message)
+
+    async def send_bytes(self, message):
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+def run_queue(fill, **options):
+    """Runs ``fill(queue)`` with no writer, then drains the queue; returns (socket, queue)."""
+    websocket = FakeWebSocket()
+
+    async def main():
+        queue = OutboundQueue(websocket, **options)
+        await fill(queue)
+        queue.close()
+        await asyncio.wait_for(queue.run(), 1)
+        return queue
+
+    queue = asyncio.run(main())
+    return websocket, queue
+
+
+def test_control_messages_overtake_queued_audio():
+    async def fill(queue):
+        await queue.put_audio(b"audio-1")
+        await queue.put_audio(b"audio-2")
+        queue.put_control('{"interrupted": true}')
+
+    websocket, queue = run_queue(fill)
+    assert websocket.sent == ['{"interrupted": true}', b"audio-1", b"audio-2"]
+    assert queue.control_sent == 1
+    assert queue.audio_sent == 2
+
+
+def test_interrupt_discards_queued_audio():
+    async def fill(queue):
+        await queue.put_audio(b"stale-1")
+        await queue.put_audio(b"stale-2")
+        queue.interrupt()
+        queue.put_control("interrupted")
+        await queue.put_audio(b"fresh")
+
+    websocket, queue = run_queue(fill)
+    assert websocket.sent == ["interrupted", b"fresh"]
+    assert queue.interrupt_discarded == 2
+
+
+def test_drop_oldest_keeps_the_newest_audio():
+    async def fill(queue):
+        for part in (b"a", b"b", b"c"):
+            await queue.put_audio(part * 5)
+
+    websocket, queue = run_queue(fill, max_audio_bytes=10, overflow="drop_oldest")
+    assert websocket.sent == [b"b" * 5, b"c" * 5]
+    assert queue.dropped_messages == 1
+
+
+def test_drop_newest_keeps_the_queued_audio():
+    async def fill(queue):
+        for part in (b"a", b"b", b"c"):
+            await queue.put_audio(part * 5)
+
+    websocket, queue = run_queue(fill, max_audio_bytes=10, overflow="drop_newest")
+    assert websocket.sent == [b"a" * 5, b"b" * 5]
+    assert queue.dropped_messages == 1
+
+
+def test_block_waits_for_the_writer_instead_of_dropping():
+    websocket = FakeWebSocket()
+
+    async def main():
+        queue = OutboundQueue(websocket, max_audio_bytes=10, overflow="block")
+        await queue.put_audio(b"a" * 5)
+        await queue.put_audio(b"b" * 5)
+        blocked = asyncio.create_task(queue.put_audio(b"c" * 5))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        writer = asyncio.create_task(queue.run())
+        await asyncio.wait_for(blocked, 1)
+        queue.close()
+        await asyncio.wait_for(writer, 1)
+        return queue
+
+    queue = asyncio.run(main())
+    assert websocket.sent == [b"a" * 5, b"b" * 5, b"c" * 5]
+    assert queue.dropped_messages == 0
+
+
+def test_disconnect_closes_the_socket_when_full():
+    async def fill(queue):
+        for part in (b"a", b"b", b"c"):
+            await queue.put_audio(part * 5)
+        # Nothing is accepted once the queue has given up on the client
+        queue.put_control("late")
+
+    websocket, queue = run_queue(fill, max_audio_bytes=10, overflow="disconnect")
+    assert websocket.close_code == 1013
+    assert queue.closed
+    assert queue.dropped_messages == 1
+    assert websocket.sent == [b"a" * 5, b"b" * 5]
@@ -0,0 +1,62 @@
+import pytest
+
+from framing import FRAME_AUDIO
+from replay import analyze
+from session_recorder import (
+    CLIENT_IN,
+    CLIENT_OUT,
+    FLAG_AUDIO,
+    FLAG_STREAM_END,
+    FLAG_TURN_COMPLETE,
+    GEMINI_IN,
+    KIND_BINARY,
+    KIND_MARK,
+    UPSTREAM_OUT,
+)
+
+AUDIO_FRAME = bytes([FRAME_AUDIO]) + b"\0" * 64
+
+
+def mic(at):
+    return (CLIENT_IN, KIND_BINARY, 0, len(AUDIO_FRAME), at, AUDIO_FRAME)
+
+
+def mark(tap, flags, at):
+    return (tap, KIND_MARK, flags, 0, at, None)
+
+
+def answer(at):
+    # Model audio arrives and goes out to the browser 5 ms later
+    return [
+        mark(GEMINI_IN, FLAG_AUDIO, at),
+        (CLIENT_OUT, KIND_BINARY, 0, len(AUDIO_FRAME), at + 0.005, AUDIO_FRAME),
+        mark(GEMINI_IN, FLAG_TURN_COMPLETE, at + 0.1),
+    ]
+
+
+def test_end_to_end_starts_at_the_end_of_speech_not_the_latest_mic_chunk():
+    records = []
+    # Speech: every mic chunk is sent upstream 2 ms after it arrives
+    for step in range(10):
+        records += [mic(step * 0.085), mark(UPSTREAM_OUT, FLAG_AUDIO, step * 0.085 + 0.002)]
+    speech_end = 9 * 0.085
+    records.append(mark(UPSTREAM_OUT, FLAG_STREAM_END, speech_end + 0.003))
+    # Silence keeps streaming from the browser while the model answers
+    for step in range(10, 14):
+        records.append(mic(step * 0.085))
+    records += answer(1.2)
+
+    samples = analyze(records)
+    assert samples["end_to_end"] == [pytest.approx(1.205 - speech_end)]
+    assert samples["model"] == [pytest.approx(1.2 - (speech_end + 0.003))]
+
+
+def test_answer_without_end_of_speech_has_no_end_to_end_sample():
+    records = []
+    for step in range(10):
+        records += [mic(step * 0.085), mark(UPSTREAM_OUT, FLAG_AUDIO, step * 0.085 + 0.002)]
+    records += answer(0.9)
+
+    samples = analyze(records)
+    assert samples["end_to_end"] == []
+    assert len(samples["downstream"]) == 1
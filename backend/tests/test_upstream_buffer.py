@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+from upstream_buffer import UpstreamAudioBuffer
+
+
+def run_buffer(feed, send_delay=0, **options):
+    """Runs ``feed(buffer)`` against a running buffer and returns what it sent, in order.
+
+    Each send takes ``send_delay`` seconds, like a slow upstream link.
+    """
+    sent = []
+
+    async def send(frame):
+        sent.append(frame)
+        if send_delay:
+            await asyncio.sleep(send_delay)
+
+    async def send_end():
+        sent.append("end")
+
+    async def main():
+        buffer = UpstreamAudioBuffer(send, send_end=send_end, **options)
+        runner = asyncio.create_task(buffer.run())
+        await feed(buffer)
+        buffer.close()
+        await asyncio.wait_for(runner, 1)
+        return buffer
+
+    buffer = asyncio.run(main())
+    return sent, buffer
+
+
+def test_end_of_segment_goes_out_before_the_next_segment():
+    async def feed(buffer):
+        # One chunk holds the end of an utterance and the start of the next one
+        await buffer.put(b"a" * 64)
+        buffer.end_stream()
+        await buffer.put(b"b" * 64)
+
+    sent, buffer = run_buffer(feed, frame_ms=100)
+    assert sent == [b"a" * 64, "end", b"b" * 64]
+    assert buffer.stream_ends == 1
+
+
+def test_repeated_end_without_audio_is_sent_once():
+    async def feed(buffer):
+        await buffer.put(b"a" * 64)
+        buffer.end_stream()
+        buffer.end_stream()
+
+    sent, _ = run_buffer(feed)
+    assert sent == [b"a" * 64, "end"]
+
+
+def test_end_marker_survives_dropped_audio():
+    async def feed(buffer):
+        await buffer.put(b"a" * 64)
+        buffer.end_stream()
+        # Overflows the 1 ms (32 byte) cap: all of the first segment is dropped
+        await buffer.put(b"b" * 32)
+
+    sent, buffer = run_buffer(feed, frame_ms=1, max_buffer_ms=1)
+    assert sent == ["end", b"b" * 32]
+    assert buffer.dropped_bytes == 64
+
+
+async def wait_flushes(buffer, count):
+    started = time.monotonic()
+    while buffer.flushes < count:
+        await asyncio.sleep(0.001)
+    return time.monotonic() - started
+
+
+def test_browser_chunk_is_sent_without_waiting_for_the_timer():
+    # 2048 samples at 24 kHz resampled to 16 kHz
+    chunk = b"a" * 2730
+    waits = []
+
+    async def feed(buffer):
+        for _ in range(3):
+            await buffer.put(chunk)
+            waits.append(await wait_flushes(buffer, buffer.chunks_in))
+
+    sent, buffer = run_buffer(feed, max_delay_ms=500)
+    assert sent == [chunk] * 3
+    assert max(waits) < 0.1
+
+
+def test_short_chunks_are_merged_into_one_frame():
+    async def feed(buffer):
+        # Four 10 ms chunks make one 40 ms frame
+        for _ in range(4):
+            await buffer.put(b"a" * 320)
+
+    sent, buffer = run_buffer(feed, frame_ms=40, max_delay_ms=500)
+    assert sent == [b"a" * 1280]
+    assert buffer.flushes == 1
+
+
+def test_chunks_queued_during_a_slow_send_are_merged():
+    async def feed(buffer):
+        await buffer.put(b"a" * 1280)
+        await wait_flushes(buffer, 1)
+        # The first frame is still being sent
+        for part in (b"b", b"c", b"d"):
+            await buffer.put(part * 1280)
+
+    sent, buffer = run_buffer(feed, send_delay=0.05, frame_ms=40)
+    assert sent == [b"a" * 1280, b"b" * 1280 + b"c" * 1280 + b"d" * 1280]
+
+
+def test_partial_frame_is_sent_when_the_timer_runs_out():
+    waited = []
+
+    async def feed(buffer):
+        await buffer.put(b"a" * 320)
+        waited.append(await wait_flushes(buffer, 1))
+
+    sent, _ = run_buffer(feed, frame_ms=100, max_delay_ms=40)
+    assert sent == [b"a" * 320]
+    assert 0.03 <= waited[0] < 0.5
+
+
+def test_drop_oldest_discards_the_oldest_queued_audio():
+    async def feed(buffer):
+        await buffer.put(b"a" * 160)
+        await wait_flushes(buffer, 1)
+        # The cap is 320 bytes: "d" pushes "b" out while "a" is being sent
+        for part in (b"b", b"c", b"d"):
+            await buffer.put(part * 160)
+
+    sent, buffer = run_buffer(feed, send_delay=0.05, frame_ms=5, max_buffer_ms=10)
+    assert sent == [b"a" * 160, b"c" * 160 + b"d" * 160]
+    assert buffer.dropped_bytes == 160
+
+
+def test_block_waits_for_room_instead_of_dropping():
+    async def feed(buffer):
+        await buffer.put(b"a" * 160)
+        await wait_flushes(buffer, 1)
+        # "d" waits until "b" and "c" have been taken by the next send
+        for part in (b"b", b"c", b"d"):
+            await buffer.put(part * 160)
+
+    sent, buffer = run_buffer(
+        feed, send_delay=0.05, frame_ms=5, max_buffer_ms=10, overflow="block"
+    )
+    assert sent == [b"a" * 160, b"b" * 160 + b"c" * 160, b"d" * 160]
+    assert buffer.dropped_bytes == 0
+    assert buffer.blocked_seconds >= 0.03
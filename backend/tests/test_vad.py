@@ -0,0 +1,34 @@
+import numpy as np
+
+from vad import StreamingVAD, vad_from_setup
+
+RATE = 16000
+
+
+def tone(seconds, amplitude, freq=200):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.int16).tobytes()
+
+
+def test_invalid_options_are_ignored_or_clamped():
+    vad = vad_from_setup({"frame_ms": 0, "hangover_ms": "long", "preroll_ms": -50, "max_zcr": None}, sample_rate=RATE)
+    # frame_ms is clamped to 10 ms, the others fall back or clamp to 0
+    assert vad.frame_samples == RATE * 10 // 1000
+    assert vad.hangover_frames == 400 // 10
+    assert vad._preroll.maxlen == 0
+    assert vad.max_zcr == 0.4
+
+
+def test_non_numeric_and_non_finite_options_do_not_raise():
+    vad = StreamingVAD.from_options({"energy_threshold_db": float("nan"), "noise_margin_db": [1], "frame_ms": True})
+    assert vad.energy_threshold_db == -50.0
+    assert vad.noise_margin_db == 9.0
+    assert vad.frame_samples == 16000 * 20 // 1000
+
+
+def test_steady_loud_noise_does_not_hold_the_gate_open():
+    vad = StreamingVAD(sample_rate=RATE)
+    pieces = vad.process(tone(30, 3000))
+    # The tone opens the gate, then the noise floor catches up and closes it
+    assert any(ended for _, ended in pieces)
+    assert not vad.in_speech
@@ -1,27 +1,73 @@
 from livekit.agents import llm
 import logging
-from mem0 import MemoryClient
+
+from memory_backend import memory_from_env, memory_texts
 
 logger = logging.getLogger("memory-tools")
 
+def _fact_key(text):
+    return " ".join(text.split()).casefold()
+
 class UserFriendTools:
-    def __init__(self):
-        # Initialize Mem0 (assumes API key is in environment variables)
-        self.memory = MemoryClient() 
+    def __init__(self, user_id, memory=None):
+        # Memories are kept per user: the id comes from the participant identity or the room
+        self.user_id = user_id
+        # Mem0 or the local vector memory, chosen by MEMORY_BACKEND.
+        # Calls run off the event loop so a slow backend never stalls the audio.
+        self.memory = memory or memory_from_env()
+        # Facts the model already has in context (profile block or said this session)
+        self.known = set()
+
+    def profile_block(self, facts, max_chars=1200):
+        """Formats prefetched facts for the instructions, capped at ``max_chars``.
+
+        Facts that made it into the block count as known, so the tools do not
+        return them again.
+        """
+        lines = []
+        size = 0
+        for fact in facts:
+            if _fact_key(fact) in self.known:
+                continue
+            line = f"- {fact.strip()}"
+            if size + len(line) + 1 > max_chars:
+                break
+            lines.append(line)
+            size += len(line) + 1
+            self.known.add(_fact_key(fact))
+        if not lines:
+            return ""
+        return (
+            "\nЧто ты уже знаешь о пользователе (из прошлых разговоров). "
+            "Используй это сразу, без инструмента `search_memories`:\n" + "\n".join(lines) + "\n"
+        )
 
     @llm.function_tool
     async def save_memory(self, fact: str):
         """Запоминает важные факты о пользователе: имена, питомцы, хобби, страхи, любимые фильмы и т.д."""
-        logger.info(f"Saving fact: {fact}")
-        # Logic to save to Mem0/Qdrant
-        self.memory.add(fact, user_id="user_001") # Using a static user_id for now
+        logger.info(f"Saving fact for {self.user_id}: {fact}")
+        # Write-behind: the fact is stored in the background
+        self.memory.save(fact, user_id=self.user_id)
+        self.known.add(_fact_key(fact))
         return "Я это запомнил!"
 
     @llm.function_tool
     async def search_memories(self, query: str):
         """Позволяет вспомнить информацию о пользователе, если он спрашивает или если это нужно для поддержания беседы."""
-        logger.info(f"Searching memory for: {query}")
-        memories = self.memory.search(query, user_id="user_001") # Using a static user_id for now
-        if not memories:
+        logger.info(f"Searching memory of {self.user_id} for: {query}")
+        memories = await self.memory.search(query, user_id=self.user_id)
+        if memories is None:
+            return "Я сейчас не могу вспомнить, давай попробуем чуть позже."
+        facts = memory_texts(memories)
+        if not facts:
             return "Я ничего не нашел по этому поводу."
-        return f"Я нашел такие факты: {memories}"
+        # Only what is not already in the conversation context
+        new_facts = [fact for fact in facts if _fact_key(fact) not in self.known]
+        if not new_facts:
+            return "Ничего нового: всё, что я знаю об этом, уже есть в моей памяти выше."
+        self.known.update(_fact_key(fact) for fact in new_facts)
+        return "Я нашел такие факты: " + "; ".join(new_facts)
+
+    async def close(self):
+        """Stores facts that are still queued."""
+        await self.memory.close()
@@ -0,0 +1,131 @@
+"""
+Per-turn aggregation of Gemini transcriptions for the browser.
+
+Gemini sends input (user) and output (model) transcription as many small
+fragments, often one or two words each. Instead of one control message per
+fragment, ``TranscriptAggregator`` keeps the text of the current turn per
+stream and sends the whole turn so far at most once per ``interval``, plus a
+final message when the turn ends:
+
+    {"serverContent": {"outputTranscription": {"text": "...", "turn": 3, "final": false}}}
+
+The browser replaces the text of the bubble for ``(stream, turn)`` instead of
+adding one bubble per fragment. Thought headers (``**Formulating...**``) are
+removed from the merged text by one precompiled pattern, so a header split
+across fragments is caught as well.
+"""
+import asyncio
+import json
+import re
+import time
+
+# Технические "мысли" модели: заголовки в двойных звездочках и служебные статусы
+THOUGHT_PATTERN = re.compile(r"\A\s*\*\*.*\*\*\s*\Z|Initiating|(?i:formulating)", re.DOTALL)
+THOUGHT_BLOCKS = re.compile(r"\*\*[^*]*\*\*")
+
+INPUT = "input"
+OUTPUT = "output"
+_KEYS = {INPUT: "inputTranscription", OUTPUT: "outputTranscription"}
+
+
+def is_thought(text):
+    """True for a model text part that is a thought rather than an answer."""
+    return THOUGHT_PATTERN.search(text) is not None
+
+
+class _Stream:
+    def __init__(self, key):
+        self.key = key
+        self.parts = []
+        self.turn = 0
+        self.sent = ""
+        self.last_sent = 0.0
+        self.timer = None
+
+
+class TranscriptAggregator:
+    """Merges transcription fragments into one updated message per turn and stream.
+
+    ``send`` is a synchronous callable taking the JSON text of a control
+    message (``OutboundQueue.put_control``), so timers can flush directly.
+    """
+
+    def __init__(self, send, interval_ms=250):
+        self.send = send
+        self.interval = interval_ms / 1000
+        self._streams = {kind: _Stream(key) for kind, key in _KEYS.items()}
+        self._responding = False
+
+        self.fragments = 0
+        self.updates = 0
+        self.finals = 0
+
+    def add(self, kind, text):
+        if not text:
+            return
+        stream = self._streams[kind]
+        stream.parts.append(text)
+        self.fragments += 1
+        wait = stream.last_sent + self.interval - time.monotonic()
+        if wait <= 0:
+            self._emit(stream, final=False)
+        elif stream.timer is None:
+            stream.timer = asyncio.get_running_loop().call_later(wait, self._on_timer, stream)
+
+    def model_output(self):
+        """Called for every piece of model output; the first of a response ends the user's turn."""
+        if not self._responding:
+            self._responding = True
+            self.end_turn(INPUT)
+
+    def end_turn(self, kind=None):
+        """Sends the final text of the current turn (of one or both streams)."""
+        if kind != INPUT:
+            self._responding = False
+        for name in (kind,) if kind else self._streams:
+            stream = self._streams[name]
+            if not stream.parts:
+                continue
+            self._emit(stream, final=True)
+            stream.parts = []
+            stream.sent = ""
+            stream.turn += 1
+
+    def _on_timer(self, stream):
+        stream.timer = None
+        if stream.parts:
+            self._emit(stream, final=False)
+
+    def _emit(self, stream, final):
+        if stream.timer:
+            stream.timer.cancel()
+            stream.timer = None
+        text = THOUGHT_BLOCKS.sub("", "".join(stream.parts)).strip()
+        if text == stream.sent and not final:
+            return
+        if not text and not stream.sent:
+            return
+        stream.sent = text
+        stream.last_sent = time.monotonic()
+        if final:
+            self.finals += 1
+        else:
+            self.updates += 1
+        self.send(json.dumps({
+            "serverContent": {stream.key: {"text": text, "turn": stream.turn, "final": final}}
+        }, ensure_ascii=False))
+
+    def close(self):
+        for stream in self._streams.values():
+            if stream.timer:
+                stream.timer.cancel()
+                stream.timer = None
+
+    def stats(self):
+        messages = self.updates + self.finals
+        return {
+            "fragments": self.fragments,
+            "updates": self.updates,
+            "finals": self.finals,
+            "messages_saved": self.fragments - messages,
+        }
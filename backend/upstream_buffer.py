@@ -0,0 +1,199 @@
+"""
+Per-session upstream audio buffer between the browser socket and Gemini.
+
+The browser sends a small chunk every few tens of milliseconds. Awaiting one
+``send_realtime_input`` per chunk serializes the proxy on the upstream link,
+so this buffer sends from a dedicated task and coalesces the chunks that pile
+up while a send is in flight. The frame target must not exceed the incoming
+chunk: a chunk shorter than the target waits for the timer before it goes
+out. A timer bounds the latency that adds, and a memory
+cap either drops the oldest audio or applies backpressure to the reader.
+``end_stream()`` puts an end-of-stream marker after the audio queued so far:
+that audio is flushed, then the end is signalled upstream, then any audio
+queued after the call follows.
+"""
+import asyncio
+import time
+from collections import deque
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_BLOCK = "block"
+
+
+class UpstreamAudioBuffer:
+    """Coalesces 16-bit PCM chunks and sends them upstream from one task.
+
+    ``send`` is a coroutine function that receives one coalesced frame of
+    bytes; the optional ``send_end`` coroutine function is awaited after the
+    audio queued before an ``end_stream()`` call has been sent, and before
+    any audio queued after it. Call ``run()``
+    as a task, ``put()`` for every incoming chunk and ``close()`` to flush
+    what is left and stop the task.
+    """
+
+    def __init__(
+        self,
+        send,
+        send_end=None,
+        sample_rate=16000,
+        frame_ms=40,
+        max_delay_ms=40,
+        max_buffer_ms=2000,
+        overflow=OVERFLOW_DROP_OLDEST,
+    ):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self._send = send
+        self._send_end = send_end
+        bytes_per_ms = sample_rate * 2 // 1000
+        self.bytes_per_ms = bytes_per_ms
+        self.frame_bytes = max(2, frame_ms * bytes_per_ms)
+        self.max_buffer_bytes = max(self.frame_bytes, max_buffer_ms * bytes_per_ms)
+        # A slow link lets several frames pile up; send them in one call
+        self.max_flush_bytes = self.frame_bytes * 4
+        self.max_delay = max_delay_ms / 1000.0
+        self.overflow = overflow
+
+        self._pending = bytearray()
+        # Stream offset of _pending[0]; end markers are stream offsets too
+        self._head = 0
+        self._ends = deque()
+        self._first_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._closed = False
+
+        self.chunks_in = 0
+        self.bytes_in = 0
+        self.flushes = 0
+        self.bytes_flushed = 0
+        self.max_flush = 0
+        self.max_depth = 0
+        self.dropped_bytes = 0
+        self.blocked_seconds = 0.0
+        self.stream_ends = 0
+
+    @property
+    def depth_bytes(self):
+        return len(self._pending)
+
+    async def put(self, pcm):
+        """Queues a chunk, dropping old audio or waiting if the cap is reached."""
+        if self._closed:
+            return
+        self.chunks_in += 1
+        self.bytes_in += len(pcm)
+
+        if self.overflow == OVERFLOW_BLOCK:
+            if len(self._pending) + len(pcm) > self.max_buffer_bytes:
+                started = time.monotonic()
+                while len(self._pending) + len(pcm) > self.max_buffer_bytes and self._pending:
+                    self._space.clear()
+                    await self._space.wait()
+                    if self._closed:
+                        return
+                self.blocked_seconds += time.monotonic() - started
+        else:
+            excess = len(self._pending) + len(pcm) - self.max_buffer_bytes
+            if excess > 0:
+                # Keep whole samples when trimming
+                excess += excess & 1
+                if excess >= len(self._pending):
+                    # The new chunk alone overflows the cap: keep only its tail
+                    pcm = pcm[excess - len(self._pending):]
+                    self._head += len(self._pending)
+                    self._pending.clear()
+                else:
+                    del self._pending[:excess]
+                    self._head += excess
+                self.dropped_bytes += excess
+
+        if not self._pending:
+            self._first_at = time.monotonic()
+        self._pending += pcm
+        if len(self._pending) > self.max_depth:
+            self.max_depth = len(self._pending)
+        self._wakeup.set()
+
+    async def run(self):
+        """Sends coalesced frames until ``close()`` is called and the buffer drains."""
+        while True:
+            # Audio before the marker is sent (or was dropped): the end goes out now
+            if self._ends and self._ends[0] <= self._head:
+                self._ends.popleft()
+                self.stream_ends += 1
+                if self._send_end:
+                    await self._send_end()
+                continue
+            if not self._pending:
+                if self._closed:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            partial = len(self._pending) < self.frame_bytes
+            if partial and not self._closed and not self._ends:
+                timeout = self._first_at + self.max_delay - time.monotonic()
+                if timeout > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+            await self._flush()
+
+    async def _flush(self):
+        size = min(len(self._pending), self.max_flush_bytes)
+        if self._ends:
+            # Never send audio from after an end marker ahead of the end
+            size = min(size, self._ends[0] - self._head)
+        frame = bytes(self._pending[:size])
+        del self._pending[:size]
+        self._head += size
+        if self._pending:
+            self._first_at = time.monotonic()
+        self._space.set()
+
+        self.flushes += 1
+        self.bytes_flushed += size
+        if size > self.max_flush:
+            self.max_flush = size
+        await self._send(frame)
+
+    def end_stream(self):
+        """Flushes the audio queued so far now, then signals the end of the stream.
+
+        Audio ``put()`` after this call is sent after the end signal.
+        """
+        if self._closed:
+            return
+        tail = self._head + len(self._pending)
+        # Two ends with no audio between them are one end
+        if not self._ends or self._ends[-1] < tail:
+            self._ends.append(tail)
+        self._wakeup.set()
+
+    def close(self):
+        """Stops accepting audio; ``run()`` returns once the buffer is drained."""
+        self._closed = True
+        self._wakeup.set()
+        self._space.set()
+
+    def stats(self):
+        flushes = self.flushes or 1
+        return {
+            "depth_bytes": len(self._pending),
+            "depth_ms": len(self._pending) // self.bytes_per_ms,
+            "max_depth_bytes": self.max_depth,
+            "chunks_in": self.chunks_in,
+            "bytes_in": self.bytes_in,
+            "flushes": self.flushes,
+            "avg_flush_bytes": self.bytes_flushed // flushes,
+            "max_flush_bytes": self.max_flush,
+            "dropped_bytes": self.dropped_bytes,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "stream_ends": self.stream_ends,
+        }
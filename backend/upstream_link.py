@@ -0,0 +1,290 @@
+"""
+A Gemini Live session that survives the loss of its connection.
+
+The Live API ends connections on its own: a ``go_away`` message announces
+the end of the connection's lifetime, and network blips or server restarts
+drop it without notice. ``UpstreamLink`` wraps the session for one browser
+and reconnects behind it, so the browser's WebSocket stays open:
+
+* it keeps the newest resumable ``session_resumption_update.new_handle`` and
+  reconnects with it, which restores the conversation on the new connection;
+* on ``go_away`` it reconnects right away instead of waiting for the
+  connection to drop;
+* during the gap, audio from the browser is buffered (up to
+  ``max_gap_bytes``, oldest dropped first), together with stream ends and
+  text turns; only the newest video frame is kept. The buffer is sent on
+  the new connection before anything else;
+* ``receive()`` yields messages across reconnects; it raises only when
+  ``max_attempts`` connects in a row fail.
+
+``connect(handle)`` must return a new async context manager yielding a
+session (``client.aio.live.connect(...)`` with the handle in the config).
+The link itself is used like a session:
+
+    async with UpstreamLink(connect, connection=first) as session:
+        await session.send_realtime_input(audio=...)
+        async for message in session.receive():
+            ...
+"""
+import asyncio
+import time
+from collections import deque
+
+_AUDIO = "audio"
+_VIDEO = "video"
+_OTHER = "other"
+
+
+class UpstreamLost(Exception):
+    """Raised when the session could not be re-established."""
+
+
+class UpstreamLink:
+    def __init__(
+        self,
+        connect,
+        handle=None,
+        max_attempts=5,
+        backoff_s=0.25,
+        max_backoff_s=4.0,
+        connect_timeout_s=10.0,
+        max_gap_bytes=320_000,
+        on_event=None,
+        connection=None,
+    ):
+        self._connect = connect
+        self._first_connection = connection
+        self.handle = handle
+        self.max_attempts = max_attempts
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.connect_timeout_s = connect_timeout_s
+        self.max_gap_bytes = max_gap_bytes
+        self._on_event = on_event
+
+        self._connection = None
+        self._session = None
+        self._reconnect_task = None
+        self._exiting = set()
+        self._closed = False
+        self.failed = False
+        self._gap = deque()
+        self._gap_bytes = 0
+        self._gap_started = None
+
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.go_aways = 0
+        self.resumed_with_handle = 0
+        self.gap_seconds_total = 0.0
+        self.gap_seconds_max = 0.0
+        self.buffered_bytes = 0
+        self.dropped_bytes = 0
+        self.replayed_messages = 0
+
+    @property
+    def session(self):
+        return self._session
+
+    @property
+    def in_gap(self):
+        return self._gap_started is not None
+
+    async def __aenter__(self):
+        """Enters the first connection: the one given (e.g. from a pool) or a new one."""
+        connection = self._first_connection or self._connect(self.handle)
+        self._first_connection = None
+        self._session = await connection.__aenter__()
+        self._connection = connection
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # --- Browser -> Gemini ---
+
+    async def send_realtime_input(self, **kwargs):
+        if "audio" in kwargs:
+            kind, size = _AUDIO, len(_data_of(kwargs["audio"]))
+        elif "video" in kwargs:
+            kind, size = _VIDEO, 0
+        else:
+            kind, size = _OTHER, 0
+        await self._send("send_realtime_input", kwargs, kind, size)
+
+    async def send_client_content(self, **kwargs):
+        await self._send("send_client_content", kwargs, _OTHER, 0)
+
+    async def _send(self, method, kwargs, kind, size):
+        if self._closed:
+            raise UpstreamLost("Upstream link is closed")
+        if self.in_gap:
+            self._buffer(method, kwargs, kind, size)
+            return
+        try:
+            await getattr(self._session, method)(**kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self._closed:
+                raise
+            self._buffer(method, kwargs, kind, size)
+            self._lost(f"send failed: {e}")
+
+    def _buffer(self, method, kwargs, kind, size):
+        if self.failed:
+            raise UpstreamLost("Upstream session could not be re-established")
+        if kind == _VIDEO:
+            # A stale camera frame is worthless: keep only the newest one
+            self._gap = deque(item for item in self._gap if item[2] != _VIDEO)
+        self._gap.append((method, kwargs, kind, size))
+        self._gap_bytes += size
+        self.buffered_bytes += size
+        while self._gap_bytes > self.max_gap_bytes:
+            index = next(i for i, item in enumerate(self._gap) if item[2] == _AUDIO)
+            dropped = self._gap[index][3]
+            del self._gap[index]
+            self._gap_bytes -= dropped
+            self.dropped_bytes += dropped
+
+    # --- Gemini -> browser ---
+
+    async def receive(self):
+        """Yields server messages until closed, reconnecting whenever the connection is lost."""
+        while not self._closed:
+            if self._reconnect_task:
+                # Shielded: stopping the reader must not abort a reconnect the sender relies on
+                await asyncio.shield(self._reconnect_task)
+                continue
+            if self.failed:
+                raise UpstreamLost("Upstream session could not be re-established")
+            session = self._session
+            try:
+                async for message in session.receive():
+                    self._observe(message)
+                    yield message
+                    if message.go_away is not None:
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._closed:
+                    return
+                if session is self._session:
+                    self._lost(f"receive failed: {e}")
+
+    def _observe(self, message):
+        update = message.session_resumption_update
+        if update and update.new_handle and update.resumable is not False:
+            self.handle = update.new_handle
+        if message.go_away is not None:
+            self.go_aways += 1
+            self._lost(f"go_away (time left {message.go_away.time_left})")
+
+    # --- Reconnection ---
+
+    def _lost(self, reason):
+        if self._reconnect_task is None and not self._closed and not self.failed:
+            self._gap_started = time.monotonic()
+            self._notify("reconnecting", reason=reason)
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        old, self._connection = self._connection, None
+        if old is not None:
+            self._exit_later(old)
+        try:
+            for attempt in range(self.max_attempts):
+                if attempt:
+                    await asyncio.sleep(min(self.max_backoff_s, self.backoff_s * 2 ** (attempt - 1)))
+                handle = self.handle
+                connection = self._connect(handle)
+                try:
+                    session = await asyncio.wait_for(connection.__aenter__(), self.connect_timeout_s)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed_attempts += 1
+                    print(f"[UPSTREAM] Reconnect attempt {attempt + 1} failed: {e}")
+                    continue
+                self._connection, self._session = connection, session
+                if await self._replay_gap():
+                    break
+                self._connection = None
+                self._exit_later(connection)
+            else:
+                self.failed = True
+                self._notify("failed", attempts=self.max_attempts)
+                return
+
+            gap = time.monotonic() - self._gap_started
+            self._gap_started = None
+            self.reconnects += 1
+            if handle:
+                self.resumed_with_handle += 1
+            self.gap_seconds_total += gap
+            self.gap_seconds_max = max(self.gap_seconds_max, gap)
+            self._notify("resumed", gap_ms=round(gap * 1000), with_handle=bool(handle))
+        finally:
+            self._reconnect_task = None
+
+    async def _replay_gap(self):
+        """Sends what was buffered during the gap; False if the new connection failed too."""
+        while self._gap:
+            method, kwargs, _, size = self._gap[0]
+            try:
+                await getattr(self._session, method)(**kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_attempts += 1
+                print(f"[UPSTREAM] Replay after reconnect failed: {e}")
+                return False
+            self._gap.popleft()
+            self._gap_bytes -= size
+            self.replayed_messages += 1
+        return True
+
+    def _exit_later(self, connection):
+        # The old connection may take a while to close; the new one must not wait for it
+        task = asyncio.create_task(_exit_quietly(connection))
+        self._exiting.add(task)
+        task.add_done_callback(self._exiting.discard)
+
+    def _notify(self, state, **details):
+        if self._on_event:
+            self._on_event(state, details)
+
+    async def close(self):
+        self._closed = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            await asyncio.gather(self._reconnect_task, return_exceptions=True)
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            await _exit_quietly(connection)
+
+    def stats(self):
+        return {
+            "reconnects": self.reconnects,
+            "resumed_with_handle": self.resumed_with_handle,
+            "failed_attempts": self.failed_attempts,
+            "go_aways": self.go_aways,
+            "in_gap": self.in_gap,
+            "gap_ms_total": round(self.gap_seconds_total * 1000, 1),
+            "gap_ms_max": round(self.gap_seconds_max * 1000, 1),
+            "buffered_bytes": self.buffered_bytes,
+            "dropped_bytes": self.dropped_bytes,
+            "replayed_messages": self.replayed_messages,
+        }
+
+
+def _data_of(blob):
+    return blob["data"] if isinstance(blob, dict) else blob.data
+
+
+async def _exit_quietly(connection):
+    try:
+        await connection.__aexit__(None, None, None)
+    except Exception:
+        pass
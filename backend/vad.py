@@ -0,0 +1,181 @@
+"""
+Streaming voice activity detection for 16-bit mono PCM.
+
+Most of a live session is silence, and forwarding it to Gemini wastes
+bandwidth, model input and proxy CPU. ``StreamingVAD`` classifies short frames
+by energy and zero-crossing rate, forwards only speech plus a pre-roll before
+it and a hangover after it, and reports where each speech segment ends so the
+caller can tell the model that the audio stream has paused.
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+# Options a client may set in ``setup.vad``, with the range each is clamped to
+VAD_OPTIONS = {
+    "frame_ms": (10, 30),
+    "energy_threshold_db": (-90.0, 0.0),
+    "noise_margin_db": (0.0, 40.0),
+    "max_zcr": (0.0, 1.0),
+    "hangover_ms": (0, 5000),
+    "preroll_ms": (0, 2000),
+}
+
+
+class StreamingVAD:
+    """Energy and zero-crossing voice activity gate with hangover and pre-roll.
+
+    A frame counts as speech when its level is above both the absolute
+    ``energy_threshold_db`` and the tracked noise floor plus
+    ``noise_margin_db``, and its zero-crossing rate is below ``max_zcr``
+    (broadband hiss crosses zero far more often than voiced speech).
+
+    The noise floor follows the level quickly outside speech and slowly
+    during it, so a steady noise loud enough to open the gate raises the
+    floor until the gate closes again (about ten seconds).
+    """
+
+    def __init__(
+        self,
+        sample_rate=16000,
+        frame_ms=20,
+        energy_threshold_db=-50.0,
+        noise_margin_db=9.0,
+        max_zcr=0.4,
+        hangover_ms=400,
+        preroll_ms=200,
+    ):
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.energy_threshold_db = energy_threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.max_zcr = max_zcr
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+
+        self._remainder = b""
+        self._preroll = deque(maxlen=max(0, preroll_ms // frame_ms))
+        self._active = False
+        self._hang = 0
+        self._noise_db = energy_threshold_db - noise_margin_db
+
+        self.bytes_in = 0
+        self.bytes_forwarded = 0
+        self.segments = 0
+
+    @classmethod
+    def from_options(cls, options, sample_rate=16000):
+        """Builds a VAD from a client's setup options.
+
+        Unknown keys and values that are not finite numbers are ignored; the
+        others are clamped to the ranges in ``VAD_OPTIONS``.
+        """
+        kwargs = {}
+        for key, (low, high) in VAD_OPTIONS.items():
+            value = options.get(key)
+            if isinstance(value, bool):
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if not math.isfinite(value):
+                continue
+            value = min(high, max(low, value))
+            kwargs[key] = int(value) if isinstance(low, int) else value
+        return cls(sample_rate=sample_rate, **kwargs)
+
+    @property
+    def in_speech(self):
+        return self._active
+
+    def _classify(self, frames):
+        x = frames.astype(np.float32)
+        power = np.einsum("ij,ij->i", x, x) / (x.shape[1] * 32768.0 * 32768.0)
+        level_db = 10.0 * np.log10(power + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (x.shape[1] - 1)
+        return level_db, zcr
+
+    def process(self, pcm):
+        """Feeds a chunk and returns a list of ``(audio, ended)`` pieces.
+
+        ``audio`` is the speech to forward (possibly empty) and ``ended`` is
+        True when a speech segment finished right after that audio.
+        """
+        self.bytes_in += len(pcm)
+        data = self._remainder + bytes(pcm) if self._remainder else bytes(pcm)
+        count = len(data) // self.frame_bytes
+        self._remainder = data[count * self.frame_bytes:]
+        if not count:
+            return []
+
+        frames = np.frombuffer(data, dtype=np.int16, count=count * self.frame_samples)
+        frames = frames.reshape(count, self.frame_samples)
+        level_db, zcr = self._classify(frames)
+
+        pieces = []
+        out = bytearray()
+        for i in range(count):
+            frame = data[i * self.frame_bytes:(i + 1) * self.frame_bytes]
+            threshold = max(self.energy_threshold_db, self._noise_db + self.noise_margin_db)
+            speech = level_db[i] > threshold and zcr[i] < self.max_zcr
+
+            # Track the background level, much slower during speech: steady
+            # noise above the threshold must not hold the gate open forever
+            rate = 0.002 if speech else 0.05
+            self._noise_db += rate * (level_db[i] - self._noise_db)
+
+            if self._active:
+                out += frame
+                if speech:
+                    self._hang = self.hangover_frames
+                else:
+                    self._hang -= 1
+                    if self._hang <= 0:
+                        self._active = False
+                        pieces.append((bytes(out), True))
+                        out = bytearray()
+            elif speech:
+                self._active = True
+                self._hang = self.hangover_frames
+                self.segments += 1
+                for buffered in self._preroll:
+                    out += buffered
+                self._preroll.clear()
+                out += frame
+            else:
+                self._preroll.append(frame)
+
+        if out:
+            pieces.append((bytes(out), False))
+        for audio, _ in pieces:
+            self.bytes_forwarded += len(audio)
+        return pieces
+
+    def stats(self):
+        suppressed = self.bytes_in - self.bytes_forwarded
+        return {
+            "in_speech": self._active,
+            "segments": self.segments,
+            "bytes_forwarded": self.bytes_forwarded,
+            "bytes_suppressed": suppressed,
+            "forwarded_ratio": round(self.bytes_forwarded / self.bytes_in, 3) if self.bytes_in else 0.0,
+            "noise_floor_db": round(float(self._noise_db), 1),
+        }
+
+
+def vad_from_setup(options, enabled_by_default=False, sample_rate=16000):
+    """Builds a session VAD from the ``vad`` field of a client's setup message.
+
+    ``options`` may be missing (use ``enabled_by_default``), a bool, or a dict
+    of thresholds with an optional ``enabled`` flag. Returns None when the VAD
+    is off.
+    """
+    if options is None:
+        options = enabled_by_default
+    if options is True:
+        options = {}
+    if not isinstance(options, dict) or not options.get("enabled", True):
+        return None
+    return StreamingVAD.from_options(options, sample_rate=sample_rate)
@@ -0,0 +1,210 @@
+"""
+Camera frames from the browser to Gemini Live, without flooding either side.
+
+The browser sends JPEG frames, each optionally with a tiny grayscale
+thumbnail (``THUMB_SIZE``, one byte per pixel) drawn from the same canvas.
+``VideoIngest`` decides per session which frames are worth sending:
+
+* at most ``max_fps`` frames per second are accepted (Gemini samples video
+  at about 1 fps, so more only costs bandwidth and tokens);
+* a frame whose thumbnail differs from the last accepted one by less than
+  ``diff_threshold`` (mean absolute difference, 0..255) is a near-duplicate
+  and dropped, unless nothing was sent for ``refresh_s``;
+* only the newest accepted frame waits for the sender: when Gemini is slow,
+  stale frames are replaced rather than queued.
+
+Quality follows upstream congestion. When the audio backlog (``depth_ms``) or
+the time to send a frame grows, the session steps down ``QUALITY_LEVELS``
+(smaller frames, lower JPEG quality) and steps back up after
+``recover_frames`` healthy sends. Level changes are reported through
+``on_level`` so the browser encodes at the new size. With Pillow installed,
+oversized frames are also downscaled here and thumbnails of frames sent
+without one are computed from the JPEG; without it frames pass as encoded.
+"""
+import asyncio
+import io
+import time
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:  # optional: the browser does the resizing
+    Image = None
+
+THUMB_SIZE = (16, 12)
+THUMB_BYTES = THUMB_SIZE[0] * THUMB_SIZE[1]
+
+# (max width, JPEG quality), best first
+QUALITY_LEVELS = ((1024, 80), (768, 70), (640, 60), (480, 50), (320, 40))
+
+
+def jpeg_thumbnail(jpeg):
+    """Grayscale ``THUMB_SIZE`` thumbnail of a JPEG, or None without Pillow."""
+    if Image is None:
+        return None
+    image = Image.open(io.BytesIO(jpeg))
+    # Draft mode decodes at 1/2..1/8 scale straight from the DCT: much cheaper
+    image.draft("L", (THUMB_SIZE[0] * 4, THUMB_SIZE[1] * 4))
+    return np.asarray(image.convert("L").resize(THUMB_SIZE), dtype=np.uint8).ravel()
+
+
+def fit_jpeg(jpeg, max_width, quality):
+    """Downscales a JPEG wider than ``max_width``; returns it unchanged otherwise."""
+    if Image is None:
+        return jpeg
+    image = Image.open(io.BytesIO(jpeg))
+    if image.width <= max_width:
+        return jpeg
+    height = round(image.height * max_width / image.width)
+    out = io.BytesIO()
+    image.convert("RGB").resize((max_width, height)).save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+class VideoIngest:
+    def __init__(
+        self,
+        send,
+        depth_ms=None,
+        on_level=None,
+        max_fps=1.0,
+        diff_threshold=4.0,
+        refresh_s=10.0,
+        high_depth_ms=300,
+        high_send_ms=300,
+        recover_frames=5,
+    ):
+        self._send = send
+        self._depth_ms = depth_ms
+        self._on_level = on_level
+        self.min_interval = 1.0 / max_fps
+        self.max_fps = max_fps
+        self.diff_threshold = diff_threshold
+        self.refresh_s = refresh_s
+        self.high_depth_ms = high_depth_ms
+        self.high_send_ms = high_send_ms
+        self.recover_frames = recover_frames
+
+        self.level = 0
+        self._healthy = 0
+        self._announced = False
+        self._pending = None
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._last_accepted = float("-inf")
+        self._last_thumb = None
+
+        self.frames_in = 0
+        self.frames_sent = 0
+        self.bytes_in = 0
+        self.bytes_sent = 0
+        self.dropped_rate = 0
+        self.dropped_duplicate = 0
+        self.dropped_stale = 0
+        self.resized = 0
+        self.level_changes = 0
+        self.send_seconds = 0.0
+
+    @property
+    def target(self):
+        max_width, quality = QUALITY_LEVELS[self.level]
+        return {"maxWidth": max_width, "quality": quality, "fps": self.max_fps}
+
+    def put(self, jpeg, thumb=None, now=None):
+        """Filters one frame; returns True if it will be sent. Cheap and synchronous."""
+        if self._closed:
+            return False
+        now = time.monotonic() if now is None else now
+        self.frames_in += 1
+        self.bytes_in += len(jpeg)
+        if not self._announced:
+            self._announced = True
+            if self._on_level:
+                self._on_level(self.target)
+        if now - self._last_accepted < self.min_interval:
+            self.dropped_rate += 1
+            return False
+
+        if thumb is not None and len(thumb) == THUMB_BYTES:
+            thumb = np.frombuffer(thumb, dtype=np.uint8)
+        else:
+            # Only frames that passed the rate cap get here: a few decodes per second at most
+            try:
+                thumb = jpeg_thumbnail(jpeg)
+            except (OSError, ValueError):
+                thumb = None
+        if thumb is not None and self._last_thumb is not None and now - self._last_accepted < self.refresh_s:
+            difference = np.abs(thumb.astype(np.int16) - self._last_thumb).mean()
+            if difference < self.diff_threshold:
+                self.dropped_duplicate += 1
+                return False
+
+        self._last_accepted = now
+        self._last_thumb = thumb.astype(np.int16) if thumb is not None else None
+        if self._pending is not None:
+            self.dropped_stale += 1
+        self._pending = bytes(jpeg)
+        self._wakeup.set()
+        return True
+
+    async def run(self):
+        """Sends the newest accepted frame whenever the previous send is done."""
+        while not self._closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            jpeg, self._pending = self._pending, None
+            if jpeg is None:
+                continue
+            max_width, quality = QUALITY_LEVELS[self.level]
+            if Image is not None:
+                fitted = await asyncio.to_thread(fit_jpeg, jpeg, max_width, quality)
+                if fitted is not jpeg:
+                    self.resized += 1
+                    jpeg = fitted
+            started = time.monotonic()
+            await self._send(jpeg)
+            elapsed = time.monotonic() - started
+            self.frames_sent += 1
+            self.bytes_sent += len(jpeg)
+            self.send_seconds += elapsed
+            self._adapt(elapsed)
+
+    def _adapt(self, send_seconds):
+        depth = self._depth_ms() if self._depth_ms else 0
+        if depth > self.high_depth_ms or send_seconds * 1000 > self.high_send_ms:
+            self._healthy = 0
+            if self.level < len(QUALITY_LEVELS) - 1:
+                self.level += 1
+                self._notify()
+            return
+        self._healthy += 1
+        if self._healthy >= self.recover_frames and self.level > 0:
+            self._healthy = 0
+            self.level -= 1
+            self._notify()
+
+    def _notify(self):
+        self.level_changes += 1
+        if self._on_level:
+            self._on_level(self.target)
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+
+    def stats(self):
+        return {
+            "frames_in": self.frames_in,
+            "frames_sent": self.frames_sent,
+            "dropped_rate": self.dropped_rate,
+            "dropped_duplicate": self.dropped_duplicate,
+            "dropped_stale": self.dropped_stale,
+            "resized": self.resized,
+            "bytes_in": self.bytes_in,
+            "bytes_sent": self.bytes_sent,
+            "level": self.level,
+            "level_changes": self.level_changes,
+            **self.target,
+            "avg_send_ms": round(self.send_seconds / self.frames_sent * 1000, 1) if self.frames_sent else 0.0,
+        }
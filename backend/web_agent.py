@@ -1,16 +1,32 @@
 """
 Web Agent for Omni-Agent - Browser automation and web scraping functionality
+
+Agents share one long-lived browser (see browser_pool.py): each task borrows an
+isolated context from the pool, so several ``run_task`` calls run in parallel
+up to the pool's concurrency limit, each bounded by its own timeout.
+
+Extracted page text goes to a shared ``PageCache``: opening the same page
+again within ``WEB_CACHE_TTL`` is answered without the network. Search is
+still a placeholder, so its answers are not cached.
 """
 import asyncio
-import json
-from playwright.async_api import async_playwright
+import inspect
+import re
+
+from browser_pool import shared_pool
+from page_cache import normalize_url, shared_cache
+
+URL_PATTERN = re.compile(r"https?://\S+")
 
 
 class WebAgent:
-    def __init__(self):
-        self.playwright = None
-        self.browser = None
-        self.page = None
+    def __init__(self, pool=None, timeout=30, cache=None):
+        # Without an explicit pool the process-wide one is used and left running
+        self.pool = pool or shared_pool()
+        self.cache = cache or shared_cache()
+        self.timeout = timeout
+        # The first agent starts the browser in the background, so its first task does not wait for the launch
+        self.pool.warm_up()
 
     async def __aenter__(self):
         await self.start()
@@ -20,65 +36,115 @@ class WebAgent:
         await self.close()
 
     async def start(self):
-        """Start the Playwright instance and browser"""
-        self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(headless=True)
-        self.page = await self.browser.new_page()
+        """Make sure the shared browser is running (no-op once warmed up)"""
+        await self.pool.start()
 
     async def close(self):
-        """Close the browser and Playwright instance"""
-        if self.browser:
-            await self.browser.close()
-        if self.playwright:
-            await self.playwright.stop()
+        """Writes the page cache; the browser outlives the agent (see browser_pool.close_shared_pool())"""
+        await self.cache.close()
+
+    async def _notify(self, update_callback, message):
+        if update_callback:
+            result = update_callback(None, message)
+            if inspect.isawaitable(result):
+                await result
 
-    async def run_task(self, prompt, update_callback=None):
+    async def run_task(self, prompt, update_callback=None, timeout=None):
         """
         Run a web task based on the prompt
-        
+
         Args:
             prompt: Natural language description of the task to perform
             update_callback: Optional callback to receive updates during execution
-        
+            timeout: Seconds before the task is abandoned (defaults to self.timeout)
+
         Returns:
             Result of the web task
         """
-        if update_callback:
-            await update_callback(None, f"Starting web task: {prompt}")
-        
+        await self._notify(update_callback, f"Starting web task: {prompt}")
         try:
-            # Simple implementation - in a real scenario, you would parse the prompt
-            # and perform appropriate web actions
-            if "найди" in prompt.lower() or "search" in prompt.lower() or "find" in prompt.lower():
-                # For demonstration, we'll just return a mock result
-                # In a real implementation, you would actually navigate and search
-                if update_callback:
-                    await update_callback(None, "Navigating to search engine...")
-                
-                # Mock result - in real implementation, this would be actual search results
-                result = f"Mock search results for: {prompt}"
-                
-                if update_callback:
-                    await update_callback(None, f"Search completed. Found results for: {prompt}")
-                
-                return result
-            else:
-                # For other types of tasks, return a generic response
-                return f"Processed web task: {prompt}. This is a simulated response from the web agent."
-                
+            return await asyncio.wait_for(self._run(prompt, update_callback), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            await self._notify(update_callback, f"Web task timed out: {prompt}")
+            return f"Web task timed out after {timeout or self.timeout}s: {prompt}"
         except Exception as e:
-            if update_callback:
-                await update_callback(None, f"Error during web task: {str(e)}")
+            await self._notify(update_callback, f"Error during web task: {str(e)}")
             return f"Error during web task: {str(e)}"
 
+    async def run_tasks(self, prompts, update_callback=None, timeout=None):
+        """Run several tasks concurrently; results keep the order of ``prompts``"""
+        return await asyncio.gather(*(self.run_task(p, update_callback, timeout) for p in prompts))
+
+    def stats(self):
+        return {"pool": self.pool.stats(), "cache": self.cache.stats()}
+
+    async def _open_page(self, url, update_callback):
+        key = "page:" + normalize_url(url)
+        cached = self.cache.get(key)
+        if cached is not None:
+            await self._notify(update_callback, f"Using cached copy of {url}")
+            return cached
+
+        # Approximate download size, for the cache's bytes-saved statistic
+        received = [0]
+
+        def on_response(response):
+            received[0] += int(response.headers.get("content-length") or 0)
+
+        async with self.pool.page() as page:
+            page.on("response", on_response)
+            try:
+                await self._notify(update_callback, f"Opening {url}...")
+                await page.goto(url, wait_until="domcontentloaded")
+                title = await page.title()
+                text = await page.inner_text("body")
+            finally:
+                page.remove_listener("response", on_response)
+        await self._notify(update_callback, f"Loaded: {title}")
+        result = f"{title}\n\n{' '.join(text.split())[:2000]}"
+        self.cache.put(key, result, received[0])
+        return result
+
+    async def _run(self, prompt, update_callback):
+        url = URL_PATTERN.search(prompt)
+        if url:
+            return await self._open_page(url.group(0).rstrip(".,;:!?)\"'»"), update_callback)
+
+        # Simple implementation - in a real scenario, you would parse the prompt
+        # and perform appropriate web actions
+        if "найди" in prompt.lower() or "search" in prompt.lower() or "find" in prompt.lower():
+            # For demonstration, we'll just return a mock result
+            # In a real implementation, you would actually navigate and search
+            await self._notify(update_callback, "Navigating to search engine...")
+
+            # Mock result - in real implementation, this would be actual search results
+            result = f"Mock search results for: {prompt}"
+
+            await self._notify(update_callback, f"Search completed. Found results for: {prompt}")
+
+            # Not cached: a placeholder must not be persisted for WEB_CACHE_TTL
+            return result
+        else:
+            # For other types of tasks, return a generic response
+            return f"Processed web task: {prompt}. This is a simulated response from the web agent."
+
 
 # Example usage
 async def main():
+    from browser_pool import close_shared_pool
+
     async with WebAgent() as agent:
-        result = await agent.run_task("Найди погоду в Москве", 
-                                      update_callback=lambda img, msg: print(f"Update: {msg}"))
-        print(result)
+        results = await agent.run_tasks(
+            ["Найди погоду в Москве", "Open https://example.com", "Open https://example.org"],
+            update_callback=lambda img, msg: print(f"Update: {msg}"),
+        )
+        for result in results:
+            print(result)
+        # Opened again: answered from the cache
+        print(await agent.run_task("Open https://example.com/?utm_source=demo"))
+        print(agent.stats())
+    await close_shared_pool()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -16,7 +16,31 @@ class DirectOmniAgentApp {
         this.isReconnecting = false;
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
+        // Очередь допуска на сервере: пока ждем, микрофон не отправляем
+        this.admissionPending = false;
+        this.queuePosition = null;
+        this.retryAfterMs = 0;
         this.resumptionToken = localStorage.getItem('gemini_resumption_token');
+        // Стабильный id сессии: по нему любой воркер сервера найдет токен возобновления
+        this.sessionId = localStorage.getItem('omni_session_id');
+        if (!this.sessionId) {
+            this.sessionId = (window.crypto && crypto.randomUUID)
+                ? crypto.randomUUID()
+                : Date.now().toString(36) + Math.random().toString(36).slice(2);
+            localStorage.setItem('omni_session_id', this.sessionId);
+        }
+        // Бинарный режим аудио включается, только если сервер подтвердил его в setup_complete
+        this.binaryAudio = false;
+        // Кодек бинарных аудиокадров, согласованный с сервером: pcm16, adpcm (4:1) или mulaw (2:1)
+        this.audioCodec = 'pcm16';
+        this.adpcmState = { predictor: 0, index: 0 };
+        // Облачка транскрипций текущих ходов: "user:3" -> элемент, текст которого обновляется
+        this.transcriptBubbles = {};
+        // Кадры камеры: размер, качество JPEG и частоту задает сервер сообщением videoControl
+        this.videoTarget = { maxWidth: 640, quality: 60, fps: 1 };
+        this.videoTimer = null;
+        this.videoCanvas = null;
+        this.thumbCanvas = null;
 
         // UI Elements
         this.energyOrb = document.getElementById('energyOrb');
@@ -102,6 +126,10 @@ class DirectOmniAgentApp {
             }
 
             this.ws = new WebSocket(url);
+            this.ws.binaryType = 'arraybuffer';
+            this.binaryAudio = false;
+            this.admissionPending = false;
+            this.queuePosition = null;
 
             this.ws.onopen = () => {
                 console.log("[DEBUG] WebSocket connected.");
@@ -111,7 +139,12 @@ class DirectOmniAgentApp {
 
                 // Отправляем setup с токеном возобновления, если он есть
                 const setupMessage = {
-                    setup: {}
+                    setup: {
+                        session_id: this.sessionId,
+                        audio_framing: 'binary',
+                        // Сервер выберет из разрешенных в AUDIO_CODECS (по умолчанию только mulaw)
+                        audio_codecs: ['adpcm', 'mulaw']
+                    }
                 };
                 if (this.resumptionToken) {
                     setupMessage.setup.resumption_handle = this.resumptionToken;
@@ -131,6 +164,10 @@ class DirectOmniAgentApp {
 
             this.ws.onmessage = async (event) => {
                 let data = event.data;
+                if (data instanceof ArrayBuffer) {
+                    this.handleBinaryFrame(data);
+                    return;
+                }
                 if (data instanceof Blob) {
                     data = await data.text();
                 }
@@ -170,10 +207,20 @@ class DirectOmniAgentApp {
 
         this.processor.onaudioprocess = (e) => {
             if (!this.isConnected || !this.ws || this.ws.readyState !== WebSocket.OPEN) return;
+            if (this.admissionPending) return;
 
             const inputData = e.inputBuffer.getChannelData(0);
             const pcmData = this.float32ToInt16(inputData);
 
+            if (this.binaryAudio) {
+                try {
+                    this.ws.send(this.packAudioFrame(pcmData, this.audioContext.sampleRate));
+                } catch (err) {
+                    // Игнорируем ошибки отправки, если сокет закрылся в процессе
+                }
+                return;
+            }
+
             // Формируем сообщение в формате realtimeInput
             const audioMessage = {
                 realtimeInput: {
@@ -204,6 +251,11 @@ class DirectOmniAgentApp {
     handleServerMessage(response) {
         // 1. Проверяем готовность сервера
         if (response.server_content && response.server_content.setup_complete) {
+            this.binaryAudio = response.server_content.setup_complete.audio_framing === 'binary';
+            this.audioCodec = response.server_content.setup_complete.audio_codec || 'pcm16';
+            this.adpcmState = { predictor: 0, index: 0 };
+            // Новая сессия на сервере нумерует ходы заново
+            this.transcriptBubbles = {};
             this.setConnectionStatus('connected');
             if (!this.isReconnecting) {
                 this.addMessage("Омни на связи!", "success");
@@ -218,12 +270,49 @@ class DirectOmniAgentApp {
             return;
         }
 
-        // 1.2 Транскрипция ввода пользователя (VAD)
+        // 1.2 Транскрипции пользователя и модели: сервер присылает весь текст хода целиком
         if (response.serverContent && response.serverContent.inputTranscription) {
-            const transcript = response.serverContent.inputTranscription.text;
-            if (transcript) {
-                this.addChatBubble(transcript, 'user');
+            this.updateTranscriptBubble('user', response.serverContent.inputTranscription);
+        }
+        if (response.serverContent && response.serverContent.outputTranscription) {
+            this.updateTranscriptBubble('agent', response.serverContent.outputTranscription);
+        }
+
+        // 1.2.1 Параметры кадров камеры (сервер снижает их, когда очередь к Gemini растет)
+        if (response.serverContent && response.serverContent.videoControl) {
+            this.videoTarget = { ...this.videoTarget, ...response.serverContent.videoControl };
+            return;
+        }
+
+        // 1.2.2 Допуск: сервер занят, ждем своей очереди или пробуем позже
+        if (response.serverContent && response.serverContent.admission) {
+            const admission = response.serverContent.admission;
+            if (admission.state === 'queued') {
+                this.admissionPending = true;
+                if (admission.position !== this.queuePosition) {
+                    this.queuePosition = admission.position;
+                    this.setConnectionStatus('connecting');
+                    this.addMessage(`Сервер занят. Вы в очереди: ${admission.position}`, "system");
+                }
+            } else if (admission.state === 'admitted') {
+                this.admissionPending = false;
+                this.queuePosition = null;
+            } else if (admission.state === 'rejected') {
+                this.retryAfterMs = (admission.retry_after_s || 0) * 1000;
+                this.addMessage(`Сервер перегружен, повторю через ${admission.retry_after_s || 1} с`, "error");
+            }
+            return;
+        }
+
+        // 1.2.3 Сервер переподключается к Gemini, сокет браузера остается открытым
+        if (response.serverContent && response.serverContent.upstreamStatus) {
+            const status = response.serverContent.upstreamStatus;
+            if (status.state === 'reconnecting') {
+                this.addMessage("Связь с моделью прервалась, восстанавливаю...", "system");
+            } else if (status.state === 'resumed') {
+                this.addMessage("Связь восстановлена", "success");
             }
+            return;
         }
 
         // 1.3 Прерывание (Interrupt)
@@ -257,6 +346,25 @@ class DirectOmniAgentApp {
         }
     }
 
+    updateTranscriptBubble(role, update) {
+        // Старый формат без номера хода: каждое сообщение — отдельное облачко
+        if (update.turn === undefined) {
+            if (update.text) this.addChatBubble(update.text, role);
+            return;
+        }
+        const key = `${role}:${update.turn}`;
+        const bubble = this.transcriptBubbles[key];
+        if (!bubble) {
+            if (update.text) this.transcriptBubbles[key] = this.addChatBubble(update.text, role);
+        } else if (bubble.textContent !== update.text) {
+            bubble.textContent = update.text;
+            this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+        }
+        if (update.final) {
+            delete this.transcriptBubbles[key];
+        }
+    }
+
     addChatBubble(text, role) {
         if (!this.chatMessages) return;
 
@@ -275,6 +383,7 @@ class DirectOmniAgentApp {
         wrapper.appendChild(bubble);
         this.chatMessages.appendChild(wrapper);
         this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+        return bubble;
     }
 
     handleDisconnect() {
@@ -282,7 +391,9 @@ class DirectOmniAgentApp {
         if (this.reconnectAttempts < this.maxReconnectAttempts) {
             this.isReconnecting = true;
             this.reconnectAttempts++;
-            const delay = Math.min(1000 * Math.pow(2, this.reconnectAttempts), 10000);
+            // После отказа по перегрузке ждем не меньше, чем просил сервер
+            const delay = Math.max(Math.min(1000 * Math.pow(2, this.reconnectAttempts), 10000), this.retryAfterMs);
+            this.retryAfterMs = 0;
             this.setConnectionStatus('connecting');
             this.addMessage(`Связь прервана. Переподключение (${this.reconnectAttempts}/${this.maxReconnectAttempts})...`, "system");
             setTimeout(() => this.connect(), delay);
@@ -291,6 +402,160 @@ class DirectOmniAgentApp {
         }
     }
 
+    // Бинарный кадр: 8-байтовый заголовок (kind, codec, reserved, rate) + аудио в согласованном кодеке
+    packAudioFrame(pcmData, sampleRate) {
+        let codecId = 0;  // CODEC_PCM16
+        let payload = new Uint8Array(pcmData.buffer, pcmData.byteOffset, pcmData.byteLength);
+        if (this.audioCodec === 'adpcm') {
+            codecId = 3;  // CODEC_ADPCM
+            payload = this.encodeAdpcm(pcmData);
+        } else if (this.audioCodec === 'mulaw') {
+            codecId = 2;  // CODEC_MULAW
+            payload = this.encodeMulaw(pcmData);
+        }
+        const frame = new ArrayBuffer(8 + payload.byteLength);
+        const view = new DataView(frame);
+        view.setUint8(0, 1);  // FRAME_AUDIO
+        view.setUint8(1, codecId);
+        view.setUint16(2, 0, true);
+        view.setUint32(4, sampleRate, true);
+        new Uint8Array(frame, 8).set(payload);
+        return frame;
+    }
+
+    // Кадр камеры: тот же заголовок, rate = длина миниатюры; затем миниатюра и JPEG
+    packVideoFrame(jpeg, thumb) {
+        const frame = new ArrayBuffer(8 + thumb.length + jpeg.byteLength);
+        const view = new DataView(frame);
+        view.setUint8(0, 2);  // FRAME_VIDEO
+        view.setUint8(1, 1);  // CODEC_JPEG
+        view.setUint16(2, 0, true);
+        view.setUint32(4, thumb.length, true);
+        new Uint8Array(frame, 8).set(thumb);
+        new Uint8Array(frame, 8 + thumb.length).set(new Uint8Array(jpeg));
+        return frame;
+    }
+
+    handleBinaryFrame(frame) {
+        if (frame.byteLength < 8) return;
+        const view = new DataView(frame);
+        if (view.getUint8(0) !== 1) return;
+        const codecId = view.getUint8(1);
+        if (codecId === 3) {
+            this.queuePcm(this.decodeAdpcm(new Uint8Array(frame, 8)));
+        } else if (codecId === 2) {
+            this.queuePcm(this.decodeMulaw(new Uint8Array(frame, 8)));
+        } else {
+            this.queuePcm(new Int16Array(frame, 8, (frame.byteLength - 8) >> 1));
+        }
+    }
+
+    // --- Кодеки (те же таблицы, что в backend/audio_codec.py) ---
+
+    static mulawDecodeTable() {
+        if (!DirectOmniAgentApp._mulawDecode) {
+            const decode = new Int16Array(256);
+            for (let code = 0; code < 256; code++) {
+                const u = ~code & 0xFF;
+                const exponent = (u >> 4) & 0x07;
+                const magnitude = ((((u & 0x0F) << 3) + 0x84) << exponent) - 0x84;
+                decode[code] = (u & 0x80) ? -magnitude : magnitude;
+            }
+            DirectOmniAgentApp._mulawDecode = decode;
+        }
+        return DirectOmniAgentApp._mulawDecode;
+    }
+
+    encodeMulaw(pcm) {
+        const out = new Uint8Array(pcm.length);
+        for (let i = 0; i < pcm.length; i++) {
+            const sign = pcm[i] < 0 ? 0x80 : 0;
+            const magnitude = Math.min(Math.abs(pcm[i]), 32635) + 0x84;
+            let exponent = 7;
+            while (exponent > 0 && magnitude < (0x80 << exponent)) exponent--;
+            const mantissa = (magnitude >> (exponent + 3)) & 0x0F;
+            out[i] = ~(sign | (exponent << 4) | mantissa) & 0xFF;
+        }
+        return out;
+    }
+
+    decodeMulaw(bytes) {
+        const table = DirectOmniAgentApp.mulawDecodeTable();
+        const out = new Int16Array(bytes.length);
+        for (let i = 0; i < bytes.length; i++) out[i] = table[bytes[i]];
+        return out;
+    }
+
+    static adpcmTables() {
+        if (!DirectOmniAgentApp._adpcm) {
+            const steps = [
+                7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+                50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+                253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+                1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+                3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+                11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+                32767
+            ];
+            const shift = [-1, -1, -1, -1, 2, 4, 6, 8];
+            const deltas = new Int32Array(89 * 16);
+            const nextIndex = new Uint8Array(89 * 16);
+            for (let index = 0; index < 89; index++) {
+                const step = steps[index];
+                for (let code = 0; code < 16; code++) {
+                    let delta = step >> 3;
+                    if (code & 4) delta += step;
+                    if (code & 2) delta += step >> 1;
+                    if (code & 1) delta += step >> 2;
+                    deltas[index * 16 + code] = (code & 8) ? -delta : delta;
+                    nextIndex[index * 16 + code] = Math.min(88, Math.max(0, index + shift[code & 7]));
+                }
+            }
+            DirectOmniAgentApp._adpcm = { steps, deltas, nextIndex };
+        }
+        return DirectOmniAgentApp._adpcm;
+    }
+
+    // Кадр IMA-ADPCM: predictor (int16), index (uint8), признак дополнения (uint8), затем по 4 бита на отсчет
+    encodeAdpcm(pcm) {
+        const { steps, deltas, nextIndex } = DirectOmniAgentApp.adpcmTables();
+        let { predictor, index } = this.adpcmState;
+        const out = new Uint8Array(4 + ((pcm.length + 1) >> 1));
+        const view = new DataView(out.buffer);
+        view.setInt16(0, predictor, true);
+        view.setUint8(2, index);
+        view.setUint8(3, pcm.length & 1);
+        for (let i = 0; i < pcm.length; i++) {
+            const diff = pcm[i] - predictor;
+            const code = diff < 0
+                ? 8 | Math.min(7, Math.floor((-diff * 4) / steps[index]))
+                : Math.min(7, Math.floor((diff * 4) / steps[index]));
+            const key = index * 16 + code;
+            predictor = Math.max(-32768, Math.min(32767, predictor + deltas[key]));
+            index = nextIndex[key];
+            out[4 + (i >> 1)] |= (i & 1) ? code << 4 : code;
+        }
+        this.adpcmState = { predictor, index };
+        return out;
+    }
+
+    decodeAdpcm(bytes) {
+        const { deltas, nextIndex } = DirectOmniAgentApp.adpcmTables();
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        let predictor = view.getInt16(0, true);
+        let index = view.getUint8(2);
+        const count = (bytes.length - 4) * 2 - view.getUint8(3);
+        const out = new Int16Array(count);
+        for (let i = 0; i < count; i++) {
+            const packed = bytes[4 + (i >> 1)];
+            const key = index * 16 + ((i & 1) ? packed >> 4 : packed & 0x0F);
+            predictor = Math.max(-32768, Math.min(32767, predictor + deltas[key]));
+            index = nextIndex[key];
+            out[i] = predictor;
+        }
+        return out;
+    }
+
     queuePlayback(base64Audio) {
         try {
             const binaryString = atob(base64Audio);
@@ -298,9 +563,15 @@ class DirectOmniAgentApp {
             for (let i = 0; i < binaryString.length; i++) {
                 bytes[i] = binaryString.charCodeAt(i);
             }
+            this.queuePcm(new Int16Array(bytes.buffer));
+        } catch (e) {
+            console.error("Playback decoding error", e);
+        }
+    }
 
-            // Превращаем байты в Int16 PCM, затем в Float32 для Web Audio API
-            const int16Array = new Int16Array(bytes.buffer);
+    queuePcm(int16Array) {
+        try {
+            // Превращаем Int16 PCM в Float32 для Web Audio API
             const float32Array = new Float32Array(int16Array.length);
             for (let i = 0; i < int16Array.length; i++) {
                 float32Array[i] = int16Array[i] / 32768.0;
@@ -368,6 +639,7 @@ class DirectOmniAgentApp {
         }
         if (this.audioContext) this.audioContext.close();
         if (this.pingInterval) clearInterval(this.pingInterval);
+        this.stopVideoCapture();
         if (this.stream) {
             this.stream.getTracks().forEach(track => track.stop());
             this.stream = null;
@@ -387,8 +659,10 @@ class DirectOmniAgentApp {
                 this.visionCamera.classList.remove('hidden', 'opacity-0');
                 this.voiceIcon?.classList.add('hidden');
                 this.energyOrb?.classList.add('border-2', 'border-cyan-400');
+                this.startVideoCapture();
             });
         } else {
+            this.stopVideoCapture();
             const stream = this.visionCamera.srcObject;
             if (stream) stream.getTracks().forEach(t => t.stop());
             this.visionCamera.classList.add('hidden', 'opacity-0');
@@ -397,6 +671,67 @@ class DirectOmniAgentApp {
         }
     }
 
+    startVideoCapture() {
+        this.stopVideoCapture();
+        const tick = () => {
+            this.captureVideoFrame();
+            this.videoTimer = setTimeout(tick, 1000 / this.videoTarget.fps);
+        };
+        tick();
+    }
+
+    stopVideoCapture() {
+        if (this.videoTimer) clearTimeout(this.videoTimer);
+        this.videoTimer = null;
+    }
+
+    captureVideoFrame() {
+        const camera = this.visionCamera;
+        if (!this.isConnected || !this.ws || this.ws.readyState !== WebSocket.OPEN) return;
+        if (!camera || !camera.videoWidth) return;
+        // Сокет еще не отправил прошлые данные: новый кадр только увеличил бы задержку
+        if (this.ws.bufferedAmount > 256 * 1024) return;
+
+        const width = Math.min(camera.videoWidth, this.videoTarget.maxWidth);
+        const height = Math.round(camera.videoHeight * width / camera.videoWidth);
+        if (!this.videoCanvas) {
+            this.videoCanvas = document.createElement('canvas');
+            this.thumbCanvas = document.createElement('canvas');
+            this.thumbCanvas.width = 16;
+            this.thumbCanvas.height = 12;
+        }
+        this.videoCanvas.width = width;
+        this.videoCanvas.height = height;
+        this.videoCanvas.getContext('2d').drawImage(camera, 0, 0, width, height);
+
+        // Миниатюра 16x12 в оттенках серого: по ней сервер отбрасывает почти одинаковые кадры
+        const thumbContext = this.thumbCanvas.getContext('2d', { willReadFrequently: true });
+        thumbContext.drawImage(this.videoCanvas, 0, 0, 16, 12);
+        const rgba = thumbContext.getImageData(0, 0, 16, 12).data;
+        const thumb = new Uint8Array(16 * 12);
+        for (let i = 0; i < thumb.length; i++) {
+            thumb[i] = (rgba[i * 4] * 299 + rgba[i * 4 + 1] * 587 + rgba[i * 4 + 2] * 114) / 1000;
+        }
+
+        this.videoCanvas.toBlob(async blob => {
+            if (!blob || !this.ws || this.ws.readyState !== WebSocket.OPEN) return;
+            const jpeg = await blob.arrayBuffer();
+            if (this.binaryAudio) {
+                this.ws.send(this.packVideoFrame(jpeg, thumb));
+            } else {
+                this.ws.send(JSON.stringify({
+                    realtimeInput: {
+                        mediaChunks: [{
+                            mimeType: 'image/jpeg',
+                            data: this.arrayBufferToBase64(jpeg),
+                            thumb: this.arrayBufferToBase64(thumb.buffer)
+                        }]
+                    }
+                }));
+            }
+        }, 'image/jpeg', this.videoTarget.quality / 100);
+    }
+
     animateEnergyOrb() {
         if (!this.analyser) return;
         const dataArray = new Uint8Array(this.analyser.frequencyBinCount);